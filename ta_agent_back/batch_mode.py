@@ -0,0 +1,188 @@
+"""
+离线批处理（Batch API）评阅模式。
+
+适用于期末集中评阅等不需要即时返回的场景：把所有待评阅任务编译成一个 JSONL 请求文件，
+通过 OpenAI 兼容的 Batch 接口（DashScope 同样支持）提交，轮询状态，完成后下载结果，
+仍然使用 MainLoader.generate_feedback_markdown / _extract_score_from_feedback 生成反馈文件。
+
+批次 ID 会保存在输出目录的 .batch_state.json 中，进程中断后再次运行会继续轮询同一个批次，而不会重复提交。
+"""
+import json
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from openai.types.chat import ChatCompletion
+
+from run_manifest import atomic_write_text
+
+if TYPE_CHECKING:
+    from tools import GradingJob, MainLoader
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchGrader:
+    """
+    使用 Batch API 评阅 MainLoader 中的所有待处理任务。
+
+    :param loader: 已配置好题目和客户端的 MainLoader
+    :param poll_interval: 轮询批次状态的间隔（秒）
+    :param completion_window: 批次的完成时限，DashScope 支持 24h~336h
+    """
+
+    def __init__(self, loader: "MainLoader", poll_interval: float = 30.0, completion_window: str = "24h"):
+        self.loader = loader
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.state_path = Path(loader.output_path) / ".batch_state.json"
+
+    # --- 编译 ---
+
+    def compile_requests(self, jobs: List["GradingJob"]) -> Tuple[List[Dict], Dict[str, List["GradingJob"]], Dict[str, str]]:
+        """
+        将任务编译为 Batch JSONL 请求行。
+
+        命中响应缓存的任务直接写出结果；开启 dedup 时，规范化代码相同的任务只生成一行请求。
+
+        :return: (请求行列表, custom_id -> 共享该请求的任务列表, custom_id -> 缓存键)
+        """
+        loader = self.loader
+        lines = []
+        groups: Dict[str, List["GradingJob"]] = {}
+        cache_keys: Dict[str, str] = {}
+        leaders: Dict[str, str] = {}
+        cached_count = 0
+        for job in jobs:
+            if loader.dedup and job.dedup_key in leaders:
+                groups[leaders[job.dedup_key]].append(job)
+                continue
+            request = loader._build_request(job.prompt.problem, job.assignment.data)
+            cache_key, cached = loader._lookup_cache(request)
+            if cached is not None:
+                loader._finish_job(job, *cached)
+                cached_count += 1
+                continue
+            custom_id = job.job_id
+            request.pop("stream", None)
+            lines.append({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": request})
+            groups[custom_id] = [job]
+            if cache_key is not None:
+                cache_keys[custom_id] = cache_key
+            if loader.dedup:
+                leaders[job.dedup_key] = custom_id
+        print(f"批处理: {len(lines)} 个请求，{cached_count} 个任务命中缓存，"
+              f"{sum(len(g) for g in groups.values()) - len(lines)} 个重复任务复用结果")
+        if lines and loader.token_budget is not None:
+            loader.print_estimate(loader.token_budget.summarize(line["body"] for line in lines))
+        return lines, groups, cache_keys
+
+    # --- 提交与轮询 ---
+
+    def submit(self, lines: List[Dict]) -> str:
+        """上传 JSONL 文件并创建批次，返回批次 ID。"""
+        client = self.loader.client
+        payload = "\n".join(json.dumps(line, ensure_ascii=False) for line in lines).encode("utf-8")
+        input_file = client.files.create(file=("grading_batch.jsonl", payload), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window
+        )
+        atomic_write_text(self.state_path, json.dumps({"batch_id": batch.id, "input_file_id": input_file.id}))
+        print(f"已提交批次 {batch.id}（{len(lines)} 个请求）")
+        return batch.id
+
+    def wait(self, batch_id: str):
+        """轮询直到批次进入终止状态，返回最终的 Batch 对象。"""
+        client = self.loader.client
+        last_status = None
+        while True:
+            batch = client.batches.retrieve(batch_id)
+            counts = getattr(batch, "request_counts", None)
+            status = (batch.status, getattr(counts, "completed", None), getattr(counts, "failed", None))
+            if status != last_status:
+                progress = f"（完成 {counts.completed}/{counts.total}，失败 {counts.failed}）" if counts else ""
+                print(f"批次 {batch_id} 状态: {batch.status}{progress}")
+                last_status = status
+            if batch.status in TERMINAL_STATES:
+                return batch
+            time.sleep(self.poll_interval)
+
+    # --- 结果导入 ---
+
+    def _read_file_lines(self, file_id: Optional[str]) -> List[Dict]:
+        if not file_id:
+            return []
+        content = self.loader.client.files.content(file_id).text
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    def ingest(self, batch, groups: Dict[str, List["GradingJob"]], cache_keys: Dict[str, str]) -> Dict[str, int]:
+        """
+        下载批次结果，写出反馈文件并更新清单。没有结果的任务标记为失败，下次运行时重试。
+
+        :return: {"done": 成功任务数, "failed": 失败任务数}
+        """
+        loader = self.loader
+        done = failed = 0
+        seen = set()
+        for line in self._read_file_lines(getattr(batch, "output_file_id", None)):
+            custom_id = line.get("custom_id")
+            jobs = groups.get(custom_id)
+            if not jobs:
+                continue
+            seen.add(custom_id)
+            response = line.get("response") or {}
+            if response.get("status_code") != 200:
+                error = json.dumps(line.get("error") or response.get("body"), ensure_ascii=False)
+                for job in jobs:
+                    loader.manifest.mark_failed(job.job_id, f"批处理请求失败: {error}")
+                failed += len(jobs)
+                continue
+            completion = ChatCompletion.model_validate(response["body"])
+            feedback, score = loader._parse_completion(completion, cache_keys.get(custom_id))
+            metrics: Dict = {}
+            loader._record_usage(metrics, completion.usage)
+            for job in jobs:
+                if loader._finish_job(job, feedback, score, metrics or None):
+                    done += 1
+                else:
+                    failed += 1
+
+        errors = {line.get("custom_id"): line for line in self._read_file_lines(getattr(batch, "error_file_id", None))}
+        for custom_id, jobs in groups.items():
+            if custom_id in seen:
+                continue
+            error = errors.get(custom_id, {}).get("error") or f"批次状态 {batch.status}，未返回结果"
+            for job in jobs:
+                loader.manifest.mark_failed(job.job_id, f"批处理请求失败: {json.dumps(error, ensure_ascii=False)}")
+            failed += len(jobs)
+        return {"done": done, "failed": failed}
+
+    # --- 入口 ---
+
+    def run(self, limit: int = None):
+        """编译并提交（或继续上一次未完成的批次），等待完成后导入结果。"""
+        jobs = self.loader.collect_pending_jobs(limit)
+        lines, groups, cache_keys = self.compile_requests(jobs)
+
+        batch_id = None
+        if self.state_path.exists():
+            batch_id = json.loads(self.state_path.read_text(encoding="utf-8")).get("batch_id")
+            print(f"继续上一次未完成的批次 {batch_id}")
+        elif not lines:
+            print("没有需要提交的请求。")
+            return
+        else:
+            batch_id = self.submit(lines)
+
+        for group in groups.values():
+            for job in group:
+                self.loader.manifest.mark_in_flight(job.job_id)
+
+        batch = self.wait(batch_id)
+        result = self.ingest(batch, groups, cache_keys)
+        self.state_path.unlink(missing_ok=True)
+        self.loader.report_stages()
+        print(f"\n批处理完成: 成功 {result['done']}，失败 {result['failed']}。反馈文件已保存到 {self.loader.output_path}")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+批处理模式（tools.py --batch）的端到端检查，不调用真实 API。
+
+生成一个小规模的合成 gradebook，启动带 Batch API 的本地模拟模型服务，
+用 BatchGrader 完成 上传 -> 创建批次 -> 轮询 -> 导入结果 的完整流程，然后检查：
+- 每个任务都写出了反馈文件，清单中全部为已完成；
+- 模拟服务出错（--error-rate）时失败的任务在下一轮批次中重试，直到全部完成；
+- 全部完成后再运行一次不会提交新的批次。
+任何一项不满足时以非零状态退出。
+
+用法:
+    cd ta_agent_back
+    python bench/check_batch.py
+    python bench/check_batch.py --students 50 --error-rate 0.2
+"""
+import argparse
+import contextlib
+import io
+import sys
+import tempfile
+from pathlib import Path
+from typing import List
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(BENCH_DIR))
+
+from gen_gradebook import GradebookSpec, write_gradebook  # noqa: E402
+from mock_llm import MockConfig, fetch_stats, spawn  # noqa: E402
+from batch_mode import BatchGrader  # noqa: E402
+from tools import MainLoader  # noqa: E402
+
+
+def run_batch(gradebook: Path, output: Path, base_url: str) -> str:
+    """按 tools.py --batch 的方式运行一轮批处理，返回输出的日志。"""
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        loader = MainLoader(files_path=gradebook, output_path=output, prompt_path=ROOT / "prompt.md",
+                            problems_path=ROOT / "problems", base_url=base_url, api_key="mock", use_cache=False)
+        BatchGrader(loader, poll_interval=0.2).run()
+    return log.getvalue()
+
+
+def check(students: int, error_rate: float, max_rounds: int, data_dir: Path) -> List[str]:
+    """
+    :return: 不满足的检查项说明，全部通过时为空列表
+    """
+    problems = []
+    gradebook = write_gradebook(data_dir, GradebookSpec(students=students))
+    with tempfile.TemporaryDirectory(prefix="ta_batch_") as tmp, \
+            spawn(MockConfig(latency=0.2, error_rate=error_rate, seed=0)) as base_url:
+        output = Path(tmp) / "feedback_output"
+        for round_no in range(1, max_rounds + 1):
+            log = run_batch(gradebook, output, base_url)
+            summary = [line for line in log.splitlines() if line.startswith("批处理完成")]
+            print(f"第 {round_no} 轮: {summary[-1] if summary else log.strip().splitlines()[-1]}")
+            with contextlib.redirect_stdout(io.StringIO()):
+                loader = MainLoader(files_path=gradebook, output_path=output, prompt_path=ROOT / "prompt.md",
+                                    problems_path=ROOT / "problems", use_cache=False)
+                jobs = loader.collect_pending_jobs()
+            counts = loader.manifest.counts()
+            if not counts.get("failed") and not counts.get("pending") and not counts.get("in-flight"):
+                break
+        done = counts.get("done", 0)
+        feedback_files = list(output.rglob("*_feedback.md"))
+        print(f"清单: {counts}，反馈文件 {len(feedback_files)} 个，模拟服务收到 {fetch_stats(base_url)['requests']} 个请求")
+
+        if not done:
+            problems.append("没有任务完成")
+        if jobs:
+            problems.append(f"{max_rounds} 轮之后仍有 {len(jobs)} 个任务未完成")
+        if len(feedback_files) < done:
+            problems.append(f"已完成 {done} 个任务，但只有 {len(feedback_files)} 个反馈文件")
+        if (output / ".batch_state.json").exists():
+            problems.append("批次完成后没有删除 .batch_state.json")
+
+        requests_before = fetch_stats(base_url)["requests"]
+        log = run_batch(gradebook, output, base_url)
+        if "没有需要提交的请求" not in log or fetch_stats(base_url)["requests"] != requests_before:
+            problems.append("全部完成后再次运行仍然提交了请求")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批处理模式的端到端检查")
+    parser.add_argument("--students", type=int, default=20, help="合成 gradebook 的学生数")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="模拟服务中每个请求出错的概率")
+    parser.add_argument("--max-rounds", type=int, default=5, help="重试失败任务的最大批次轮数")
+    parser.add_argument("--data-dir", type=Path, default=Path(tempfile.gettempdir()) / "ta_agent_bench",
+                        help="合成 gradebook 的存放目录（按规模和种子复用）")
+    args = parser.parse_args()
+
+    found = check(args.students, args.error_rate, args.max_rounds, args.data_dir)
+    for problem in found:
+        print(f"失败: {problem}")
+    if found:
+        sys.exit(1)
+    print("批处理端到端检查通过。")
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+生成合成的 Blackboard gradebook，用于基准测试。
+
+每个学生一个或多个 attempt，每个 attempt 一份 TXT 记录（"Name: 中文名(Pinyin) 专业 (学号)"、
+多文件 Files: 块）和对应的 .c 文件。源文件混合使用 UTF-8、带 BOM 的 UTF-8 和 GBK 编码，
+代码在几种写法（正确、差一错误、编译错误、空文件）之间随机选择，并加入学生各自的变量名和注释，
+避免全部被重复提交合并。
+
+用法:
+    python bench/gen_gradebook.py /tmp/bench 1000 [--zip] [--seed 0]
+"""
+import argparse
+import random
+import sys
+import zipfile
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# 姓氏/名字用字 -> 拼音
+SURNAMES = {"张": "Zhang", "王": "Wang", "李": "Li", "赵": "Zhao", "刘": "Liu", "陈": "Chen",
+            "杨": "Yang", "黄": "Huang", "周": "Zhou", "吴": "Wu", "徐": "Xu", "孙": "Sun",
+            "欧阳": "Ouyang", "司马": "Sima"}
+GIVEN = {"伟": "Wei", "芳": "Fang", "娜": "Na", "敏": "Min", "静": "Jing", "强": "Qiang", "磊": "Lei",
+         "洋": "Yang", "艳": "Yan", "勇": "Yong", "军": "Jun", "杰": "Jie", "涛": "Tao", "明": "Ming",
+         "超": "Chao", "霞": "Xia", "平": "Ping", "刚": "Gang", "桂英": "Guiying", "子涵": "Zihan"}
+MAJORS = ["计算机科学与技术", "软件工程", "电子信息工程", "自动化", "数学与应用数学", "通信工程"]
+# (编码, 比例)：大多数学生用 UTF-8，部分 Windows 用户的编辑器保存为 GBK 或带 BOM 的 UTF-8
+ENCODINGS = [("utf-8", 0.7), ("gbk", 0.2), ("utf-8-sig", 0.1)]
+
+TEMPLATES = {
+    "p1": [
+        # 正确
+        """#include <stdio.h>
+#define N 5
+// {comment}
+int main(void) {{
+    int {arr}[N], i, {mn}, {mx};
+    double avg = 0;
+    printf("请输入 %d 个整数: ", N);
+    for (i = 0; i < N; i++) {{
+        scanf("%d", &{arr}[i]);
+    }}
+    {mn} = {mx} = {arr}[0];
+    for (i = 0; i < N; i++) {{
+        if ({arr}[i] < {mn}) {mn} = {arr}[i];
+        if ({arr}[i] > {mx}) {mx} = {arr}[i];
+        avg += {arr}[i];
+    }}
+    printf("%d %d %f\\n", {mn}, {mx}, avg / N);
+    return 0;
+}}
+""",
+        # 差一错误 + 整数除法
+        """#include <stdio.h>
+#define N 5
+/* {comment} */
+int main() {{
+    int {arr}[N];
+    int i, {mn} = 0, {mx} = 0, sum = 0;
+    for (i = 0; i <= N; i++)
+        scanf("%d", &{arr}[i]);
+    for (i = 1; i < N; i++) {{
+        if ({arr}[i] < {mn}) {mn} = {arr}[i];
+        if ({arr}[i] > {mx}) {mx} = {arr}[i];
+        sum += {arr}[i];
+    }}
+    printf("min=%d max=%d avg=%d\\n", {mn}, {mx}, sum / N);
+}}
+""",
+        # 编译错误
+        """#include <stdio.h>
+// {comment}
+int main() {{
+    int {arr}[5]
+    for (int i = 0; i < 5; i++) scanf("%d", {arr}[i]);
+    printf("%d\\n", {mn});
+    return 0;
+}}
+""",
+    ],
+    "p2": [
+        """#include <stdio.h>
+#include <stdbool.h>
+#define N 10
+// {comment}
+int main(void) {{
+    int {arr}[N], i, j, temp;
+    bool sorted = false;
+    for (i = 0; i < N; i++) scanf("%d", &{arr}[i]);
+    i = N;
+    while (i > 1 && !sorted) {{
+        sorted = true;
+        for (j = 1; j < i; j++) {{
+            if ({arr}[j - 1] > {arr}[j]) {{
+                temp = {arr}[j - 1]; {arr}[j - 1] = {arr}[j]; {arr}[j] = temp;
+                sorted = false;
+            }}
+        }}
+        i--;
+    }}
+    for (i = 0; i < N; i++) printf("%d ", {arr}[i]);
+    printf("\\n");
+    return 0;
+}}
+""",
+        """#include <stdio.h>
+// {comment}
+void sort(int {arr}[], int n) {{
+    for (int i = 0; i < n; i++)
+        for (int j = 0; j < n - 1; j++)
+            if ({arr}[j] < {arr}[j + 1]) {{ int t = {arr}[j]; {arr}[j] = {arr}[j + 1]; {arr}[j + 1] = t; }}
+}}
+int main() {{
+    int {arr}[10];
+    for (int i = 0; i < 10; i++) scanf("%d", &{arr}[i]);
+    sort({arr}, 10);
+    for (int i = 0; i < 10; i++) printf("%d ", {arr}[i]);
+    return 0;
+}}
+""",
+    ],
+}
+COMMENTS = ["作者：{name}，学号 {sid}", "冒泡排序 / 最大最小值练习", "TODO: 检查输入是否合法",
+            "第 {attempt} 次提交，修改了输出格式", "参考课本第 164 页的例子"]
+IDENTIFIERS = {"arr": ["a", "arr", "nums", "data", "shuzu", "x"], "mn": ["mn", "min", "minimum", "small"],
+               "mx": ["mx", "max", "maximum", "big"]}
+
+
+@dataclass
+class GradebookSpec:
+    """
+    合成 gradebook 的参数。
+
+    :param students: 学生数
+    :param assignment: Blackboard 作业名
+    :param files: 每次提交包含的文件（原始文件名, 模板组）
+    :param max_attempts: 每个学生最多的提交次数（1 ~ max_attempts 随机）
+    :param missing_rate: 某个文件缺失（学生漏交）的概率
+    :param empty_rate: 某个文件为空的概率
+    :param seed: 随机种子，相同参数生成完全相同的 gradebook
+    """
+    students: int = 100
+    assignment: str = "PA3"
+    files: List[Tuple[str, str]] = field(default_factory=lambda: [("pa3p1.c", "p1"), ("pa3p2.c", "p2")])
+    max_attempts: int = 3
+    missing_rate: float = 0.03
+    empty_rate: float = 0.02
+    seed: int = 0
+
+
+def _pick_encoding(rng: random.Random) -> str:
+    roll, acc = rng.random(), 0.0
+    for encoding, share in ENCODINGS:
+        acc += share
+        if roll < acc:
+            return encoding
+    return ENCODINGS[0][0]
+
+
+def _student_name(rng: random.Random) -> Tuple[str, str]:
+    surname = rng.choice(list(SURNAMES))
+    given = rng.sample(list(GIVEN), rng.choice((1, 2)))
+    return surname + "".join(given), f"{''.join(GIVEN[g] for g in given)} {SURNAMES[surname]}"
+
+
+def _source(rng: random.Random, group: str, name: str, sid: str, attempt: int) -> str:
+    template = rng.choice(TEMPLATES[group])
+    names = {key: rng.choice(values) for key, values in IDENTIFIERS.items()}
+    comment = rng.choice(COMMENTS).format(name=name, sid=sid, attempt=attempt)
+    return template.format(comment=comment, **names)
+
+
+def generate_files(spec: GradebookSpec) -> Dict[str, bytes]:
+    """
+    生成 gradebook 中的所有文件。
+
+    :return: 文件名 -> 内容（字节），顺序与 Blackboard 导出一致
+    """
+    rng = random.Random(spec.seed)
+    files: Dict[str, bytes] = {}
+    deadline = datetime(2025, 10, 28, 23, 59, 0)
+    for index in range(spec.students):
+        sid = f"{12200000 + index}"
+        name, pinyin = _student_name(rng)
+        major = rng.choice(MAJORS)
+        attempts = rng.randint(1, spec.max_attempts)
+        submitted = deadline - timedelta(days=rng.randint(1, 10), seconds=rng.randint(0, 86400))
+        for attempt in range(1, attempts + 1):
+            submitted += timedelta(minutes=rng.randint(5, 600))
+            base = f"{spec.assignment}_{sid}_attempt_{submitted:%Y-%m-%d-%H-%M-%S}"
+            blocks = []
+            for original, group in spec.files:
+                if rng.random() < spec.missing_rate:
+                    continue
+                filename = f"{base}_{original}"
+                blocks.append(f"\tOriginal filename: {original}\n\tFilename: {filename}\n")
+                code = "" if rng.random() < spec.empty_rate else _source(rng, group, name, sid, attempt)
+                files[filename] = code.encode(_pick_encoding(rng))
+            txt = (f"Name: {name}({pinyin}) {major} ({sid})\n"
+                   f"Assignment: {spec.assignment}\n"
+                   f"Date Submitted: {submitted:%A, %B %d, %Y %I:%M:%S %p} CST\n"
+                   f"Current Grade: Needs Grading\n\n"
+                   f"Submission Field:\nThere is no student submission text data for this assignment.\n\n"
+                   f"Comments:\nThere are no student comments for this assignment.\n\n"
+                   f"Files:\n" + "\n".join(blocks) + "\n")
+            files[f"{base}.txt"] = txt.encode("utf-8")
+    return files
+
+
+def write_gradebook(dest: Path, spec: GradebookSpec, as_zip: bool = False) -> Path:
+    """
+    写出 gradebook 目录（或 ZIP），已存在时直接返回。
+
+    :return: gradebook_CS111_... 目录或 ZIP 的路径
+    """
+    dest = Path(dest)
+    name = f"gradebook_CS111_{spec.assignment}_{spec.students}_{spec.seed}"
+    path = dest / (name + ".zip" if as_zip else name)
+    if path.exists():
+        return path
+    dest.mkdir(parents=True, exist_ok=True)
+    tmp_path = dest / f".{path.name}.tmp"
+    files = generate_files(spec)
+    if as_zip:
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for filename, content in files.items():
+                archive.writestr(filename, content)
+    else:
+        tmp_path.mkdir()
+        for filename, content in files.items():
+            (tmp_path / filename).write_bytes(content)
+    tmp_path.rename(path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成合成的 Blackboard gradebook")
+    parser.add_argument("dest", type=Path, help="输出目录")
+    parser.add_argument("students", type=int, help="学生数")
+    parser.add_argument("--zip", action="store_true", help="生成 ZIP 而不是目录")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    args = parser.parse_args()
+    path = write_gradebook(args.dest, GradebookSpec(students=args.students, seed=args.seed,
+                                                    max_attempts=args.max_attempts), as_zip=args.zip)
+    print(f"已生成 {path}", file=sys.stderr)
+    print(path)
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容的模拟模型服务，用于基准测试（不调用真实 API，不产生费用）。
+
+支持 /v1/chat/completions（普通与流式）：
+- 延迟服从对数正态分布（中位数 latency，形状参数 latency_sigma），流式时首 token 之后按 tokens_per_sec 输出；
+- 按 error_rate 返回 429（带 Retry-After）或 503；设置 max_concurrency 时，超出并发配额的请求返回 429，模拟单个 Key 的配额；
+- 输出长度约为 output_tokens 个 token，末尾带 "建议分数：XX/100"；
+- 打包请求（response_format 为 JSON）返回 {"results": [...]}；分级评阅的小模型请求附带置信度和复核标记；
+- usage 中报告 prompt_tokens，以及与之前请求相同前缀的 cached_tokens。
+GET /stats 返回请求数、错误数和最大并发数。
+
+另外提供 Batch API 的最小实现，用于在本地端到端验证批处理模式（tools.py --batch）：
+- POST /v1/files 上传 JSONL，GET /v1/files/{id}/content 下载文件内容；
+- POST /v1/batches 创建批次，后台线程在一次 latency 延迟后逐行生成评阅（同样按 error_rate 出错，出错的行写入错误文件）；
+- GET /v1/batches/{id} 查询批次状态、请求计数和结果文件 ID。
+
+基准测试通过 spawn() 在独立进程中启动服务，避免与被测的评阅流程争抢 GIL。
+
+用法:
+    python bench/mock_llm.py --port 18000 --latency 0.5 --error-rate 0.02
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+_PACK_ID_RE = re.compile(r"^### 提交 (S\d+)$", re.MULTILINE)
+
+
+@dataclass
+class MockConfig:
+    """
+    :param latency: 非流式响应（或流式首 token）延迟的中位数（秒）
+    :param latency_sigma: 对数正态分布的形状参数，越大长尾越明显
+    :param error_rate: 返回错误的概率，一半为 429，一半为 503
+    :param output_tokens: 每份评阅输出的平均 token 数
+    :param tokens_per_sec: 流式输出速度
+    :param seed: 随机种子
+    :param max_concurrency: 同时处理的请求数上限（模拟单个 Key 的配额），为 None 时不限制
+    """
+    latency: float = 0.2
+    latency_sigma: float = 0.5
+    error_rate: float = 0.0
+    output_tokens: int = 300
+    tokens_per_sec: float = 200.0
+    seed: Optional[int] = None
+    max_concurrency: Optional[int] = None
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认的 listen backlog 只有 5，高并发建立连接时会被重置
+    request_queue_size = 1024
+
+    def __init__(self, address: Tuple[str, int], config: MockConfig):
+        super().__init__(address, _Handler)
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.prefixes = set()
+        self.stats = {"requests": 0, "errors": 0, "rejected": 0, "in_flight": 0, "max_in_flight": 0,
+                      "completion_tokens": 0}
+        # Batch API 的文件和批次，按 ID 保存在内存中
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.ids = itertools.count(1)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def random_latency(self) -> float:
+        with self.lock:
+            return self.config.latency * math.exp(self.rng.gauss(0, self.config.latency_sigma))
+
+    def roll(self) -> float:
+        with self.lock:
+            return self.rng.random()
+
+    def usage(self, messages: List[Dict[str, Any]], completion_tokens: int) -> Dict[str, Any]:
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 2
+        prefix = hashlib.sha256(json.dumps(messages[:-1], ensure_ascii=False).encode("utf-8")).hexdigest()
+        with self.lock:
+            cached = prefix in self.prefixes
+            self.prefixes.add(prefix)
+            self.stats["completion_tokens"] += completion_tokens
+        prefix_tokens = sum(len(str(m.get("content", ""))) for m in messages[:-1]) // 2
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": prefix_tokens if cached else 0}}
+
+    def add_file(self, filename: str, purpose: str, content: bytes) -> Dict[str, Any]:
+        with self.lock:
+            file_id = f"file-mock{next(self.ids)}"
+            self.files[file_id] = {"id": file_id, "object": "file", "bytes": len(content),
+                                   "created_at": int(time.time()), "filename": filename, "purpose": purpose,
+                                   "status": "processed", "content": content}
+        return self.files[file_id]
+
+
+def _feedback(server: MockLLMServer, triage: bool) -> str:
+    """生成一份长度约为 output_tokens 的评阅意见（中文约 1 字 1 token）。"""
+    score = int(server.roll() * 60) + 40
+    body = "代码结构清晰，变量命名合理。建议补充输入检查并统一输出格式。"
+    repeat = max(1, server.config.output_tokens // len(body))
+    text = "## 总体评价\n" + "\n".join([body] * repeat) + f"\n\n建议分数：{score}/100"
+    if triage:
+        confidence = round(0.5 + server.roll() * 0.5, 2)
+        text += f"\n评阅置信度：{confidence}\n需要复核：{'是' if server.roll() < 0.05 else '否'}"
+    return text
+
+
+def _error_response(server: MockLLMServer) -> Optional[Tuple[int, Dict[str, Any], Dict[str, str]]]:
+    """按 error_rate 随机返回一个错误响应（状态码、响应体、响应头），不出错时返回 None。"""
+    if server.roll() >= server.config.error_rate:
+        return None
+    with server.lock:
+        server.stats["errors"] += 1
+    if server.roll() < 0.5:
+        return 429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"Retry-After": "0.1"}
+    return 503, {"error": {"message": "service unavailable", "type": "server_error"}}, {}
+
+
+def _completion_content(server: MockLLMServer, request: Dict[str, Any]) -> str:
+    messages = request.get("messages", [])
+    last = str(messages[-1].get("content", "")) if messages else ""
+    response_format = (request.get("response_format") or {}).get("type")
+    if response_format in ("json_object", "json_schema"):
+        ids = _PACK_ID_RE.findall(last) or ["S1"]
+        results = []
+        for pack_id in ids:
+            feedback = _feedback(server, triage=False)
+            score = int(feedback.rsplit("建议分数：", 1)[1].split("/", 1)[0])
+            results.append({"id": pack_id, "feedback": feedback, "score": score})
+        return json.dumps({"results": results}, ensure_ascii=False)
+    return _feedback(server, triage="评阅置信度" in last)
+
+
+def _completion_body(model: str, content: str, usage: Dict[str, Any]) -> Dict[str, Any]:
+    return {"id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": usage}
+
+
+def _run_batch(server: MockLLMServer, batch_id: str):
+    """后台处理一个批次：逐行生成评阅，写出结果文件和错误文件。"""
+    batch = server.batches[batch_id]
+    content = server.files[batch["input_file_id"]]["content"].decode("utf-8")
+    lines = [json.loads(line) for line in content.splitlines() if line.strip()]
+    with server.lock:
+        batch.update(status="in_progress", in_progress_at=int(time.time()),
+                     request_counts={"total": len(lines), "completed": 0, "failed": 0})
+    time.sleep(server.random_latency())
+    outputs, errors = [], []
+    for index, line in enumerate(lines):
+        with server.lock:
+            server.stats["requests"] += 1
+        record = {"id": f"batch_req_{index}", "custom_id": line.get("custom_id")}
+        if line.get("url") != batch["endpoint"]:
+            errors.append({**record, "response": None,
+                           "error": {"code": "invalid_url", "message": f"url 应为 {batch['endpoint']}"}})
+            continue
+        error = _error_response(server)
+        if error is not None:
+            status, body, _ = error
+            errors.append({**record, "response": {"status_code": status, "body": body}, "error": body["error"]})
+            continue
+        request = line.get("body") or {}
+        text = _completion_content(server, request)
+        usage = server.usage(request.get("messages", []), len(text))
+        body = _completion_body(request.get("model", "mock"), text, usage)
+        outputs.append({**record, "response": {"status_code": 200, "body": body}, "error": None})
+
+    def dump(records: List[Dict[str, Any]]) -> Optional[str]:
+        if not records:
+            return None
+        payload = "\n".join(json.dumps(r, ensure_ascii=False) for r in records).encode("utf-8")
+        return server.add_file(f"{batch_id}_output.jsonl", "batch_output", payload)["id"]
+
+    output_file_id, error_file_id = dump(outputs), dump(errors)
+    with server.lock:
+        batch.update(status="completed", completed_at=int(time.time()), output_file_id=output_file_id,
+                     error_file_id=error_file_id,
+                     request_counts={"total": len(lines), "completed": len(outputs), "failed": len(errors)})
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockLLMServer
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self._send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def do_GET(self):
+        server = self.server
+        parts = self.path.strip("/").split("/")
+        if self.path == "/stats":
+            with server.lock:
+                stats = dict(server.stats)
+            self._send_json(200, stats)
+        elif parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in server.batches:
+            with server.lock:
+                batch = dict(server.batches[parts[2]])
+            self._send_json(200, batch)
+        elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in server.files:
+            content = server.files[parts[2]]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/jsonl")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if self.path == "/v1/files":
+            self._create_file(body)
+        elif self.path == "/v1/batches":
+            self._create_batch(json.loads(body or b"{}"))
+        elif self.path == "/v1/chat/completions":
+            self._chat(json.loads(body or b"{}"))
+        else:
+            self._not_found()
+
+    def _create_file(self, body: bytes):
+        """解析 multipart/form-data 上传（字段 file 和 purpose）。"""
+        header = f"Content-Type: {self.headers.get('Content-Type', '')}\r\n\r\n".encode("utf-8")
+        form = BytesParser(policy=HTTP).parsebytes(header + body)
+        fields = {part.get_param("name", header="content-disposition"): part for part in form.iter_parts()}
+        if "file" not in fields:
+            self._send_json(400, {"error": {"message": "missing file", "type": "invalid_request_error"}})
+            return
+        purpose = fields["purpose"].get_content().strip() if "purpose" in fields else "batch"
+        uploaded = fields["file"]
+        entry = self.server.add_file(uploaded.get_filename() or "upload.jsonl", purpose,
+                                     uploaded.get_payload(decode=True))
+        self._send_json(200, {k: v for k, v in entry.items() if k != "content"})
+
+    def _create_batch(self, request: Dict[str, Any]):
+        server = self.server
+        if request.get("input_file_id") not in server.files:
+            self._send_json(404, {"error": {"message": "input file not found", "type": "invalid_request_error"}})
+            return
+        with server.lock:
+            batch_id = f"batch_mock{next(server.ids)}"
+            batch = {"id": batch_id, "object": "batch", "endpoint": request.get("endpoint"),
+                     "input_file_id": request["input_file_id"],
+                     "completion_window": request.get("completion_window", "24h"),
+                     "status": "validating", "created_at": int(time.time()),
+                     "output_file_id": None, "error_file_id": None,
+                     "request_counts": {"total": 0, "completed": 0, "failed": 0}}
+            server.batches[batch_id] = batch
+            snapshot = dict(batch)
+        threading.Thread(target=_run_batch, args=(server, batch_id), daemon=True).start()
+        self._send_json(200, snapshot)
+
+    def _chat(self, request: Dict[str, Any]):
+        server = self.server
+        limit = server.config.max_concurrency
+        with server.lock:
+            server.stats["requests"] += 1
+            rejected = limit is not None and server.stats["in_flight"] >= limit
+            if rejected:
+                server.stats["rejected"] += 1
+            else:
+                server.stats["in_flight"] += 1
+                server.stats["max_in_flight"] = max(server.stats["max_in_flight"], server.stats["in_flight"])
+        if rejected:
+            self._send_json(429, {"error": {"message": "too many concurrent requests", "type": "rate_limit"}},
+                            {"Retry-After": "0.2"})
+            return
+        try:
+            self._complete(request)
+        finally:
+            with server.lock:
+                server.stats["in_flight"] -= 1
+
+    def _complete(self, request: Dict[str, Any]):
+        server = self.server
+        error = _error_response(server)
+        if error is not None:
+            time.sleep(server.config.latency / 10)
+            self._send_json(*error)
+            return
+
+        content = _completion_content(server, request)
+        usage = server.usage(request.get("messages", []), len(content))
+        model = request.get("model", "mock")
+
+        if not request.get("stream"):
+            time.sleep(server.random_latency())
+            self._send_json(200, _completion_body(model, content, usage))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        time.sleep(server.random_latency())
+        step = 16
+        delay = step / server.config.tokens_per_sec
+        for start in range(0, len(content), step):
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0, "model": model,
+                     "choices": [{"index": 0, "delta": {"content": content[start:start + step]},
+                                  "finish_reason": None}]}
+            self.wfile.write(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+            time.sleep(delay)
+        final = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0, "model": model,
+                 "choices": [], "usage": usage}
+        self.wfile.write(b"data: " + json.dumps(final).encode("utf-8") + b"\n\ndata: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def fetch_stats(base_url: str) -> Dict[str, Any]:
+    """读取模拟服务的 /stats。"""
+    with urllib.request.urlopen(base_url.rsplit("/v1", 1)[0] + "/stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+@contextmanager
+def spawn(config: MockConfig, host: str = "127.0.0.1", startup_timeout: float = 10.0) -> Iterator[str]:
+    """
+    在子进程中启动模拟服务，退出 with 块时结束子进程。
+
+    :return: 服务的 base_url
+    """
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        port = sock.getsockname()[1]
+    args = [sys.executable, __file__, "--host", host, "--port", str(port), "--latency", str(config.latency),
+            "--latency-sigma", str(config.latency_sigma), "--error-rate", str(config.error_rate),
+            "--output-tokens", str(config.output_tokens), "--tokens-per-sec", str(config.tokens_per_sec)]
+    if config.seed is not None:
+        args += ["--seed", str(config.seed)]
+    if config.max_concurrency is not None:
+        args += ["--max-concurrency", str(config.max_concurrency)]
+    proc = subprocess.Popen(args, stdout=subprocess.DEVNULL)
+    base_url = f"http://{host}:{port}/v1"
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                fetch_stats(base_url)
+                break
+            except OSError:
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("模拟模型服务启动失败")
+                time.sleep(0.05)
+        yield base_url
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的模拟模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--latency", type=float, default=0.2, help="延迟中位数（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="对数正态分布的形状参数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 429/503 的概率")
+    parser.add_argument("--output-tokens", type=int, default=300, help="每份评阅的平均输出 token 数")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0, help="流式输出速度")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--max-concurrency", type=int, default=None, help="并发配额，超出时返回 429")
+    args = parser.parse_args()
+    mock = MockLLMServer((args.host, args.port), MockConfig(
+        latency=args.latency, latency_sigma=args.latency_sigma, error_rate=args.error_rate,
+        output_tokens=args.output_tokens, tokens_per_sec=args.tokens_per_sec, seed=args.seed,
+        max_concurrency=args.max_concurrency))
+    print(f"模拟模型服务: {mock.base_url}")
+    mock.serve_forever()
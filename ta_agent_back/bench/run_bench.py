@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+评阅流水线基准测试。
+
+对不同规模（默认 100 / 1000 / 10000 个学生）的合成 gradebook 分别测量：
+- parse:  SubmissionRecord 解析全部 TXT 记录的吞吐量和单条延迟；
+- parse_bulk: SubmissionRecord.load_directory 在进程池中批量解析的吞吐量；
+- load:   MainLoader.get_all_students（解析 TXT + 读取并解码源文件）的吞吐量；
+- memory: get_all_students 返回的学生对象平均每条提交记录占用的内存（只解析记录 / 同时读取源码）；
+- e2e:    process_all_submissions 对本地模拟模型服务的端到端吞吐量与各阶段耗时分位数；
+- endpoints_N: 给出 --endpoints 时，启动若干个各自只有 --endpoint-quota 个并发配额的模拟服务（模拟单个 Key 的配额），
+          分别用 N 个接口端到端评阅，观察吞吐量随接口数的扩展。
+
+结果可以保存为 JSON，并与之前保存的基线比较，吞吐量下降超过容差时以非零状态退出。
+
+用法:
+    cd ta_agent_back
+    python bench/run_bench.py --sizes 100,1000 --save bench.json
+    python bench/run_bench.py --sizes 100,1000 --baseline bench.json
+    python bench/run_bench.py --sizes 1000 --endpoints 1,2,4 --endpoint-quota 8
+"""
+import argparse
+import contextlib
+import dataclasses
+import gc
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(BENCH_DIR))
+
+from gen_gradebook import GradebookSpec, write_gradebook  # noqa: E402
+from mock_llm import MockConfig, fetch_stats, spawn  # noqa: E402
+from client_pool import Endpoint  # noqa: E402
+from instrumentation import percentile, stages  # noqa: E402
+from resubmission import ALL_ATTEMPTS  # noqa: E402
+from tools import MainLoader, SubmissionRecord  # noqa: E402
+
+
+def _latency_stats(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {"p50_ms": percentile(samples, 0.5) * 1000, "p95_ms": percentile(samples, 0.95) * 1000,
+            "p99_ms": percentile(samples, 0.99) * 1000}
+
+
+def _loader(gradebook: Path, workdir: Path, **kwargs) -> MainLoader:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return MainLoader(files_path=gradebook, output_path=workdir / "feedback_output",
+                          prompt_path=ROOT / "prompt.md", problems_path=ROOT / "problems",
+                          use_cache=False, resume=False, **kwargs)
+
+
+def bench_parse(gradebook: Path) -> Dict[str, Any]:
+    """逐个解析 TXT 记录（不读取源文件）。"""
+    samples = []
+    started = time.perf_counter()
+    for txt_file in gradebook.glob("*.txt"):
+        t0 = time.perf_counter()
+        SubmissionRecord.load_from_txt(filepath=txt_file)
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    return {"records": len(samples), "seconds": elapsed, "per_sec": len(samples) / elapsed,
+            **_latency_stats(samples)}
+
+
+def bench_parse_bulk(gradebook: Path, max_workers: int = None) -> Dict[str, Any]:
+    """进程池批量解析（含进程启动开销）。"""
+    started = time.perf_counter()
+    records = sum(1 for _ in SubmissionRecord.load_directory(gradebook, max_workers=max_workers))
+    elapsed = time.perf_counter() - started
+    return {"records": records, "seconds": elapsed, "per_sec": records / elapsed}
+
+
+def bench_load(gradebook: Path, workdir: Path) -> Dict[str, Any]:
+    loader = _loader(gradebook, workdir)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        students = loader.get_all_students(attempts=ALL_ATTEMPTS)
+    elapsed = time.perf_counter() - started
+    files = sum(len(student.homeworks) for student in students)
+    return {"students": len(students), "files": files, "seconds": elapsed, "per_sec": len(students) / elapsed}
+
+
+def bench_memory(gradebook: Path, workdir: Path) -> Dict[str, Any]:
+    """用 tracemalloc 测量加载完成后仍然存活的内存（单线程加载，避免线程池本身的分配干扰）。"""
+    loader = _loader(gradebook, workdir, load_workers=1)
+    result: Dict[str, Any] = {}
+    for key, load_sources in (("records_bytes", False), ("with_sources_bytes", True)):
+        gc.collect()
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            students = loader.get_all_students(load_sources=load_sources, attempts=ALL_ATTEMPTS)
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["students"] = len(students)
+        result[key] = current / max(1, len(students))
+        del students
+    return result
+
+
+def bench_e2e(gradebook: Path, workdir: Path, base_urls: List[str], concurrency: int,
+              dedup: bool = False) -> Dict[str, Any]:
+    """
+    端到端评阅。合成代码的结构只有几种，默认关闭重复提交合并，使每个任务都发出请求。
+
+    :param base_urls: 模拟服务地址，多于一个时通过客户端池在它们之间路由
+    """
+    endpoints = [Endpoint(base_url=url, api_key="mock", name=f"mock{i}") for i, url in enumerate(base_urls)]
+    loader = _loader(gradebook, workdir, base_url=base_urls[0], api_key="mock", concurrency=concurrency,
+                     max_retries=8, dedup=dedup, endpoints=endpoints if len(endpoints) > 1 else [])
+    requests_before = sum(fetch_stats(url)["requests"] for url in base_urls)
+    started = time.perf_counter()
+    # 每个任务都会打印进度，重定向后仍然执行 print，只是不输出到终端
+    with contextlib.redirect_stdout(io.StringIO()):
+        loader.process_all_submissions()
+    elapsed = time.perf_counter() - started
+    summary = stages.summary()
+    # 以写出的反馈文件数计任务数（同一学生的多次 attempt 在 manifest 中共用一条记录）
+    jobs = summary.get("write", {}).get("count", 0)
+    return {"jobs": jobs, "seconds": elapsed, "per_sec": jobs / elapsed,
+            "requests": sum(fetch_stats(url)["requests"] for url in base_urls) - requests_before,
+            "stages": {stage: {k: round(v * 1000, 3) if k != "count" else v for k, v in s.items()}
+                       for stage, s in summary.items()}}
+
+
+def bench_endpoints(gradebook: Path, workdir: Path, counts: List[int], quota: int, mock_config: MockConfig,
+                    concurrency: int, dedup: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    多接口扩展性：启动 max(counts) 个各自只有 quota 个并发配额的模拟服务，分别用其中 N 个评阅同一个 gradebook。
+
+    :return: {"endpoints_N": bench_e2e 的结果}
+    """
+    results = {}
+    with contextlib.ExitStack() as stack:
+        config = dataclasses.replace(mock_config, max_concurrency=quota)
+        urls = [stack.enter_context(spawn(config)) for _ in range(max(counts))]
+        for count in counts:
+            result = bench_e2e(gradebook, workdir / f"endpoints_{count}", urls[:count], concurrency, dedup)
+            result["rejected"] = sum(fetch_stats(url)["rejected"] for url in urls[:count])
+            results[f"endpoints_{count}"] = result
+    return results
+
+
+def run(sizes: List[int], data_dir: Path, concurrency: int, mock_config: MockConfig,
+        e2e_max: int, as_zip: bool = False, dedup: bool = False,
+        endpoint_counts: List[int] = (), endpoint_quota: int = 8) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"config": {"concurrency": concurrency, "latency": mock_config.latency,
+                                          "error_rate": mock_config.error_rate, "dedup": dedup,
+                                          "cpus": os.cpu_count(), "endpoint_quota": endpoint_quota},
+                               "sizes": {}}
+    with spawn(mock_config) as base_url:
+        for size in sizes:
+            gradebook = write_gradebook(data_dir, GradebookSpec(students=size), as_zip=as_zip)
+            entry: Dict[str, Any] = {}
+            with tempfile.TemporaryDirectory(prefix="ta_bench_") as tmp:
+                if not as_zip:
+                    entry["parse"] = bench_parse(gradebook)
+                    entry["parse_bulk"] = bench_parse_bulk(gradebook)
+                entry["load"] = bench_load(gradebook, Path(tmp) / "load")
+                entry["memory"] = bench_memory(gradebook, Path(tmp) / "memory")
+                if size <= e2e_max:
+                    entry["e2e"] = bench_e2e(gradebook, Path(tmp) / "e2e", [base_url], concurrency, dedup)
+                    if endpoint_counts:
+                        entry.update(bench_endpoints(gradebook, Path(tmp), list(endpoint_counts), endpoint_quota,
+                                                     mock_config, concurrency, dedup))
+            results["sizes"][str(size)] = entry
+            _print_size(size, entry)
+    return results
+
+
+def _print_size(size: int, entry: Dict[str, Any]):
+    print(f"\n== {size} 个学生 ==")
+    if "parse" in entry:
+        p = entry["parse"]
+        print(f"  parse: {p['records']} 条记录，{p['per_sec']:.0f} 条/s，"
+              f"p50 {p['p50_ms']:.3f}ms / p95 {p['p95_ms']:.3f}ms / p99 {p['p99_ms']:.3f}ms")
+    if "parse_bulk" in entry:
+        bulk = entry["parse_bulk"]
+        print(f"  parse_bulk: {bulk['records']} 条记录，{bulk['seconds']:.2f}s，{bulk['per_sec']:.0f} 条/s"
+              f"（{os.cpu_count()} 个 CPU）")
+    load = entry["load"]
+    print(f"  load:  {load['students']} 个提交记录，{load['files']} 个源文件，{load['seconds']:.2f}s，"
+          f"{load['per_sec']:.0f} 个/s")
+    memory = entry["memory"]
+    print(f"  memory: 每条提交记录 {memory['records_bytes'] / 1024:.2f} KB，"
+          f"含源码 {memory['with_sources_bytes'] / 1024:.2f} KB")
+    if "e2e" in entry:
+        e2e = entry["e2e"]
+        print(f"  e2e:   {e2e['jobs']} 个任务，{e2e['requests']} 个请求，{e2e['seconds']:.2f}s，"
+              f"{e2e['per_sec']:.1f} 个/s")
+        for stage, s in e2e["stages"].items():
+            print(f"         {stage:<14} p50 {s['p50']:.2f}ms / p95 {s['p95']:.2f}ms / p99 {s['p99']:.2f}ms")
+    for name, result in entry.items():
+        if name.startswith("endpoints_"):
+            print(f"  {name}: {result['jobs']} 个任务，{result['requests']} 个请求（{result['rejected']} 个超出配额被拒绝），"
+                  f"{result['seconds']:.2f}s，{result['per_sec']:.1f} 个/s")
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    比较各规模各阶段的吞吐量（per_sec）。
+
+    :return: 吞吐量下降超过 tolerance（比例）的项目说明
+    """
+    regressions = []
+    for size, entry in results["sizes"].items():
+        for bench, values in entry.items():
+            base = baseline.get("sizes", {}).get(size, {}).get(bench)
+            if not base or not base.get("per_sec"):
+                continue
+            change = values["per_sec"] / base["per_sec"] - 1
+            line = f"{size} 个学生 / {bench}: {base['per_sec']:.1f} -> {values['per_sec']:.1f} 个/s ({change:+.0%})"
+            print("  " + line)
+            if change < -tolerance:
+                regressions.append(line)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="评阅流水线基准测试")
+    parser.add_argument("--sizes", default="100,1000,10000", help="学生数，逗号分隔")
+    parser.add_argument("--data-dir", type=Path, default=Path(tempfile.gettempdir()) / "ta_agent_bench",
+                        help="合成 gradebook 的存放目录（按规模和种子复用）")
+    parser.add_argument("--zip", action="store_true", help="使用 ZIP 格式的 gradebook")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟模型的延迟中位数（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--output-tokens", type=int, default=300)
+    parser.add_argument("--e2e-max", type=int, default=10000, help="超过该学生数的规模不跑端到端测试")
+    parser.add_argument("--dedup", action="store_true", help="端到端测试时开启重复提交合并")
+    parser.add_argument("--endpoints", default="", help="多接口扩展性测试的接口数，逗号分隔（例如 1,2,4）")
+    parser.add_argument("--endpoint-quota", type=int, default=8, help="扩展性测试中每个模拟接口的并发配额")
+    parser.add_argument("--save", type=Path, help="保存结果 JSON")
+    parser.add_argument("--baseline", type=Path, help="与之前保存的结果比较")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="吞吐量允许下降的比例")
+    args = parser.parse_args()
+
+    bench_results = run([int(size) for size in args.sizes.split(",")], args.data_dir, args.concurrency,
+                        MockConfig(latency=args.latency, error_rate=args.error_rate,
+                                   output_tokens=args.output_tokens, seed=0),
+                        args.e2e_max, as_zip=args.zip, dedup=args.dedup,
+                        endpoint_counts=[int(n) for n in args.endpoints.split(",") if n.strip()],
+                        endpoint_quota=args.endpoint_quota)
+    if args.save:
+        args.save.write_text(json.dumps(bench_results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n结果已保存到 {args.save}")
+    if args.baseline:
+        print(f"\n与基线 {args.baseline} 比较:")
+        found = compare(bench_results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        if found:
+            print(f"\n吞吐量下降超过 {args.tolerance:.0%}:")
+            for line in found:
+                print("  " + line)
+            sys.exit(1)
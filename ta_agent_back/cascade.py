@@ -0,0 +1,80 @@
+"""
+模型分级评阅。
+
+先用便宜、快速的小模型评阅，并要求它在评阅意见末尾给出置信度和是否需要复核；
+只有置信度低、分数低、被标记需要复核或没有给出分数的提交才交给大模型重新评阅。
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+from token_budget import TokenBudget
+
+TRIAGE_INSTRUCTIONS = """在评阅意见的最后另起两行，严格按以下格式给出你对本次评阅的把握程度：
+评阅置信度：0 到 1 之间的小数（例如 0.85），对代码正确性和分数判断越有把握越高
+需要复核：是 或 否（代码疑似与题目无关、无法判断能否正确运行、或你不确定分数时填“是”）"""
+
+_CONFIDENCE_RE = re.compile(r"^\W*评阅置信度\W*[:：]\s*\**\s*([01](?:\.\d+)?)", re.MULTILINE)
+_REVIEW_RE = re.compile(r"^\W*需要复核\W*[:：]\s*\**\s*(是|否)", re.MULTILINE)
+_TRIAGE_LINE_RE = re.compile(r"^\W*(?:评阅置信度|需要复核)\W*[:：].*$\n?", re.MULTILINE)
+_SCORE_VALUE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)")
+
+# 升级到大模型的原因
+NO_SCORE = "没有给出分数"
+LOW_CONFIDENCE = "置信度低"
+LOW_SCORE = "分数低"
+FLAGGED = "标记需要复核"
+TIER_FAILED = "小模型调用失败"
+
+
+def parse_triage(feedback: str) -> Tuple[Optional[float], bool]:
+    """
+    读取小模型输出末尾的置信度和复核标记。
+
+    :return: (置信度，没有给出时为 None, 是否需要复核)
+    """
+    confidence = _CONFIDENCE_RE.findall(feedback)
+    review = _REVIEW_RE.findall(feedback)
+    return (float(confidence[-1]) if confidence else None), bool(review) and review[-1] == "是"
+
+
+def strip_triage(feedback: str) -> str:
+    """去掉置信度和复核标记两行，得到写入反馈文件的评阅意见。"""
+    return _TRIAGE_LINE_RE.sub("", feedback).rstrip()
+
+
+@dataclass
+class CascadeConfig:
+    """
+    小模型优先的分级评阅配置（MainLoader.cascade）。
+
+    :param model: 第一轮评阅使用的小模型
+    :param min_confidence: 小模型置信度低于该值时升级
+    :param escalate_below: 小模型给出的分数低于该值时升级（低分更需要准确的反馈）
+    :param token_budget: 小模型请求的输出上限和价格，用于费用统计
+    """
+    model: str = "qwen-flash"
+    min_confidence: float = 0.8
+    escalate_below: float = 60
+    token_budget: TokenBudget = field(default_factory=lambda: TokenBudget(
+        min_output_tokens=2000, input_price_per_1k=0.00015, output_price_per_1k=0.0015,
+        cached_input_price_per_1k=0.00003))
+
+    def escalation_reason(self, feedback: str, score: str) -> Optional[str]:
+        """
+        判断小模型的评阅结果是否需要交给大模型。
+
+        :param score: 从反馈中提取的建议分数，例如 '85/100' 或 '待评阅'
+        :return: 升级原因；可以直接采用小模型结果时返回 None
+        """
+        match = _SCORE_VALUE_RE.match(score or "")
+        if match is None:
+            return NO_SCORE
+        confidence, flagged = parse_triage(feedback)
+        if flagged:
+            return FLAGGED
+        if confidence is None or confidence < self.min_confidence:
+            return LOW_CONFIDENCE
+        if float(match.group(1)) < self.escalate_below:
+            return LOW_SCORE
+        return None
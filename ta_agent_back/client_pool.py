@@ -0,0 +1,271 @@
+"""
+多接口客户端池。
+
+一次评阅运行可以同时使用多个 OpenAI 兼容的接口（不同的 base_url、API Key 或模型名），
+吞吐量随接口数增加，而不是受限于单个 Key 的配额。每个接口有自己的 HTTP 连接池、
+RPM/TPM 限流器、自适应并发上限和熔断器：
+
+- 路由：least_loaded（默认）选择 在途请求数 / 权重 最小的可用接口，相同时选择平均延迟较低的；
+  weighted 在可用接口中按权重随机选择；
+- 健康状态：429 时该接口的并发上限减半，并在 Retry-After（没有时为 rate_limit_cooldown 秒）内不参与路由；
+  服务端/网络错误计入该接口的熔断器，熔断期间不参与路由。全部接口都不可用时选择最早恢复的接口等待；
+- HTTP：连接池大小、keep-alive 连接数与过期时间、超时以及 HTTP/2（需要安装 h2）可配置。
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from rate_limit import AdaptiveConcurrency, RateLimiter
+from resilience import OUTAGE, RATE_LIMIT, CircuitBreaker
+
+LEAST_LOADED = "least_loaded"
+WEIGHTED = "weighted"
+
+
+@dataclass
+class Endpoint:
+    """
+    一个模型接口。
+
+    :param base_url: OpenAI 兼容接口地址
+    :param api_key: API Key
+    :param model: 该接口上 MainLoader.model 对应的模型名（不同服务商命名不同时使用），为 None 时不改写
+    :param rpm_limit: 该 Key 的每分钟请求数上限
+    :param tpm_limit: 该 Key 的每分钟 token 数上限
+    :param weight: 路由权重，越大分到的请求越多
+    :param max_concurrency: 该接口同时在途的请求数上限，为 None 时使用运行的并发数
+    :param name: 日志和统计中显示的名字，默认为 base_url
+    """
+    base_url: str
+    api_key: str = ""
+    model: Optional[str] = None
+    rpm_limit: Optional[int] = None
+    tpm_limit: Optional[int] = None
+    weight: float = 1.0
+    max_concurrency: Optional[int] = None
+    name: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Endpoint":
+        """从配置字典构造；可以用 api_key_env 给出保存 Key 的环境变量名，避免把 Key 写进配置文件。"""
+        data = dict(data)
+        key_env = data.pop("api_key_env", None)
+        if key_env:
+            data["api_key"] = os.environ.get(key_env, "")
+            if not data["api_key"]:
+                print(f"警告: 环境变量 {key_env} 未设置，接口 {data.get('name') or data.get('base_url')} 没有 API Key")
+        return cls(**data)
+
+
+def load_endpoints(path: Path) -> List[Endpoint]:
+    """
+    从 JSON 文件加载接口列表，格式为:
+    [{"base_url": "...", "api_key_env": "DASHSCOPE_KEY_1", "rpm_limit": 600, "weight": 2}, ...]
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return [Endpoint.from_dict(item) for item in json.load(f)]
+
+
+@lru_cache(maxsize=None)
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("警告: 未安装 h2（pip install 'httpx[http2]'），使用 HTTP/1.1")
+        return False
+    return True
+
+
+@dataclass
+class HTTPConfig:
+    """
+    每个接口的 HTTP 连接池设置。
+
+    :param max_connections: 连接数上限，应不小于该接口的并发数，否则请求会在连接池中排队
+    :param max_keepalive_connections: 空闲时保留的 keep-alive 连接数
+    :param keepalive_expiry: 空闲连接保留的秒数
+    :param http2: 是否使用 HTTP/2（一个连接上多路复用多个请求，需要安装 h2，服务端不支持时自动降级为 HTTP/1.1）
+    :param timeout: 读取响应的超时（秒），模型生成长文本时需要足够长
+    :param connect_timeout: 建立连接的超时（秒）
+    """
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    timeout: float = 600.0
+    connect_timeout: float = 10.0
+
+    def timeouts(self) -> httpx.Timeout:
+        """OpenAI 客户端会用自己的超时覆盖 httpx 客户端的设置，因此两边都要传入。"""
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+    def client_kwargs(self) -> Dict[str, Any]:
+        """httpx.Client / httpx.AsyncClient 的构造参数。"""
+        return dict(
+            trust_env=False,
+            http2=self.http2 and _http2_available(),
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_keepalive_connections,
+                                keepalive_expiry=self.keepalive_expiry),
+            timeout=self.timeouts(),
+        )
+
+
+@dataclass(eq=False)
+class EndpointState:
+    """客户端池中一个接口的运行时状态。"""
+    endpoint: Endpoint
+    client: AsyncOpenAI
+    limiter: RateLimiter
+    gate: AdaptiveConcurrency
+    breaker: CircuitBreaker
+    rate_limit_cooldown: float = 1.0
+    cooldown_until: float = 0.0
+    active: int = 0  # 已选中该接口、尚未结束的请求数（包括在限流器或并发上限处等待的）
+    requests: int = 0
+    errors: Dict[str, int] = field(default_factory=dict)
+    latency: Optional[float] = None  # 成功请求耗时的指数滑动平均（秒）
+
+    @property
+    def name(self) -> str:
+        return self.endpoint.name or self.endpoint.base_url
+
+    def available(self, now: float) -> bool:
+        """不在冷却和熔断中，且还有空闲的并发名额。"""
+        return now >= self.cooldown_until and self.active < self.gate.limit and self.breaker.available()
+
+    def load(self) -> float:
+        return (self.active + 1) / max(self.endpoint.weight, 1e-9)
+
+    def prepare(self, request: Dict[str, Any], default_model: str) -> Dict[str, Any]:
+        """按接口改写请求中的模型名。"""
+        if self.endpoint.model and request.get("model") == default_model:
+            return dict(request, model=self.endpoint.model)
+        return request
+
+    @asynccontextmanager
+    async def slot(self):
+        """占用该接口的一个请求名额：等待冷却结束、熔断器放行和并发名额。"""
+        self.active += 1
+        try:
+            delay = self.cooldown_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.breaker.before_call()
+            async with self.gate:
+                self.requests += 1
+                yield self
+        finally:
+            self.active -= 1
+
+    def record_success(self, latency: float):
+        self.breaker.record_success()
+        self.gate.on_success()
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+    def record_error(self, kind: str, retry_after: Optional[float] = None):
+        """
+        记录一次失败：服务端/网络错误计入熔断器；429 时收缩并发并进入冷却。
+
+        :param kind: resilience.classify_error 的结果
+        """
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+        if kind in OUTAGE:
+            self.breaker.record_failure()
+        else:
+            self.breaker.release_probe()
+        if kind == RATE_LIMIT:
+            self.gate.on_rate_limited()
+            cooldown = retry_after if retry_after is not None else self.rate_limit_cooldown
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown)
+
+
+class ClientPool:
+    """
+    在多个接口之间路由请求。需要在事件循环中以 async with 使用，退出时关闭所有连接。
+
+    :param endpoints: 接口列表
+    :param http: 每个接口的连接池设置
+    :param routing: least_loaded 或 weighted
+    :param max_concurrency: 接口没有设置 max_concurrency 时的并发上限
+    :param failure_threshold: 每个接口的熔断器连续失败阈值
+    :param reset_timeout: 每个接口的熔断持续时间（秒）
+    :param rate_limit_cooldown: 429 且没有 Retry-After 时，该接口暂停接收新请求的秒数
+    """
+
+    def __init__(self, endpoints: Iterable[Endpoint], http: Optional[HTTPConfig] = None,
+                 routing: str = LEAST_LOADED, max_concurrency: int = 1,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, rate_limit_cooldown: float = 1.0):
+        self.endpoints = list(endpoints)
+        if not self.endpoints:
+            raise ValueError("至少需要一个接口")
+        if routing not in (LEAST_LOADED, WEIGHTED):
+            raise ValueError(f"未知的路由策略: {routing}")
+        self.http = http or HTTPConfig()
+        self.routing = routing
+        self.max_concurrency = max(1, max_concurrency)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.rate_limit_cooldown = rate_limit_cooldown
+        self.states: List[EndpointState] = []
+        self._stack: Optional[AsyncExitStack] = None
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    async def __aenter__(self) -> "ClientPool":
+        self._stack = AsyncExitStack()
+        self.states = []
+        kwargs = self.http.client_kwargs()
+        for endpoint in self.endpoints:
+            http_client = await self._stack.enter_async_context(httpx.AsyncClient(**kwargs))
+            # 重试由调用方统一处理，关闭 SDK 自带的重试以免叠加
+            client = AsyncOpenAI(api_key=endpoint.api_key, base_url=endpoint.base_url,
+                                 http_client=http_client, timeout=self.http.timeouts(), max_retries=0)
+            self.states.append(EndpointState(
+                endpoint=endpoint,
+                client=client,
+                limiter=RateLimiter(rpm=endpoint.rpm_limit, tpm=endpoint.tpm_limit),
+                gate=AdaptiveConcurrency(max_limit=endpoint.max_concurrency or self.max_concurrency),
+                breaker=CircuitBreaker(failure_threshold=self.failure_threshold, reset_timeout=self.reset_timeout),
+                rate_limit_cooldown=self.rate_limit_cooldown,
+            ))
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # 保留 states，退出后仍可读取 summary()
+        await self._stack.aclose()
+
+    def pick(self, exclude: Iterable[EndpointState] = ()) -> EndpointState:
+        """
+        选择一个接口。优先在 exclude 之外的可用接口中选择（用于失败后换一个接口重试）。
+        """
+        now = time.monotonic()
+        available = [state for state in self.states if state.available(now)]
+        candidates = [state for state in available if state not in exclude] or available
+        if not candidates:
+            # 全部不可用：选择最早结束冷却、没有熔断、负载最低的接口，在其名额上等待
+            return min(self.states, key=lambda s: (max(s.cooldown_until, now), not s.breaker.available(), s.load()))
+        if self.routing == WEIGHTED and len(candidates) > 1:
+            return random.choices(candidates, weights=[s.endpoint.weight for s in candidates])[0]
+        return min(candidates, key=lambda s: (s.load(), s.latency or 0.0))
+
+    def has_alternative(self, state: EndpointState) -> bool:
+        """除 state 外是否还有现在可用的接口。"""
+        now = time.monotonic()
+        return any(other is not state and other.available(now) for other in self.states)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """每个接口的请求数、错误数、当前并发上限、熔断状态和平均延迟。"""
+        return [{"name": s.name, "requests": s.requests, "errors": dict(s.errors), "limit": s.gate.limit,
+                 "breaker": s.breaker.state, "latency": s.latency} for s in self.states]
@@ -0,0 +1,249 @@
+"""
+本地编译与测试。
+
+在进程池中用本机 gcc 编译学生代码，并用题目登记的测试输入运行，结果作为参考信息放进提示词，
+让模型不必仅凭源码猜测正确性。编译产物按 (源码, 编译器, 编译选项) 的哈希缓存，
+测试结果按 (编译产物, 测试用例, 运行限制) 的哈希缓存，重复运行时不会重新编译或执行。
+
+注意：这里的资源限制（CPU 时间、内存、输出大小）只用于防止死循环、内存耗尽或输出爆炸，
+并不是安全沙箱；请只在评阅专用的机器或容器中开启。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import resource
+except ImportError:  # Windows 上没有 resource 模块，只依赖超时限制
+    resource = None
+
+MAX_DIAGNOSTICS_CHARS = 4000
+MAX_OUTPUT_BYTES = 1024 * 1024
+
+
+@dataclass
+class TestCase:
+    """一个测试用例：标准输入与期望的标准输出（比较时忽略行尾空白和末尾空行）。"""
+    name: str
+    input: str = ""
+    expected: Optional[str] = None  # 为 None 时只检查程序能否正常结束
+
+
+@dataclass
+class TestResult:
+    name: str
+    passed: bool
+    detail: str = ""
+
+
+@dataclass
+class CheckResult:
+    """一份代码的编译与测试结果。"""
+    empty: bool = False
+    compiled: bool = False
+    diagnostics: str = ""
+    tests: List[TestResult] = field(default_factory=list)
+
+    @property
+    def passed_count(self) -> int:
+        return sum(1 for test in self.tests if test.passed)
+
+    @property
+    def all_passed(self) -> bool:
+        return self.compiled and all(test.passed for test in self.tests)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CheckResult":
+        tests = [TestResult(**test) for test in data.get("tests", [])]
+        return cls(empty=data.get("empty", False), compiled=data.get("compiled", False),
+                   diagnostics=data.get("diagnostics", ""), tests=tests)
+
+    def report(self) -> str:
+        """放进提示词的结果摘要。"""
+        if self.empty:
+            return "本地检查：提交的代码为空。"
+        lines = ["本地编译与测试结果（由评阅脚本自动生成，供参考）："]
+        if not self.compiled:
+            lines.append("编译：失败")
+        else:
+            lines.append("编译：成功" + ("（有警告）" if self.diagnostics else ""))
+        if self.diagnostics:
+            lines.append(f"编译器输出：\n```\n{self.diagnostics}\n```")
+        if self.compiled and self.tests:
+            lines.append(f"测试：{self.passed_count}/{len(self.tests)} 通过")
+            for test in self.tests:
+                if not test.passed:
+                    lines.append(f"- 用例 {test.name}：{test.detail}")
+        return "\n".join(lines)
+
+
+def _normalize_output(text: str) -> List[str]:
+    lines = [line.rstrip() for line in text.replace("\r\n", "\n").split("\n")]
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def _clip(text: str, limit: int = 80) -> str:
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def _limit_resources(cpu_seconds: int, memory_bytes: int):
+    """子进程中执行：限制 CPU 时间、地址空间和写文件大小。"""
+    def apply():
+        if resource is None:
+            return
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (MAX_OUTPUT_BYTES, MAX_OUTPUT_BYTES))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    return apply if resource is not None else None
+
+
+def _run_test(binary: Path, test: Dict[str, Any], workdir: Path, timeout: float, memory_bytes: int) -> TestResult:
+    name = test["name"]
+    out_path = workdir / "stdout.txt"
+    try:
+        with open(out_path, "wb") as stdout:
+            proc = subprocess.run(
+                [str(binary)], input=test.get("input", "").encode("utf-8"), stdout=stdout,
+                stderr=subprocess.DEVNULL, cwd=str(workdir), timeout=timeout,
+                preexec_fn=_limit_resources(int(timeout) + 1, memory_bytes)
+            )
+    except subprocess.TimeoutExpired:
+        return TestResult(name, False, f"运行超时（{timeout:g} 秒）")
+    output = out_path.read_bytes()[:MAX_OUTPUT_BYTES].decode("utf-8", errors="replace")
+    if proc.returncode != 0:
+        return TestResult(name, False, f"程序异常退出（返回值 {proc.returncode}）")
+    expected = test.get("expected")
+    if expected is None:
+        return TestResult(name, True)
+    actual_lines, expected_lines = _normalize_output(output), _normalize_output(expected)
+    if actual_lines == expected_lines:
+        return TestResult(name, True)
+    for i in range(max(len(actual_lines), len(expected_lines))):
+        want = expected_lines[i] if i < len(expected_lines) else "<无>"
+        got = actual_lines[i] if i < len(actual_lines) else "<无>"
+        if want != got:
+            return TestResult(name, False, f"输出不一致，第 {i + 1} 行期望 \"{_clip(want)}\"，实际 \"{_clip(got)}\"")
+    return TestResult(name, False, "输出不一致")
+
+
+def check_source(code: str, tests: Sequence[Dict[str, Any]], binary_path: Path, cc: str = "gcc",
+                 cflags: Sequence[str] = (), timeout: float = 2.0, memory_mb: int = 256) -> Dict[str, Any]:
+    """
+    编译并测试一份代码（在进程池的工作进程中执行）。
+
+    :param binary_path: 编译产物的缓存路径，已存在时跳过编译
+    :return: CheckResult.to_dict()
+    """
+    if not code.strip():
+        return CheckResult(empty=True).to_dict()
+    result = CheckResult()
+    with tempfile.TemporaryDirectory(prefix="ta_check_") as tmp:
+        workdir = Path(tmp)
+        diagnostics_path = binary_path.with_suffix(".log")
+        if binary_path.exists():
+            result.compiled = True
+            if diagnostics_path.exists():
+                result.diagnostics = diagnostics_path.read_text(encoding="utf-8")
+        else:
+            source = workdir / "main.c"
+            source.write_text(code, encoding="utf-8")
+            try:
+                proc = subprocess.run(
+                    [cc, *cflags, "-o", str(workdir / "main"), str(source), "-lm"],
+                    capture_output=True, timeout=60
+                )
+                diagnostics = proc.stderr.decode("utf-8", errors="replace").replace(str(source), "main.c")
+                result.compiled = proc.returncode == 0
+            except subprocess.TimeoutExpired:
+                diagnostics = "编译超时"
+            result.diagnostics = diagnostics.strip()[:MAX_DIAGNOSTICS_CHARS]
+            if result.compiled:
+                # 先写到临时名再改名，避免并发的工作进程读到写了一半的文件
+                binary_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_binary = binary_path.with_name(f".{binary_path.name}.{os.getpid()}")
+                shutil.copy2(workdir / "main", tmp_binary)
+                os.replace(tmp_binary, binary_path)
+                diagnostics_path.write_text(result.diagnostics, encoding="utf-8")
+        if result.compiled:
+            for test in tests:
+                result.tests.append(_run_test(binary_path, test, workdir, timeout, memory_mb * 1024 * 1024))
+    return result.to_dict()
+
+
+class CompileChecker:
+    """
+    进程池中的编译与测试，结果缓存在 cache_dir 下。
+
+    :param cache_dir: 缓存目录（bin/ 存放编译产物，results/ 存放测试结果）
+    :param max_workers: 工作进程数，默认为 CPU 核数
+    :param timeout: 每个测试用例的运行时间上限（秒）
+    :param memory_mb: 每个测试进程的内存上限（MB）
+    """
+
+    def __init__(self, cache_dir: Path, max_workers: Optional[int] = None, cc: str = "gcc",
+                 cflags: Sequence[str] = ("-std=c11", "-O1", "-Wall", "-Wextra"),
+                 timeout: float = 2.0, memory_mb: int = 256):
+        self.cache_dir = Path(cache_dir)
+        self.max_workers = max_workers
+        self.cc = cc
+        self.cflags = tuple(cflags)
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.stats = {"checked": 0, "cached": 0}
+
+    @staticmethod
+    def available(cc: str = "gcc") -> bool:
+        return shutil.which(cc) is not None
+
+    def _keys(self, code: str, tests: Sequence[TestCase]):
+        binary_key = hashlib.sha256(
+            json.dumps([code, self.cc, self.cflags]).encode("utf-8")
+        ).hexdigest()
+        result_key = hashlib.sha256(
+            json.dumps([binary_key, [asdict(test) for test in tests], self.timeout, self.memory_mb]).encode("utf-8")
+        ).hexdigest()
+        return binary_key, result_key
+
+    async def check(self, code: str, tests: Sequence[TestCase]) -> CheckResult:
+        """编译并测试一份代码；结果已缓存时直接返回。"""
+        binary_key, result_key = self._keys(code, tests)
+        result_path = self.cache_dir / "results" / f"{result_key}.json"
+        if result_path.exists():
+            try:
+                result = CheckResult.from_dict(json.loads(result_path.read_text(encoding="utf-8")))
+                self.stats["cached"] += 1
+                return result
+            except (OSError, ValueError, TypeError):
+                pass
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        data = await asyncio.get_running_loop().run_in_executor(
+            self._pool, check_source, code, [asdict(test) for test in tests],
+            self.cache_dir / "bin" / binary_key, self.cc, self.cflags, self.timeout, self.memory_mb
+        )
+        self.stats["checked"] += 1
+        result_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = result_path.with_name(f".{result_path.name}.tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, result_path)
+        return CheckResult.from_dict(data)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
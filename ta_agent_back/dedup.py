@@ -0,0 +1,182 @@
+"""
+C 源码规范化与重复/近似重复检测。
+
+- normalize_c_tokens: 去掉注释和空白，并按出现顺序将标识符替换为 $0, $1, ...
+- fingerprint: token 序列的 SHA-256。
+- exact_fingerprint: 只忽略空白的源码指纹（保留注释和标识符），相同的提交共用一次评阅结果。
+  评阅意见会引用具体的变量名，AI 使用检查也会看注释，因此只有结构相同的提交不能共用结果，
+  只在相似度报告中列为完全重复（规范化后相同）。
+- MinHasher / NearDuplicateIndex: 基于 token shingle 的 MinHash + LSH，报告近似重复的提交簇。
+"""
+import hashlib
+import re
+from collections import defaultdict
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+C_KEYWORDS = frozenset("""
+auto break case char const continue default do double else enum extern float for goto if
+inline int long register restrict return short signed sizeof static struct switch typedef
+union unsigned void volatile while _Bool _Complex bool true false NULL
+include define ifdef ifndef endif pragma
+""".split())
+
+# 常见库函数/头文件名不参与重命名，否则 printf 与学生自定义的变量名会被混为一谈
+C_COMMON_NAMES = frozenset("""
+main printf scanf puts gets fgets getchar putchar fprintf sprintf snprintf fscanf sscanf
+malloc calloc realloc free strlen strcpy strncpy strcmp strncmp strcat memset memcpy
+abs fabs sqrt pow rand srand time exit stdio stdlib string math h stdin stdout stderr
+""".split())
+
+_TOKEN_RE = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<ident>[A-Za-z_]\w*)
+  | (?P<number>\.?\d(?:[\w.]|[eEpP][+-])*)
+  | (?P<op>\S)
+""", re.S | re.X)
+
+
+def normalize_c_tokens(source: str, canonicalize_identifiers: bool = True, strip_comments: bool = True) -> List[str]:
+    """
+    将 C 源码转换为规范化的 token 列表。
+
+    :param source: C 源码
+    :param canonicalize_identifiers: 是否将用户标识符按出现顺序替换为 $0, $1, ...
+    :param strip_comments: 是否去除注释；保留时注释内的连续空白合并为一个空格
+    :return: token 列表（空白已去除）
+    """
+    tokens = []
+    names: Dict[str, str] = {}
+    for match in _TOKEN_RE.finditer(source):
+        kind = match.lastgroup
+        if kind == "comment":
+            if not strip_comments:
+                tokens.append(" ".join(match.group().split()))
+            continue
+        text = match.group()
+        if kind == "ident" and canonicalize_identifiers \
+                and text not in C_KEYWORDS and text not in C_COMMON_NAMES:
+            text = names.setdefault(text, f"${len(names)}")
+        tokens.append(text)
+    return tokens
+
+
+def fingerprint(tokens: Sequence[str]) -> str:
+    """token 序列的指纹。"""
+    return hashlib.sha256("\x1f".join(tokens).encode("utf-8")).hexdigest()
+
+
+def exact_fingerprint(source: str) -> str:
+    """只忽略空白（字符串字面量内的除外）的源码指纹，注释和标识符原样保留。"""
+    return fingerprint(normalize_c_tokens(source, canonicalize_identifiers=False, strip_comments=False))
+
+
+class MinHasher:
+    """
+    对 token shingle 集合计算 MinHash 签名。
+
+    :param num_perm: 哈希函数个数（签名长度）
+    :param shingle_size: 每个 shingle 包含的 token 数
+    """
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        params = hashlib.sha256(f"minhash-{seed}".encode()).digest()
+        # 用确定性的方式生成 (a, b) 参数，保证多次运行签名一致
+        self._perms = []
+        for i in range(num_perm):
+            digest = hashlib.blake2b(params + i.to_bytes(4, "little"), digest_size=16).digest()
+            a = int.from_bytes(digest[:8], "little") % (self._PRIME - 1) + 1
+            b = int.from_bytes(digest[8:], "little") % self._PRIME
+            self._perms.append((a, b))
+
+    def _shingle_hashes(self, tokens: Sequence[str]) -> set:
+        k = self.shingle_size
+        if len(tokens) < k:
+            grams = [tokens] if tokens else []
+        else:
+            grams = (tokens[i:i + k] for i in range(len(tokens) - k + 1))
+        return {
+            int.from_bytes(hashlib.blake2b("\x1f".join(g).encode("utf-8"), digest_size=8).digest(), "little")
+            for g in grams
+        }
+
+    def signature(self, tokens: Sequence[str]) -> Tuple[int, ...]:
+        hashes = self._shingle_hashes(tokens)
+        if not hashes:
+            return tuple([self._PRIME] * self.num_perm)
+        prime = self._PRIME
+        return tuple(min((a * h + b) % prime for h in hashes) for a, b in self._perms)
+
+
+def estimate_similarity(sig_a: Sequence[int], sig_b: Sequence[int]) -> float:
+    """由两个 MinHash 签名估计 Jaccard 相似度。"""
+    if not sig_a:
+        return 0.0
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash 签名的 LSH 索引：签名切成 bands 段，任一段完全相同即成为候选对，
+    再用估计的相似度过滤，最后用并查集合并成簇。
+
+    :param threshold: 判定为近似重复的最低相似度
+    :param bands: LSH 分段数（num_perm 必须能被整除）
+    """
+
+    def __init__(self, threshold: float = 0.8, bands: int = 16):
+        self.threshold = threshold
+        self.bands = bands
+        self.signatures: Dict[Hashable, Tuple[int, ...]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[Hashable]] = defaultdict(list)
+
+    def add(self, key: Hashable, signature: Tuple[int, ...]):
+        self.signatures[key] = signature
+        rows = len(signature) // self.bands
+        for band in range(self.bands):
+            self._buckets[(band, signature[band * rows:(band + 1) * rows])].append(key)
+
+    def clusters(self) -> List[Tuple[List[Hashable], float]]:
+        """
+        返回所有大小不小于 2 的近似重复簇。
+
+        :return: [(成员 key 列表, 簇内候选对的最低相似度), ...]，按簇大小降序
+        """
+        parent = {key: key for key in self.signatures}
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        min_similarity: Dict[Hashable, float] = {}
+        seen = set()
+        for members in self._buckets.values():
+            if len(members) < 2:
+                continue
+            for i in range(len(members)):
+                for j in range(i + 1, len(members)):
+                    pair = (members[i], members[j])
+                    if pair in seen:
+                        continue
+                    seen.add(pair)
+                    sim = estimate_similarity(self.signatures[pair[0]], self.signatures[pair[1]])
+                    if sim < self.threshold:
+                        continue
+                    root_a, root_b = find(pair[0]), find(pair[1])
+                    low = min(sim, min_similarity.get(root_a, 1.0), min_similarity.get(root_b, 1.0))
+                    if root_a != root_b:
+                        parent[root_b] = root_a
+                    min_similarity[root_a] = low
+
+        groups: Dict[Hashable, List[Hashable]] = defaultdict(list)
+        for key in self.signatures:
+            groups[find(key)].append(key)
+        result = [(members, min_similarity.get(root, 1.0))
+                  for root, members in groups.items() if len(members) > 1]
+        result.sort(key=lambda item: len(item[0]), reverse=True)
+        return result
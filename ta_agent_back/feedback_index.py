@@ -0,0 +1,147 @@
+"""
+反馈输出目录的内存索引，供 main1.py 中的 API 使用。
+
+输出目录中的反馈文件名形如 '{学号}_{作业名}_feedback.md'（见 tools.GradingJob.output_filename）。
+索引按 学号 -> 作业名 -> 条目 组织；refresh() 只在目录的 mtime 变化时重新扫描，
+并且只重新读取新增或修改过的文件，查询本身只是字典查找。
+"""
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+FEEDBACK_FILE_RE = re.compile(r"^(?P<student_id>[^_]+)_(?P<assignment>.+)_feedback\.md$")
+_SCORE_RE = re.compile(r"\*\*建议分数\*\*:\s*(.+)")
+# 分数位于报告开头的学生信息部分，建索引时只读取文件开头
+_HEAD_BYTES = 4096
+
+
+@dataclass
+class FeedbackEntry:
+    student_id: str
+    assignment: str
+    filename: str
+    path: Path
+    mtime_ns: int
+    size: int
+    score: Optional[str] = None
+    _content: Optional[bytes] = field(default=None, repr=False)
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.size:x}-{self.mtime_ns:x}"'
+
+    def content(self) -> str:
+        """读取报告全文，读取后缓存在内存中（文件变化时整个条目会被替换）。"""
+        if self._content is None:
+            self._content = self.path.read_bytes()
+        return self._content.decode("utf-8", errors="replace")
+
+    def summary(self) -> Dict[str, Optional[str]]:
+        return {"filename": self.filename, "assignment": self.assignment,
+                "path": str(self.path), "score": self.score}
+
+
+def _read_score(path: Path) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            head = f.read(_HEAD_BYTES).decode("utf-8", errors="replace")
+    except OSError:
+        return None
+    match = _SCORE_RE.search(head)
+    return match.group(1).strip() if match else None
+
+
+class FeedbackIndex:
+    """
+    反馈目录的内存索引。
+
+    :param root: 反馈输出目录（与 MainLoader.output_path 相同）
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.by_student: Dict[str, Dict[str, FeedbackEntry]] = {}
+        self.by_assignment: Dict[str, Dict[str, FeedbackEntry]] = {}
+        self.version = 0
+        self._dir_mtime_ns: Optional[int] = None
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        增量更新索引。目录 mtime 未变化时（没有文件被创建、删除或替换）直接返回。
+
+        :return: 索引是否发生了变化
+        """
+        try:
+            dir_mtime = self.root.stat().st_mtime_ns
+        except FileNotFoundError:
+            changed = bool(self.by_student)
+            self.by_student, self.by_assignment, self._dir_mtime_ns = {}, {}, None
+            if changed:
+                self.version += 1
+            return changed
+        if not force and dir_mtime == self._dir_mtime_ns:
+            return False
+        self._dir_mtime_ns = dir_mtime
+
+        seen = set()
+        changed = False
+        with os.scandir(self.root) as it:
+            for dirent in it:
+                match = FEEDBACK_FILE_RE.match(dirent.name)
+                if match is None or not dirent.is_file():
+                    continue
+                student_id, assignment = match.group("student_id"), match.group("assignment")
+                seen.add((student_id, assignment))
+                stat = dirent.stat()
+                current = self.by_student.get(student_id, {}).get(assignment)
+                if current is not None and current.mtime_ns == stat.st_mtime_ns and current.size == stat.st_size:
+                    continue
+                path = Path(dirent.path)
+                self._put(FeedbackEntry(student_id, assignment, dirent.name, path,
+                                        stat.st_mtime_ns, stat.st_size, _read_score(path)))
+                changed = True
+
+        for student_id, assignments in list(self.by_student.items()):
+            for assignment in list(assignments):
+                if (student_id, assignment) not in seen:
+                    self._remove(student_id, assignment)
+                    changed = True
+        if changed:
+            self.version += 1
+        return changed
+
+    def _put(self, entry: FeedbackEntry):
+        self.by_student.setdefault(entry.student_id, {})[entry.assignment] = entry
+        self.by_assignment.setdefault(entry.assignment, {})[entry.student_id] = entry
+
+    def _remove(self, student_id: str, assignment: str):
+        del self.by_student[student_id][assignment]
+        if not self.by_student[student_id]:
+            del self.by_student[student_id]
+        del self.by_assignment[assignment][student_id]
+        if not self.by_assignment[assignment]:
+            del self.by_assignment[assignment]
+
+    def get(self, student_id: str, assignment: str) -> Optional[FeedbackEntry]:
+        return self.by_student.get(student_id, {}).get(assignment)
+
+    def student_entries(self, student_id: str) -> List[FeedbackEntry]:
+        assignments = self.by_student.get(student_id, {})
+        return [assignments[name] for name in sorted(assignments)]
+
+    def assignment_entries(self, assignment: str) -> List[FeedbackEntry]:
+        students = self.by_assignment.get(assignment, {})
+        return [students[student_id] for student_id in sorted(students)]
+
+    @staticmethod
+    def combined_etag(entries: List[FeedbackEntry]) -> str:
+        """一组条目的 ETag，任一条目新增、删除或修改都会改变。"""
+        digest = hashlib.sha1("|".join(f"{e.filename}:{e.etag}" for e in entries).encode("utf-8"))
+        return f'W/"{digest.hexdigest()[:16]}"'
+
+    def stats(self) -> Tuple[int, int]:
+        """:return: (学生数, 报告数)"""
+        return len(self.by_student), sum(len(a) for a in self.by_student.values())
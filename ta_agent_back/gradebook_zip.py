@@ -0,0 +1,89 @@
+"""
+直接读取 Blackboard 导出的 gradebook ZIP，无需先解压到磁盘。
+
+ZipFile 打开时只读取 ZIP 末尾的中央目录（central directory），据此建立
+成员名 -> ZipInfo 的索引；成员内容只有在被访问时才会解压和解码。
+关闭后再读取成员（例如延迟读取的源码）会重新打开 ZIP，索引保持不变。
+"""
+import posixpath
+import threading
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class GradebookZip:
+    """
+    一个 Blackboard gradebook 导出 ZIP 的只读视图。
+
+    :param path: ZIP 文件路径
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._zip: Optional[zipfile.ZipFile] = zipfile.ZipFile(self.path)
+        self.members: Dict[str, zipfile.ZipInfo] = {}
+        for info in self._zip.infolist():
+            if info.is_dir():
+                continue
+            self.members[self._member_name(info)] = info
+
+    @staticmethod
+    def _member_name(info: zipfile.ZipInfo) -> str:
+        """
+        未设置 UTF-8 标志位的成员名会被 zipfile 按 cp437 解码；
+        Blackboard 实际写入的是 UTF-8，这里尝试还原。
+        """
+        if info.flag_bits & 0x800:
+            return info.filename
+        try:
+            return info.filename.encode('cp437').decode('utf-8')
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            return info.filename
+
+    @staticmethod
+    def is_gradebook_zip(path: Path) -> bool:
+        path = Path(path)
+        return path.suffix.lower() == ".zip" and path.is_file() and zipfile.is_zipfile(path)
+
+    def txt_members(self) -> List[str]:
+        """按中央目录顺序返回所有 .txt 提交记录成员名。"""
+        return [name for name in self.members if name.lower().endswith(".txt")]
+
+    def resolve(self, base_member: str, filename: str) -> str:
+        """返回与 base_member 同一目录下名为 filename 的成员名。"""
+        return posixpath.join(posixpath.dirname(base_member), filename)
+
+    def exists(self, name: str) -> bool:
+        return name in self.members
+
+    def read_bytes(self, name: str, max_bytes: Optional[int] = None) -> bytes:
+        """
+        解压并读取一个成员。
+
+        :param max_bytes: 最多读取的字节数，None 表示读取全部；超大的成员不会被整体解压到内存
+        """
+        with self._archive().open(self.members[name]) as f:
+            return f.read(max_bytes) if max_bytes is not None else f.read()
+
+    def _archive(self) -> zipfile.ZipFile:
+        with self._lock:
+            if self._zip is None:
+                self._zip = zipfile.ZipFile(self.path)
+            return self._zip
+
+    def read_text(self, name: str, encoding: str = 'utf-8') -> str:
+        return self.read_bytes(name).decode(encoding)
+
+    def close(self):
+        with self._lock:
+            if self._zip is not None:
+                self._zip.close()
+                self._zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
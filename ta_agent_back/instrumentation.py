@@ -0,0 +1,177 @@
+"""
+评阅流水线各阶段的计时、计数与性能剖析。
+
+各阶段（解析 TXT、读取源文件、构造提示词、调用模型、提取分数、写反馈文件等）用
+stages.timer("阶段名") 包起来，运行结束时输出每个阶段的次数、总耗时和 p50/p95/p99，
+并导出为 JSON 和 Prometheus 文本格式。
+
+对同步阶段可以开启 cProfile：profile_stages 中列出的阶段会累计到各自的 Profile 中，
+运行结束时保存为 .prof 文件，可以用 `python -m pstats` 或 snakeviz 查看。
+"""
+import cProfile
+import functools
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+from run_manifest import atomic_write_text
+
+# 阶段名 -> 说明（决定汇总表中的显示顺序）
+STAGES = {
+    "parse_txt": "解析 TXT 记录",
+    "read_source": "读取源文件",
+    "compile_check": "本地编译检查",
+    "build_prompt": "构造提示词",
+    "llm": "调用模型",
+    "score": "提取分数",
+    "write": "写反馈文件",
+}
+# 在协程中跨越 await 的阶段，cProfile 会把其间事件循环执行的其他任务也算进去，因此不支持剖析
+UNPROFILABLE = {"llm", "compile_check"}
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """values 须已排序。"""
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class StageMetrics:
+    """
+    线程安全的阶段计时器和计数器。
+
+    :param profile_stages: 需要用 cProfile 剖析的阶段名
+    """
+
+    def __init__(self, profile_stages: Iterable[str] = ()):
+        self._lock = threading.Lock()
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        # 同一时刻只允许一个 Profile 处于启用状态（Python 3.12 起 cProfile 是全局的）
+        self._profiling = threading.Lock()
+        self.set_profile_stages(profile_stages)
+
+    def set_profile_stages(self, profile_stages: Iterable[str]):
+        self.profiles = {}
+        for stage in profile_stages:
+            if stage in UNPROFILABLE:
+                print(f"警告: 阶段 {stage} 跨越 await，不支持 cProfile 剖析，已忽略")
+                continue
+            self.profiles[stage] = cProfile.Profile()
+
+    def reset(self):
+        """清空计时和计数（剖析结果保留）。"""
+        with self._lock:
+            self.durations.clear()
+            self.counters.clear()
+
+    @contextmanager
+    def timer(self, stage: str):
+        """统计 with 块的耗时；该阶段开启了剖析且当前没有其他剖析在进行时，同时记录 cProfile 数据。"""
+        profile = self.profiles.get(stage)
+        if profile is not None and not self._profiling.acquire(blocking=False):
+            profile = None
+        started = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._profiling.release()
+            self.observe(stage, time.perf_counter() - started)
+
+    def timed(self, stage: str):
+        """装饰器：统计同步函数每次调用的耗时。"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            self.durations[stage].append(seconds)
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """:return: 阶段名 -> {count, total, mean, p50, p95, p99}（耗时单位为秒）"""
+        with self._lock:
+            snapshot = {stage: sorted(values) for stage, values in self.durations.items() if values}
+        order = list(STAGES) + sorted(set(snapshot) - set(STAGES))
+        result = {}
+        for stage in order:
+            values = snapshot.get(stage)
+            if not values:
+                continue
+            total = sum(values)
+            result[stage] = {"count": len(values), "total": total, "mean": total / len(values),
+                             **{f"p{round(q * 100)}": percentile(values, q) for q in QUANTILES}}
+        return result
+
+    def print_summary(self):
+        summary = self.summary()
+        if not summary:
+            return
+        print("\n各阶段耗时:")
+        print(f"  {'阶段':<14}{'次数':>8}{'总计(s)':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+        for stage, s in summary.items():
+            print(f"  {STAGES.get(stage, stage):<14}{s['count']:>8}{s['total']:>10.2f}"
+                  f"{s['p50'] * 1000:>10.1f}{s['p95'] * 1000:>10.1f}{s['p99'] * 1000:>10.1f}")
+        with self._lock:
+            counters = dict(self.counters)
+        if counters:
+            print("  计数: " + "，".join(f"{name} {value:g}" for name, value in sorted(counters.items())))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        return {"stages": self.summary(), "counters": counters}
+
+    def to_prometheus(self, prefix: str = "ta_agent") -> str:
+        """Prometheus 文本格式（可由 node_exporter 的 textfile collector 读取）。"""
+        lines = [f"# HELP {prefix}_stage_seconds Time spent in each grading stage.",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        for stage, s in self.summary().items():
+            for q in QUANTILES:
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q}"}} '
+                             f'{s[f"p{round(q * 100)}"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {s["total"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+        with self._lock:
+            counters = sorted(self.counters.items())
+        if counters:
+            lines += [f"# HELP {prefix}_events_total Pipeline event counters.",
+                      f"# TYPE {prefix}_events_total counter"]
+            lines += [f'{prefix}_events_total{{name="{name}"}} {value:g}' for name, value in counters]
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory: Path) -> Path:
+        """
+        写出 metrics.json、metrics.prom 以及各剖析阶段的 profile_<阶段>.prof。
+
+        :return: 写入的目录
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(directory / "metrics.json", json.dumps(self.to_dict(), ensure_ascii=False, indent=2))
+        atomic_write_text(directory / "metrics.prom", self.to_prometheus())
+        for stage, profile in self.profiles.items():
+            if profile.getstats():
+                profile.dump_stats(str(directory / f"profile_{stage}.prof"))
+        return directory
+
+
+# 全局实例：学生记录在线程池中加载，各阶段都向这里汇报
+stages = StageMetrics()
@@ -0,0 +1,127 @@
+"""
+反馈报告查询 API（前端 src/App.tsx 使用）。
+
+启动：
+    uv run -m uvicorn main1:app --host 0.0.0.0 --port 8000
+
+启动时为反馈输出目录建立内存索引，之后在后台定期增量更新；每次查询只是索引查找，
+不会重新扫描目录。响应带 ETag，支持 If-None-Match 条件请求（返回 304），较大的响应使用 gzip 压缩。
+
+环境变量：
+- TA_FEEDBACK_DIR: 反馈输出目录，默认 ./feedback_output（与 MainLoader.output_path 相同）
+- TA_FEEDBACK_REFRESH: 检查目录变化的间隔（秒），默认 2
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response
+
+from feedback_index import FeedbackIndex
+
+FEEDBACK_DIR = Path(os.environ.get("TA_FEEDBACK_DIR", "./feedback_output"))
+REFRESH_INTERVAL = float(os.environ.get("TA_FEEDBACK_REFRESH", "2"))
+# 每隔这么多次检查强制完整扫描一次，以发现原地修改（未改变目录 mtime）的文件
+FULL_RESCAN_EVERY = 30
+
+index = FeedbackIndex(FEEDBACK_DIR)
+
+
+async def _refresh_loop():
+    ticks = 0
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL)
+        ticks += 1
+        try:
+            index.refresh(force=ticks % FULL_RESCAN_EVERY == 0)
+        except OSError as e:
+            print(f"警告: 更新反馈索引失败: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    index.refresh(force=True)
+    students, reports = index.stats()
+    print(f"反馈索引: {FEEDBACK_DIR.resolve()}，{students} 个学生，{reports} 份报告")
+    task = asyncio.create_task(_refresh_loop())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+
+# 处理函数都定义为 async，与 _refresh_loop 同在事件循环线程中运行，读取索引时不会与更新交错
+app = FastAPI(title="TA Agent Feedback API", lifespan=lifespan)
+# 前端由 vite 在另一个端口提供
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["GET"], allow_headers=["*"],
+                   expose_headers=["ETag"])
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+
+def _not_modified(request: Request, etag: str) -> Optional[Response]:
+    """If-None-Match 与 etag 相同时返回 304 响应，否则返回 None。"""
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+def _conditional_json(request: Request, payload: Dict[str, Any], etag: str) -> Response:
+    """返回带 ETag 的 JSON；客户端已有相同版本时返回 304。"""
+    return _not_modified(request, etag) or JSONResponse(payload, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+@app.get("/api/feedback/{student_id}")
+async def list_feedback(student_id: str, request: Request):
+    """列出某个学生的所有反馈报告。"""
+    entries = index.student_entries(student_id.strip())
+    if not entries:
+        raise HTTPException(status_code=404, detail="未找到该学号的反馈报告")
+    payload = {"student_id": student_id.strip(), "feedbacks": [entry.summary() for entry in entries]}
+    return _conditional_json(request, payload, FeedbackIndex.combined_etag(entries))
+
+
+@app.get("/api/feedback/{student_id}/{assignment}")
+async def get_feedback(student_id: str, assignment: str, request: Request):
+    """返回某个学生某次作业的反馈报告全文。"""
+    entry = index.get(student_id.strip(), assignment)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="未找到该反馈报告")
+    # 客户端已有相同版本时不读取报告内容
+    not_modified = _not_modified(request, entry.etag)
+    if not_modified is not None:
+        return not_modified
+    try:
+        content = entry.content()
+    except FileNotFoundError:
+        index.refresh(force=True)
+        raise HTTPException(status_code=404, detail="未找到该反馈报告")
+    payload = {"student_id": entry.student_id, "assignment": entry.assignment, "filename": entry.filename,
+               "score": entry.score, "content": content}
+    return _conditional_json(request, payload, entry.etag)
+
+
+@app.get("/api/assignments")
+async def list_assignments(request: Request):
+    """列出所有作业及其报告数。"""
+    payload = {"assignments": [
+        {"assignment": name, "count": len(index.by_assignment[name])} for name in sorted(index.by_assignment)
+    ]}
+    return _conditional_json(request, payload, f'W/"v{index.version}"')
+
+
+@app.get("/api/assignments/{assignment}")
+async def list_assignment_scores(assignment: str, request: Request):
+    """列出某次作业所有学生的建议分数。"""
+    entries = index.assignment_entries(assignment)
+    if not entries:
+        raise HTTPException(status_code=404, detail="未找到该作业的反馈报告")
+    payload = {"assignment": assignment, "students": [
+        {"student_id": entry.student_id, "filename": entry.filename, "score": entry.score} for entry in entries
+    ]}
+    return _conditional_json(request, payload, FeedbackIndex.combined_etag(entries))
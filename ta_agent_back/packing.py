@@ -0,0 +1,109 @@
+"""
+多份提交打包评阅。
+
+对于 pa6p1.c 这类很短的入门程序，每个请求的固定开销（系统提示词、题目描述、连接与排队）
+远大于学生代码本身。打包模式把同一题目的 K 份提交放进一个请求，要求模型返回如下 JSON：
+
+    {"results": [{"id": "S1", "feedback": "...", "score": 85}, ...]}
+
+返回结果校验失败时由调用方回退为逐份评阅。
+"""
+import json
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 放在打包请求最后一条消息的开头，说明打包模式的输出格式（前缀消息保持与逐份评阅相同）
+PACK_INSTRUCTIONS = """
+本次请求包含一份或多份互相独立的学生提交，每份以 "### 提交 S<编号>" 形式的标题开头。
+请分别评阅每一份提交，评阅内容与单份评阅时的要求完全相同，不要在不同提交之间互相比较。
+只输出一个 JSON 对象，不要输出任何其他内容，格式为：
+{"results": [{"id": "S1", "feedback": "该提交的完整评阅意见（Markdown）", "score": 0 到 100 的整数}, ...]}
+results 中必须恰好包含每一份提交各一项。"""
+
+# 供支持 json_schema 的服务端使用的响应格式
+PACK_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "feedback": {"type": "string"},
+                    "score": {"type": "integer", "minimum": 0, "maximum": 100},
+                },
+                "required": ["id", "feedback", "score"],
+            },
+        },
+    },
+    "required": ["results"],
+}
+
+_JSON_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*```\s*$", re.S)
+
+
+class PackValidationError(ValueError):
+    """打包请求的返回内容不符合约定的 JSON 格式。"""
+
+
+def pack_ids(count: int) -> List[str]:
+    return [f"S{i + 1}" for i in range(count)]
+
+
+def build_pack_message(codes: Sequence[str], reports: Optional[Sequence[Optional[str]]] = None) -> str:
+    """
+    将多份学生代码拼成打包请求的最后一条用户消息。
+
+    :param reports: 与 codes 一一对应的本地编译检查摘要（可选）
+    """
+    parts = []
+    reports = reports or [None] * len(codes)
+    for pack_id, code, report in zip(pack_ids(len(codes)), codes, reports):
+        part = f"### 提交 {pack_id}\n```c\n{code}\n```"
+        if report:
+            part += f"\n{report}"
+        parts.append(part)
+    parts.append(f"请按要求以 JSON 格式返回以上 {len(codes)} 份提交的评阅结果。")
+    return "\n\n".join(parts)
+
+
+def parse_pack_response(text: str, ids: Sequence[str]) -> Dict[str, Tuple[str, int]]:
+    """
+    解析并校验打包请求的返回内容。
+
+    :param text: 模型输出的文本
+    :param ids: 本次请求中各提交的编号
+    :return: 编号 -> (评阅意见, 分数)
+    :raises PackValidationError: JSON 无法解析、缺少/多出提交或字段类型不正确
+    """
+    fenced = _JSON_FENCE_RE.match(text or "")
+    if fenced:
+        text = fenced.group(1)
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError) as e:
+        raise PackValidationError(f"无法解析 JSON: {e}") from e
+    results = data.get("results") if isinstance(data, dict) else None
+    if not isinstance(results, list):
+        raise PackValidationError("缺少 results 数组")
+
+    parsed: Dict[str, Tuple[str, int]] = {}
+    for item in results:
+        if not isinstance(item, dict):
+            raise PackValidationError("results 中包含非对象元素")
+        pack_id, feedback, score = item.get("id"), item.get("feedback"), item.get("score")
+        if pack_id not in ids or pack_id in parsed:
+            raise PackValidationError(f"未知或重复的提交编号: {pack_id!r}")
+        if not isinstance(feedback, str) or not feedback.strip():
+            raise PackValidationError(f"{pack_id} 的 feedback 为空")
+        if isinstance(score, str) and score.strip().isdigit():
+            score = int(score.strip())
+        if isinstance(score, bool) or not isinstance(score, int) or not 0 <= score <= 100:
+            raise PackValidationError(f"{pack_id} 的 score 不是 0~100 的整数: {score!r}")
+        parsed[pack_id] = (feedback, score)
+
+    missing = [pack_id for pack_id in ids if pack_id not in parsed]
+    if missing:
+        raise PackValidationError(f"缺少提交的评阅结果: {', '.join(missing)}")
+    return parsed
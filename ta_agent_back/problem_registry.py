@@ -0,0 +1,183 @@
+"""
+题目注册表：根据学生提交的文件名找到对应的题目。
+
+匹配规则在注册时预先编译，常见情况是一次字典查找：
+1. 精确匹配：规范化后的文件名或别名（忽略大小写、扩展名、"(1)" 之类的副本后缀、空格/连字符/下划线）
+2. 正则匹配：题目配置中的 patterns
+3. 模糊匹配：规范化文件名以某个已注册名称开头（例如 'pa6p1_final.c' -> 'pa6p1'）
+"""
+import json
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from compile_check import TestCase
+
+EXACT = "exact"
+PATTERN = "pattern"
+FUZZY = "fuzzy"
+DROPPED = "dropped"
+
+_COPY_SUFFIX_RE = re.compile(r"\s*\(\d+\)$")
+_NON_ALNUM_RE = re.compile(r"[^0-9a-z]+")
+
+
+@dataclass
+class XMLPrompt:
+    problem: str
+    code: str
+    original_filename: str = ""
+    aliases: List[str] = field(default_factory=list)  # 其他可接受的文件名
+    patterns: List[str] = field(default_factory=list)  # 匹配文件名的正则表达式（忽略大小写）
+    tests: List[TestCase] = field(default_factory=list)  # 本地编译检查使用的测试用例
+
+
+def normalize_filename(filename: str) -> str:
+    """
+    规范化文件名：去掉目录和扩展名、副本后缀 "(1)"，转小写并移除非字母数字字符。
+
+    例如 'PA6P1 (1).c' -> 'pa6p1'，'pa6-p1.c' -> 'pa6p1'。
+    """
+    name = filename.replace("\\", "/").rsplit("/", 1)[-1]
+    if "." in name:
+        name = name.rsplit(".", 1)[0]
+    name = _COPY_SUFFIX_RE.sub("", name)
+    return _NON_ALNUM_RE.sub("", name.lower())
+
+
+class ProblemRegistry:
+    """
+    题目注册表，并统计每次运行的匹配情况。
+    """
+
+    def __init__(self, prompts: Optional[List[XMLPrompt]] = None):
+        self.prompts: List[XMLPrompt] = []
+        self._exact: Dict[str, XMLPrompt] = {}
+        self._patterns: List[Tuple[Pattern, XMLPrompt]] = []
+        # 按名称长度降序，模糊匹配时优先最长前缀
+        self._prefixes: List[Tuple[str, XMLPrompt]] = []
+        self._memo: Dict[str, Tuple[Optional[XMLPrompt], str]] = {}
+        self.stats: Counter = Counter()
+        self.dropped: Counter = Counter()
+        for prompt in prompts or []:
+            self.add(prompt)
+
+    def add(self, prompt: XMLPrompt):
+        """注册一个题目，预先计算其规范化名称并编译正则。"""
+        self.prompts.append(prompt)
+        for name in [prompt.original_filename, *prompt.aliases]:
+            key = normalize_filename(name)
+            if not key:
+                continue
+            if key in self._exact and self._exact[key] is not prompt:
+                print(f"警告: 题目文件名 '{name}' 与已注册的题目冲突，将覆盖之前的题目。")
+            self._exact[key] = prompt
+            self._prefixes.append((key, prompt))
+        for pattern in prompt.patterns:
+            self._patterns.append((re.compile(pattern, re.IGNORECASE), prompt))
+        self._prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+        self._memo.clear()
+
+    def lookup(self, filename: str) -> Tuple[Optional[XMLPrompt], str]:
+        """
+        查找文件名对应的题目（不计入统计）。
+
+        :return: (题目或 None, 匹配方式 EXACT/PATTERN/FUZZY/DROPPED)
+        """
+        cached = self._memo.get(filename)
+        if cached is not None:
+            return cached
+
+        key = normalize_filename(filename)
+        result: Tuple[Optional[XMLPrompt], str] = (None, DROPPED)
+        prompt = self._exact.get(key)
+        if prompt is not None:
+            result = (prompt, EXACT)
+        else:
+            for regex, candidate in self._patterns:
+                if regex.search(filename):
+                    result = (candidate, PATTERN)
+                    break
+            else:
+                for prefix, candidate in self._prefixes:
+                    # 'pa6p10' 不应匹配到 'pa6p1'
+                    if key.startswith(prefix) and not key[len(prefix):len(prefix) + 1].isdigit():
+                        result = (candidate, FUZZY)
+                        break
+        self._memo[filename] = result
+        return result
+
+    def match(self, filename: str) -> Optional[XMLPrompt]:
+        """查找文件名对应的题目，并记录到本次运行的统计中。"""
+        prompt, kind = self.lookup(filename)
+        self.stats[kind] += 1
+        if prompt is None:
+            self.dropped[filename] += 1
+        return prompt
+
+    def reset_stats(self):
+        self.stats.clear()
+        self.dropped.clear()
+
+    def summary(self) -> str:
+        """返回本次运行的匹配统计文字。"""
+        text = (f"题目匹配: 精确 {self.stats[EXACT]}，正则 {self.stats[PATTERN]}，"
+                f"模糊 {self.stats[FUZZY]}，未匹配(已跳过) {self.stats[DROPPED]}")
+        if self.dropped:
+            top = ", ".join(f"{name} x{count}" for name, count in self.dropped.most_common(10))
+            text += f"\n  未匹配的文件名: {top}"
+        return text
+
+    @classmethod
+    def load_from_dir(cls, path: Path) -> "ProblemRegistry":
+        """
+        从题目目录加载注册表。目录下需要有 problems.json，格式为:
+
+            {"problems": [
+                {"filename": "pa6p1.c",
+                 "aliases": ["part1.c"],
+                 "patterns": ["^pa6.?p1"],
+                 "problem_file": "pa6p1.txt",   // 或者直接用 "problem": "题目文本"
+                 "tests": [{"name": "1", "input": "1 2 3 4 5\n", "expected": "1 5 3.000000\n"}],
+                 "tests_dir": "pa6p1_tests"}    // 可选，目录下的 NAME.in / NAME.out 成对作为测试用例
+            ]}
+
+        problem_file 和 tests_dir 相对于题目目录。
+        """
+        path = Path(path)
+        manifest_path = path / "problems.json" if path.is_dir() else path
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        registry = cls()
+        for entry in manifest.get("problems", []):
+            problem = entry.get("problem")
+            if problem is None and entry.get("problem_file"):
+                with open(manifest_path.parent / entry["problem_file"], 'r', encoding='utf-8') as f:
+                    problem = f.read()
+            tests = [TestCase(name=str(test.get("name", i + 1)), input=test.get("input", ""),
+                              expected=test.get("expected"))
+                     for i, test in enumerate(entry.get("tests", []))]
+            if entry.get("tests_dir"):
+                tests.extend(cls._load_tests_dir(manifest_path.parent / entry["tests_dir"]))
+            registry.add(XMLPrompt(
+                problem=problem or "",
+                code="",
+                original_filename=entry["filename"],
+                aliases=list(entry.get("aliases", [])),
+                patterns=list(entry.get("patterns", [])),
+                tests=tests
+            ))
+        return registry
+
+    @staticmethod
+    def _load_tests_dir(tests_dir: Path) -> List[TestCase]:
+        """读取目录下成对的 NAME.in / NAME.out 测试文件（缺少 .out 时只检查程序能否正常结束）。"""
+        tests = []
+        for input_path in sorted(Path(tests_dir).glob("*.in")):
+            output_path = input_path.with_suffix(".out")
+            expected = output_path.read_text(encoding='utf-8') if output_path.exists() else None
+            tests.append(TestCase(name=input_path.stem, input=input_path.read_text(encoding='utf-8'),
+                                  expected=expected))
+        return tests
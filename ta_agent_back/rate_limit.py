@@ -0,0 +1,128 @@
+"""
+异步并发控制与限流工具。
+
+- TokenBucket: 按分钟配额匀速补充的令牌桶。
+- RateLimiter: 同时约束每分钟请求数 (RPM) 和每分钟 token 数 (TPM)。
+- AdaptiveConcurrency: 可动态收缩/恢复的并发上限，遇到 429 时减半，连续成功后逐步恢复。
+"""
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """一个按 per_minute 速率补充的令牌桶，容量等于一分钟的配额。"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self, amount: float = 1.0):
+        """
+        取出 amount 个令牌，不足时等待补充。
+
+        :param amount: 需要的令牌数，超过容量时按容量计算，避免永久等待。
+        """
+        amount = min(float(amount), self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def give_back(self, amount: float):
+        """归还预占但未实际使用的令牌（例如预估 token 数偏大时）。"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + max(0.0, amount))
+
+
+class RateLimiter:
+    """
+    同时执行 RPM 与 TPM 限制。任一限制为 None 表示不限制。
+    """
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    async def acquire(self, estimated_tokens: int = 0):
+        """在发出请求前调用：占用 1 个请求配额以及 estimated_tokens 个 token 配额。"""
+        if self.requests is not None:
+            await self.requests.take(1)
+        if self.tokens is not None and estimated_tokens > 0:
+            await self.tokens.take(estimated_tokens)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """请求完成后，用实际 token 用量修正预估值。"""
+        if self.tokens is None or actual_tokens is None:
+            return
+        if actual_tokens < estimated_tokens:
+            self.tokens.give_back(estimated_tokens - actual_tokens)
+        else:
+            self.tokens.tokens -= actual_tokens - estimated_tokens
+
+
+class AdaptiveConcurrency:
+    """
+    一个上限可变的异步信号量。
+
+    - on_rate_limited(): 遇到 429 时将上限减半（不低于 min_limit）。
+    - on_success(): 每累计 `limit` 次成功，上限加 1（不超过 max_limit）。
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = asyncio.Condition()
+        self._wake_task: Optional[asyncio.Task] = None  # 保留引用，避免任务在完成前被回收
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._cond:
+            self.in_flight -= 1
+            # 只唤醒能拿到名额的等待者；notify_all 会让排队的全部任务逐个醒来再睡下，任务多时是平方级开销
+            self._cond.notify(max(0, self.limit - self.in_flight))
+
+    def on_rate_limited(self):
+        new_limit = max(self.min_limit, self.limit // 2)
+        if new_limit != self.limit:
+            print(f"    触发限流，并发数 {self.limit} -> {new_limit}")
+        self.limit = new_limit
+        self._successes = 0
+
+    def on_success(self):
+        if self.limit >= self.max_limit:
+            return
+        self._successes += 1
+        if self._successes >= self.limit:
+            self.limit += 1
+            self._successes = 0
+            # 上限提高后唤醒等待者，否则它们要等到下一次释放名额才会醒来；
+            # notify 必须持有锁，而 on_success 是同步调用的，因此交给一个任务执行
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            self._wake_task = loop.create_task(self._wake())
+
+    async def _wake(self):
+        async with self._cond:
+            self._cond.notify(max(0, self.limit - self.in_flight))
@@ -0,0 +1,169 @@
+"""
+模型调用的容错工具。
+
+- classify_error: 将异常分为可重试（限流、5xx、超时、连接错误）与不可重试（参数错误、鉴权失败等）。
+- backoff_delay: 带随机抖动的指数退避，优先使用服务端返回的 Retry-After。
+- CircuitBreaker: 连续多次服务端/网络错误后熔断，暂停所有请求，等待一段时间后放行一个探测请求。
+"""
+import asyncio
+import random
+import time
+from typing import Optional
+
+import httpx
+from openai import (APIConnectionError, APIStatusError, APITimeoutError,
+                    InternalServerError, RateLimitError)
+
+RATE_LIMIT = "rate_limit"
+SERVER_ERROR = "server_error"
+TIMEOUT = "timeout"
+CONNECTION = "connection"
+FATAL = "fatal"
+
+RETRYABLE = {RATE_LIMIT, SERVER_ERROR, TIMEOUT, CONNECTION}
+# 这些错误说明服务端不可用，计入熔断器；限流说明服务端正常，只是需要放慢
+OUTAGE = {SERVER_ERROR, TIMEOUT, CONNECTION}
+ERROR_LABELS = {
+    RATE_LIMIT: "触发限流 (429)",
+    SERVER_ERROR: "服务端错误 (5xx)",
+    TIMEOUT: "请求超时",
+    CONNECTION: "连接失败",
+    FATAL: "请求错误",
+}
+
+
+def classify_error(exc: BaseException) -> str:
+    """返回异常的类别（RATE_LIMIT / SERVER_ERROR / TIMEOUT / CONNECTION / FATAL）。"""
+    if isinstance(exc, RateLimitError):
+        return RATE_LIMIT
+    if isinstance(exc, (APITimeoutError, httpx.TimeoutException, asyncio.TimeoutError)):
+        return TIMEOUT
+    if isinstance(exc, (APIConnectionError, httpx.TransportError)):
+        return CONNECTION
+    if isinstance(exc, InternalServerError):
+        return SERVER_ERROR
+    if isinstance(exc, APIStatusError):
+        # 408 请求超时、409 冲突按可重试处理，其余 4xx 重试也不会成功
+        if exc.status_code in (408, 409) or exc.status_code >= 500:
+            return SERVER_ERROR
+    return FATAL
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """读取响应头中的 Retry-After（秒），没有或无法解析时返回 None。"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0,
+                  retry_after: Optional[float] = None) -> float:
+    """
+    第 attempt 次重试前的等待时间（秒）：min(cap, base * 2^attempt)，乘以 0.5~1.5 的随机抖动。
+
+    :param retry_after: 服务端要求的等待时间，若提供则不少于该值
+    """
+    delay = min(cap, base * 2 ** attempt) * (0.5 + random.random())
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class CircuitOpenError(Exception):
+    """熔断持续时间超过上限，放弃本次请求。"""
+
+
+class CircuitBreaker:
+    """
+    熔断器。
+
+    - closed: 正常放行；连续 failure_threshold 次服务端/网络错误后进入 open。
+    - open: 所有请求在 before_call() 中等待 reset_timeout 秒，然后进入 half-open。
+    - half-open: 只放行一个探测请求；成功则 closed，失败则重新 open，等待时间翻倍（不超过 max_reset_timeout）。
+
+    :param max_open_time: 累计熔断超过该秒数时，before_call() 抛出 CircuitOpenError，避免进程无限期挂起
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_reset_timeout: float = 300.0, max_open_time: float = 1800.0):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.max_open_time = max_open_time
+        self.state = "closed"
+        self.failures = 0
+        self.trips = 0
+        self._opened_at = 0.0
+        self._first_opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._changed = asyncio.Event()
+
+    async def before_call(self):
+        """在发出请求前调用；熔断期间等待，直到可以发送请求（或成为探测请求）。"""
+        while True:
+            if self.state == "closed":
+                return
+            now = time.monotonic()
+            if self._first_opened_at is not None and now - self._first_opened_at > self.max_open_time:
+                raise CircuitOpenError(f"服务端持续不可用超过 {self.max_open_time:.0f} 秒")
+            if self.state == "open" and now - self._opened_at >= self.reset_timeout:
+                self.state = "half-open"
+            if self.state == "half-open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            wait = max(0.1, self._opened_at + self.reset_timeout - now) if self.state == "open" else None
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def available(self) -> bool:
+        """现在调用 before_call() 是否会立即放行（不需要等待熔断结束或探测请求完成）。"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self._opened_at >= self.reset_timeout
+        return not self._probe_in_flight
+
+    def record_success(self):
+        if self.state != "closed":
+            print("    服务端已恢复，继续评阅")
+        self.state = "closed"
+        self.failures = 0
+        self.reset_timeout = self.base_reset_timeout
+        self._first_opened_at = None
+        self._probe_in_flight = False
+        self._changed.set()
+
+    def record_failure(self):
+        """记录一次服务端/网络错误（限流和参数错误不应调用）。"""
+        self.failures += 1
+        if self.state == "half-open":
+            self.reset_timeout = min(self.max_reset_timeout, self.reset_timeout * 2)
+            self._open()
+        elif self.state == "closed" and self.failures >= self.failure_threshold:
+            self._open()
+
+    def release_probe(self):
+        """探测请求因其他原因（例如限流）结束时调用，允许下一个请求继续探测。"""
+        if self._probe_in_flight:
+            self._probe_in_flight = False
+            self._changed.set()
+
+    def _open(self):
+        now = time.monotonic()
+        self.state = "open"
+        self.trips += 1
+        self._opened_at = now
+        if self._first_opened_at is None:
+            self._first_opened_at = now
+        self._probe_in_flight = False
+        print(f"    服务端连续出错 {self.failures} 次，暂停所有请求 {self.reset_timeout:.0f} 秒")
+        self._changed.set()
@@ -0,0 +1,136 @@
+"""
+基于 SQLite 的模型响应缓存。
+
+缓存键是完整请求（model、messages、temperature、max_tokens 等）的 SHA-256，
+因此学生代码、题目、系统提示词、模型或温度任一变化都会产生新的键。
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+class ResponseCache:
+    """
+    一个持久化的响应缓存，支持按条数/总大小（LRU）和按存活时间淘汰。
+
+    :param path: SQLite 数据库文件路径
+    :param max_entries: 最多保留的条目数，None 表示不限制
+    :param max_bytes: 所有缓存内容的总字节数上限，None 表示不限制
+    :param max_age_days: 条目最长保留天数，None 表示不过期
+    """
+
+    def __init__(self, path: Path, max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = 512 * 1024 * 1024,
+                 max_age_days: Optional[float] = 90):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                content TEXT NOT NULL,
+                usage TEXT,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(request: Dict[str, Any]) -> str:
+        """对请求参数做规范化 JSON 序列化后取 SHA-256。"""
+        canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存。
+
+        :return: {"content": str, "usage": dict | None}，未命中时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, usage, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.max_age_days is not None \
+                    and row[2] < time.time() - self.max_age_days * 86400:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return {"content": row[0], "usage": json.loads(row[1]) if row[1] else None}
+
+    def put(self, key: str, content: str, model: str = "", usage: Optional[Dict[str, Any]] = None):
+        """写入一条缓存（已存在则覆盖）。"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, usage, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, content, json.dumps(usage) if usage else None,
+                 len(content.encode('utf-8')), now, now)
+            )
+            self._conn.commit()
+            self.writes += 1
+
+    def evict(self):
+        """按过期时间、条目数和总大小淘汰旧条目（最久未访问的先淘汰）。"""
+        with self._lock:
+            if self.max_age_days is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?",
+                    (time.time() - self.max_age_days * 86400,)
+                )
+            if self.max_entries is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            if self.max_bytes is not None:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC")
+                    doomed = []
+                    for key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        doomed.append((key,))
+                        total -= size
+                    self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """返回命中/未命中/写入计数以及当前条目数和总大小。"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "writes": self.writes,
+                "entries": entries, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,60 @@
+"""
+多次提交（attempt）的处理。
+
+Blackboard 每次提交导出一条 TXT 记录（记录名形如 'PA3_12200000_attempt_2025-10-20-14-29-25.txt'）。
+默认每名学生只评阅 Date Submitted 最晚的一次提交；同一作业文件已经评阅过较早的版本时，
+只把两版代码的差异和上一次的评阅意见发给模型，请它在上一次评阅的基础上更新意见和分数。
+"""
+import difflib
+import re
+from datetime import datetime
+from typing import Optional
+
+LATEST_ATTEMPT = "latest"
+ALL_ATTEMPTS = "all"
+
+_ATTEMPT_RE = re.compile(r"_attempt_(\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})")
+ATTEMPT_STAMP_FORMAT = "%Y-%m-%d-%H-%M-%S"
+# 例如 'Monday, October 20, 2025 02:29:25 PM CST'；末尾的时区缩写在解析前去掉
+_DATE_FORMATS = ("%A, %B %d, %Y %I:%M:%S %p", "%A, %B %d, %Y %H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+# 回复会覆盖反馈文件，并作为下一次增量评阅的"上一次的评阅意见"，因此必须是一份完整、独立的评阅
+REGRADE_INSTRUCTIONS = """该学生此前提交过这份作业，上一版代码已经评阅过。请在上一次评阅的基础上评阅本次提交，
+输出一份完整、独立的评阅意见（学生只会看到这一份，看不到上一次的评阅）：
+先用一小节简要说明本次修改修正了上一次指出的哪些问题、是否引入了新的问题，
+再按完整评阅的格式给出对本次提交全部代码的评阅意见：未改动部分把上一次评阅中仍然成立的结论完整写出
+（不要写"同上一次"之类的引用），改动部分重新分析，
+最后以"建议分数：XX/100"的格式给出本次提交的建议分数。"""
+
+
+def parse_submission_date(text: Optional[str]) -> Optional[datetime]:
+    """解析 Date Submitted 字段（忽略时区），无法解析时返回 None。"""
+    if not text:
+        return None
+    text = text.strip()
+    for candidate in (text, text.rsplit(" ", 1)[0]):
+        for fmt in _DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, fmt)
+            except ValueError:
+                continue
+    return None
+
+
+def attempt_stamp(record_name: str) -> Optional[str]:
+    """记录名中的提交时间戳（'2025-10-20-14-29-25'），没有时返回 None。"""
+    match = _ATTEMPT_RE.search(record_name or "")
+    return match.group(1) if match else None
+
+
+def code_diff(old: str, new: str, context: int = 3) -> str:
+    """两版代码的 unified diff（忽略行尾空白和首尾空行），相同时返回空字符串。"""
+    old_lines = [line.rstrip() for line in old.strip().splitlines()]
+    new_lines = [line.rstrip() for line in new.strip().splitlines()]
+    return "\n".join(difflib.unified_diff(old_lines, new_lines, "上一版", "本次提交", n=context, lineterm=""))
+
+
+def build_regrade_message(previous_feedback: str, diff: str) -> str:
+    """增量评阅时代替完整代码的用户消息。"""
+    return (f"上一次的评阅意见：\n{previous_feedback.strip()}\n\n"
+            f"本次提交相对上一版代码的改动：\n```diff\n{diff}\n```\n\n{REGRADE_INSTRUCTIONS}")
@@ -0,0 +1,233 @@
+"""
+评阅结果库与成绩导出。
+
+每个完成的评阅任务写入一行（学号、Blackboard 作业、文件、提交时间、分数、token 用量、延迟、模型），
+另外保存每个任务最近一次评阅的代码和评阅意见，学生重新提交时用于增量评阅（见 resubmission）。
+评阅所有提交（--all-attempts）时同一学生的同一文件有多行，导出时只取其中最新的一次提交。
+导出时按学号顺序流式读取一遍，同时写出：
+- Blackboard Grade Center 上传用的 CSV（每个 Blackboard 作业一列，按 Username 匹配学生）；
+- 每个作业文件的分数汇总 CSV。
+"""
+import csv
+import re
+import sqlite3
+import statistics
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+_SCORE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(?:/\s*100)?\s*$")
+
+
+def parse_score(score: Optional[str]) -> Optional[float]:
+    """将 '85/100'、'85' 解析为数值；'待评阅' 等无法解析的返回 None。"""
+    match = _SCORE_RE.match(score or "")
+    return float(match.group(1)) if match else None
+
+
+@contextmanager
+def _atomic_csv(path: Path):
+    """写入同目录下的临时文件，成功后再替换目标文件。utf-8-sig 使 Excel 和 Blackboard 都能正确识别中文。"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8-sig", newline="") as f:
+            yield csv.writer(f)
+        tmp_path.replace(path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+class ResultsStore:
+    """
+    基于 SQLite 的评阅结果库。
+
+    :param path: 数据库文件路径（通常位于输出目录下）
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                job_id TEXT PRIMARY KEY,
+                student_id TEXT NOT NULL,
+                student_name TEXT,
+                bb_assignment TEXT,
+                assignment TEXT NOT NULL,
+                submitted_at TEXT,
+                score REAL,
+                score_text TEXT,
+                model TEXT,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                cached_tokens INTEGER,
+                latency REAL,
+                output_file TEXT,
+                graded_at REAL NOT NULL
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(results)")}
+        if "submitted_at" not in columns:
+            # 旧版本创建的结果库没有提交时间列
+            self._conn.execute("ALTER TABLE results ADD COLUMN submitted_at TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_student ON results (student_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_assignment ON results (bb_assignment, assignment)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS versions (
+                job_id TEXT PRIMARY KEY,
+                code_hash TEXT NOT NULL,
+                code TEXT NOT NULL,
+                feedback TEXT NOT NULL,
+                score_text TEXT,
+                graded_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def record(self, job_id: str, student_id: str, student_name: str, bb_assignment: str, assignment: str,
+               score: str, output_file: str, model: str, metrics: Optional[Dict[str, Any]] = None,
+               submitted_at: Optional[str] = None):
+        """
+        写入（或覆盖）一个任务的评阅结果。
+
+        :param score: 建议分数文本，例如 '85/100'
+        :param submitted_at: 提交时间（'2025-10-20-14-29-25'，可按字符串排序），未知时为 None
+        :param metrics: 本次请求的指标（prompt_tokens、completion_tokens、cached_tokens、latency），
+                        复用缓存或同组结果时为 None
+        """
+        metrics = metrics or {}
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO results
+                   (job_id, student_id, student_name, bb_assignment, assignment, submitted_at, score, score_text,
+                    model, prompt_tokens, completion_tokens, cached_tokens, latency, output_file, graded_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (job_id, student_id, student_name, bb_assignment, assignment, submitted_at, parse_score(score),
+                 score, model,
+                 metrics.get("prompt_tokens"), metrics.get("completion_tokens"), metrics.get("cached_tokens"),
+                 metrics.get("latency"), output_file, time.time())
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM results WHERE job_id = ?", (job_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
+
+    def save_version(self, job_id: str, code_hash: str, code: str, feedback: str, score: str):
+        """保存任务本次评阅的代码和评阅意见（覆盖上一次的）。"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO versions (job_id, code_hash, code, feedback, score_text, graded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, code_hash, code, feedback, score, time.time())
+            )
+            self._conn.commit()
+
+    def last_version(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        任务最近一次评阅的版本。
+
+        :return: {"code_hash", "code", "feedback", "score_text", "graded_at"}，没有时返回 None
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT code_hash, code, feedback, score_text, graded_at FROM versions WHERE job_id = ?", (job_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
+
+    def export(self, grades_path: Path, summary_path: Path, points: int = 100,
+               column_ids: Optional[Dict[str, str]] = None) -> Dict[str, int]:
+        """
+        一次遍历导出 Blackboard 成绩上传 CSV 和分数汇总 CSV。
+
+        同一学生的同一文件有多次提交的结果时只取最新的一次（按提交时间，其次按评阅时间）；
+        同一 Blackboard 作业下的多个文件（如 pa6p1.c、pa6p2.c）取平均分；
+        其中任一文件没有分数时该格留空，交由助教手动处理。
+
+        :param points: 成绩列的满分（Blackboard 列标题中的 Total Pts）
+        :param column_ids: Blackboard 作业名 -> 成绩列 ID；提供时列标题带 '|ID'，上传时更新已有列，否则新建列
+        :return: {"students": 导出的学生数, "blank": 留空的成绩格数}
+        """
+        column_ids = column_ids or {}
+        # (Blackboard 作业, 文件) -> 分数列表 / [输入 tokens, 输出 tokens, 延迟之和, 有延迟的请求数, 份数]
+        scores_by_file: Dict[tuple, list] = defaultdict(list)
+        usage_by_file: Dict[tuple, list] = defaultdict(lambda: [0, 0, 0.0, 0, 0])
+        students = blank = 0
+        with self._lock:
+            items = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT COALESCE(bb_assignment, '') FROM results ORDER BY 1")]
+            headers = ["Last Name", "First Name", "Username"]
+            for item in items:
+                title = f"{item or 'Grade'} [Total Pts: {points} Score]"
+                headers.append(f"{title} |{column_ids[item]}" if item in column_ids else title)
+
+            cursor = self._conn.execute(
+                """SELECT student_id, student_name, item, assignment, score, prompt_tokens, completion_tokens, latency
+                   FROM (SELECT *, COALESCE(bb_assignment, '') AS item,
+                                ROW_NUMBER() OVER (PARTITION BY student_id, COALESCE(bb_assignment, ''), assignment
+                                                   ORDER BY COALESCE(submitted_at, '') DESC, graded_at DESC) AS nth
+                         FROM results)
+                   WHERE nth = 1 ORDER BY student_id""")
+            with _atomic_csv(grades_path) as writer:
+                writer.writerow(headers)
+                for student_id, student_rows in groupby(cursor, key=lambda row: row[0]):
+                    per_item: Dict[str, list] = defaultdict(list)
+                    name = ""
+                    for _, student_name, item, assignment, score, prompt_tokens, completion_tokens, latency \
+                            in student_rows:
+                        name = name or student_name or ""
+                        per_item[item].append(score)
+                        key = (item, assignment)
+                        if score is not None:
+                            scores_by_file[key].append(score)
+                        usage = usage_by_file[key]
+                        usage[0] += prompt_tokens or 0
+                        usage[1] += completion_tokens or 0
+                        if latency is not None:
+                            usage[2] += latency
+                            usage[3] += 1
+                        usage[4] += 1
+                    cells = []
+                    for item in items:
+                        values = per_item.get(item)
+                        if values and None not in values:
+                            cells.append(f"{statistics.mean(values):g}")
+                        else:
+                            cells.append("")
+                            blank += values is not None
+                    writer.writerow([name, "", student_id] + cells)
+                    students += 1
+
+        with _atomic_csv(summary_path) as writer:
+            writer.writerow(["Blackboard 作业", "文件", "份数", "有分数", "平均分", "中位数", "最低分", "最高分",
+                             "输入 tokens", "输出 tokens", "平均延迟(秒)"])
+            for key in sorted(usage_by_file):
+                scores = scores_by_file.get(key, [])
+                prompt_tokens, completion_tokens, latency, requests, count = usage_by_file[key]
+                writer.writerow([key[0], key[1], count, len(scores),
+                                 f"{statistics.mean(scores):.1f}" if scores else "",
+                                 f"{statistics.median(scores):g}" if scores else "",
+                                 f"{min(scores):g}" if scores else "",
+                                 f"{max(scores):g}" if scores else "",
+                                 prompt_tokens, completion_tokens,
+                                 f"{latency / requests:.2f}" if requests else ""])
+        return {"students": students, "blank": blank}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
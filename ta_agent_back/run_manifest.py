@@ -0,0 +1,137 @@
+"""
+评阅运行清单（manifest）。
+
+记录每个评阅任务 (student_id, orig_name, code_hash) 的状态，使中断后的运行可以续跑：
+已完成的任务直接跳过，失败或中断的任务重新执行。
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+PENDING = "pending"
+IN_FLIGHT = "in-flight"
+DONE = "done"
+FAILED = "failed"
+
+
+def atomic_write_text(path: Path, content: str, encoding: str = 'utf-8'):
+    """
+    原子地写入文本文件：先写同目录下的临时文件并 fsync，再 os.replace 到目标路径。
+    进程在任何时刻崩溃都不会留下写了一半的目标文件。
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding) as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class RunManifest:
+    """
+    基于 SQLite 的任务状态表。
+
+    :param path: 清单文件路径（通常位于输出目录下）
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                student_id TEXT,
+                orig_name TEXT,
+                code_hash TEXT,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                output_file TEXT,
+                score TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_job_id(student_id: str, orig_name: str, attempt: str = "") -> str:
+        """:param attempt: 评阅所有提交时的提交标签，只评阅最新提交时为空"""
+        return f"{student_id}/{attempt}/{orig_name}" if attempt else f"{student_id}/{orig_name}"
+
+    def get(self, job_id: str) -> Optional[Dict[str, object]]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
+
+    def is_done(self, job_id: str, code_hash: str, output_file: Path) -> bool:
+        """任务已完成、代码未变化且输出文件仍然存在时返回 True。"""
+        entry = self.get(job_id)
+        return (entry is not None and entry["state"] == DONE
+                and entry["code_hash"] == code_hash and Path(output_file).exists())
+
+    def register(self, job_id: str, student_id: str, orig_name: str, code_hash: str):
+        """登记一个待处理任务。已存在的任务若代码变化或未完成，则重置为 pending。"""
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO jobs (job_id, student_id, orig_name, code_hash, state, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(job_id) DO UPDATE SET
+                       code_hash = excluded.code_hash,
+                       state = excluded.state,
+                       updated_at = excluded.updated_at""",
+                (job_id, student_id, orig_name, code_hash, PENDING, time.time())
+            )
+            self._conn.commit()
+
+    def mark_in_flight(self, job_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, updated_at = ? WHERE job_id = ?",
+                (IN_FLIGHT, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def mark_done(self, job_id: str, output_file: str, score: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, output_file = ?, score = ?, error = NULL, updated_at = ? "
+                "WHERE job_id = ?",
+                (DONE, output_file, score, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def mark_failed(self, job_id: str, error: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (FAILED, error, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def counts(self) -> Dict[str, int]:
+        """按状态统计任务数。"""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 测试直接导入 ta_agent_back 下的模块（与 tools.py 等脚本的导入方式一致）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
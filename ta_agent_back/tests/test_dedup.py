@@ -0,0 +1,26 @@
+"""重复提交的合并键与查重指纹。"""
+from dedup import exact_fingerprint, fingerprint, normalize_c_tokens
+
+BASE = """#include <stdio.h>
+int main() {
+    int total = 0; // 累加
+    printf("sum = %d\\n", total);
+    return 0;
+}
+"""
+
+
+def test_exact_fingerprint_ignores_whitespace_only():
+    reformatted = BASE.replace("    ", "\t").replace("int total = 0;", "int  total=0;") + "\n\n"
+    assert exact_fingerprint(reformatted) == exact_fingerprint(BASE)
+
+
+def test_exact_fingerprint_keeps_comments_and_names():
+    renamed = BASE.replace("total", "sum")
+    recommented = BASE.replace("// 累加", "// generated by an AI assistant")
+    string_changed = BASE.replace("sum = %d", "sum =  %d")
+    for variant in (renamed, recommented, string_changed):
+        assert exact_fingerprint(variant) != exact_fingerprint(BASE)
+    # 查重报告使用的规范化 token 仍然认为改名、改注释的提交与原提交完全相同
+    assert fingerprint(normalize_c_tokens(renamed)) == fingerprint(normalize_c_tokens(BASE))
+    assert fingerprint(normalize_c_tokens(recommented)) == fingerprint(normalize_c_tokens(BASE))
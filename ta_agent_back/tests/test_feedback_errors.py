@@ -0,0 +1,48 @@
+"""调用模型失败时不能把错误信息当作反馈写出，也不能给出分数。"""
+import socket
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bench"))
+
+from gen_gradebook import GradebookSpec, write_gradebook  # noqa: E402
+from results_store import ResultsStore  # noqa: E402
+from tools import FeedbackError, MainLoader  # noqa: E402
+
+
+def _closed_port_url() -> str:
+    """一个没有服务监听的本地地址，请求会立即连接失败。"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/v1"
+
+
+@pytest.fixture
+def loader(tmp_path):
+    gradebook = write_gradebook(tmp_path / "data", GradebookSpec(students=2, max_attempts=1))
+    return MainLoader(files_path=gradebook, output_path=tmp_path / "out", prompt_path=ROOT / "prompt.md",
+                      problems_path=ROOT / "problems", base_url=_closed_port_url(), api_key="test",
+                      use_cache=False, max_retries=0, requeue_failed=0)
+
+
+def test_sync_call_raises(loader):
+    with pytest.raises(FeedbackError):
+        loader.get_feedback_from_qwen(loader.prompt_list[0].problem, "int main() { return 0; }")
+
+
+def test_failed_jobs_write_no_feedback_or_score(loader, tmp_path):
+    loader.process_all_submissions()
+
+    counts = loader.manifest.counts()
+    assert counts.get("failed", 0) > 0
+    assert not counts.get("done")
+    assert list((tmp_path / "out").rglob("*_feedback.md")) == []
+    store = ResultsStore(tmp_path / "out" / ".results.sqlite3")
+    try:
+        assert store.export(tmp_path / "grades.csv", tmp_path / "summary.csv")["students"] == 0
+    finally:
+        store.close()
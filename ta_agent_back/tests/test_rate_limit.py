@@ -0,0 +1,65 @@
+"""AdaptiveConcurrency 的并发上限与唤醒。"""
+import asyncio
+
+from rate_limit import AdaptiveConcurrency
+
+
+def test_limit_caps_in_flight():
+    async def scenario():
+        gate = AdaptiveConcurrency(max_limit=3)
+        peak = 0
+
+        async def job():
+            nonlocal peak
+            async with gate:
+                peak = max(peak, gate.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(job() for _ in range(10)))
+        return peak, gate.in_flight
+
+    assert asyncio.run(scenario()) == (3, 0)
+
+
+def test_raising_limit_wakes_waiters():
+    """上限提高后，等待中的协程不必等到有人释放名额就能进入。"""
+    async def scenario():
+        gate = AdaptiveConcurrency(max_limit=4)
+        gate.on_rate_limited()
+        assert gate.limit == 2
+
+        release = asyncio.Event()
+        entered = []
+
+        async def holder():
+            async with gate:
+                await release.wait()
+
+        async def waiter(i):
+            async with gate:
+                entered.append(i)
+                await release.wait()
+
+        holders = [asyncio.create_task(holder()) for _ in range(2)]
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(waiter(i)) for i in range(2)]
+        await asyncio.sleep(0.01)
+        assert entered == []
+
+        # 连续成功把上限从 2 恢复到 4，期间没有任何名额被释放
+        for _ in range(2 + 3):
+            gate.on_success()
+        assert gate.limit == 4
+        await asyncio.wait_for(_until(lambda: len(entered) == 2), timeout=1)
+        assert gate.in_flight == 4
+
+        release.set()
+        await asyncio.gather(*holders, *waiters)
+        assert gate.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+async def _until(predicate):
+    while not predicate():
+        await asyncio.sleep(0.001)
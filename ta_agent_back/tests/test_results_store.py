@@ -0,0 +1,29 @@
+"""ResultsStore 的成绩导出。"""
+import csv
+
+from results_store import ResultsStore
+
+
+def _rows(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_export_uses_latest_attempt(tmp_path):
+    store = ResultsStore(tmp_path / "results.sqlite3")
+    # 重新提交后分数提高；较早的提交最后才评阅完，也不能影响导出的成绩
+    store.record("s1|pa1.c|new", "12200001", "Zhang San", "PA1", "pa1", "90/100", "new.md", "mock",
+                 submitted_at="2025-10-21-09-00-00")
+    store.record("s1|pa1.c|old", "12200001", "Zhang San", "PA1", "pa1", "40/100", "old.md", "mock",
+                 submitted_at="2025-10-20-09-00-00")
+    store.record("s1|pa2.c|", "12200001", "Zhang San", "PA1", "pa2", "70/100", "pa2.md", "mock")
+    store.record("s2|pa1.c|", "12200002", "Li Si", "PA1", "pa1", "60/100", "s2.md", "mock")
+
+    result = store.export(tmp_path / "grades.csv", tmp_path / "summary.csv")
+    store.close()
+
+    assert result == {"students": 2, "blank": 0}
+    grades = {row[2]: row[3] for row in _rows(tmp_path / "grades.csv")[1:]}
+    assert grades == {"12200001": "80", "12200002": "60"}
+    summary = {row[1]: row for row in _rows(tmp_path / "summary.csv")[1:]}
+    assert summary["pa1"][2] == "2"  # 每名学生只计最新的一次提交
@@ -0,0 +1,148 @@
+"""
+请求前的 token 预算。
+
+- estimate_tokens: 不依赖分词器的本地 token 估算（中文约 1 字 1 token，英文/代码约 4 个字符 1 token）。
+- compact_source: 确定性地压缩超大的学生代码（省略超长的数组初始化、字符串常量，必要时截去中间部分）。
+- TokenBudget: 根据输入大小决定每个请求的 max_tokens，并估算整次运行的 token 用量和费用。
+"""
+import math
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+_PIECE_RE = re.compile(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+# 花括号初始化列表，例如 int a[] = {1, 2, 3, ...};
+_BRACE_LIST_RE = re.compile(r"(=\s*)\{([^{}]*)\}", re.S)
+_STRING_RE = re.compile(r'"(?:\\.|[^"\\\n])*"')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数。
+
+    中日韩字符各计 1 个；其余按单词/符号切分，每个单词按 4 个字符 1 个 token 计。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    pieces = sum(math.ceil(len(piece) / 4) for piece in _PIECE_RE.findall(text))
+    return cjk + pieces
+
+
+def _elide_brace_list(match: "re.Match", keep: int, min_items: int) -> str:
+    items = match.group(2).split(",")
+    if len(items) <= min_items:
+        return match.group(0)
+    kept = ",".join(items[:keep]).rstrip()
+    return f"{match.group(1)}{{{kept}, /* ... 省略 {len(items) - keep} 项 ... */}}"
+
+
+def _elide_string(match: "re.Match", max_chars: int) -> str:
+    literal = match.group(0)
+    if len(literal) <= max_chars:
+        return literal
+    return f'{literal[:max_chars - 1]}" /* ... 省略 {len(literal) - max_chars} 个字符 ... */'
+
+
+def compact_source(code: str, max_tokens: int, list_keep: int = 8, list_min_items: int = 32,
+                   string_max_chars: int = 200) -> Tuple[str, bool]:
+    """
+    当代码超过 max_tokens 时进行确定性压缩：
+
+    1. 省略超长（> list_min_items 项）的花括号初始化列表，只保留前 list_keep 项；
+    2. 截断超长的字符串常量；
+    3. 仍然超出时保留开头和结尾的行，省略中间部分。
+
+    :return: (压缩后的代码, 是否发生了压缩)
+    """
+    if estimate_tokens(code) <= max_tokens:
+        return code, False
+
+    compacted = _BRACE_LIST_RE.sub(lambda m: _elide_brace_list(m, list_keep, list_min_items), code)
+    compacted = _STRING_RE.sub(lambda m: _elide_string(m, string_max_chars), compacted)
+    if estimate_tokens(compacted) <= max_tokens:
+        return compacted, True
+
+    lines = compacted.splitlines()
+    head: List[str] = []
+    tail: List[str] = []
+    budget = max_tokens - 20
+    # 交替从头尾取行，保证 main 函数开头和结尾都可见
+    i, j = 0, len(lines) - 1
+    while i <= j:
+        cost = estimate_tokens(lines[i]) + 1
+        if cost > budget:
+            break
+        head.append(lines[i])
+        budget -= cost
+        i += 1
+        if i > j:
+            break
+        cost = estimate_tokens(lines[j]) + 1
+        if cost > budget:
+            break
+        tail.append(lines[j])
+        budget -= cost
+        j -= 1
+    omitted = j - i + 1
+    if omitted <= 0:
+        return "\n".join(head + tail[::-1]), True
+    marker = f"/* ... 代码过长，省略中间 {omitted} 行 ... */"
+    return "\n".join(head + [marker] + tail[::-1]), True
+
+
+@dataclass
+class TokenBudget:
+    """
+    token 预算策略。
+
+    max_tokens = clamp(min_output_tokens + output_ratio * 输入 token 数, min_output_tokens, max_output_tokens)
+
+    :param max_code_tokens: 学生代码的 token 上限，超过时使用 compact_source 压缩
+    :param input_price_per_1k: 每千输入 token 的价格（元），用于费用估算
+    :param output_price_per_1k: 每千输出 token 的价格（元）
+    :param cached_input_price_per_1k: 命中服务端前缀缓存的每千输入 token 的价格（元）
+    :param expected_output_ratio: 估算费用时，预计实际输出占 max_tokens 的比例
+    """
+    min_output_tokens: int = 1500
+    max_output_tokens: int = 20000
+    output_ratio: float = 1.0
+    max_code_tokens: int = 8000
+    input_price_per_1k: float = 0.006
+    output_price_per_1k: float = 0.024
+    cached_input_price_per_1k: float = 0.0012
+    expected_output_ratio: float = 0.5
+
+    def max_tokens_for(self, input_tokens: int) -> int:
+        value = int(self.min_output_tokens + self.output_ratio * input_tokens)
+        return max(self.min_output_tokens, min(self.max_output_tokens, value))
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+        """:param cached_tokens: input_tokens 中命中前缀缓存、按缓存价格计费的部分"""
+        return ((input_tokens - cached_tokens) / 1000 * self.input_price_per_1k
+                + cached_tokens / 1000 * self.cached_input_price_per_1k
+                + output_tokens / 1000 * self.output_price_per_1k)
+
+    def summarize(self, requests: Iterable[Dict]) -> Dict[str, float]:
+        """
+        汇总一批已构造好的请求参数的 token 与费用估算。
+
+        :return: {"requests", "input_tokens", "max_output_tokens", "expected_output_tokens",
+                  "expected_cost", "max_cost"}
+        """
+        count = input_tokens = max_output = 0
+        for request in requests:
+            count += 1
+            input_tokens += sum(estimate_tokens(m["content"]) for m in request["messages"])
+            max_output += request["max_tokens"]
+        expected_output = int(max_output * self.expected_output_ratio)
+        return {
+            "requests": count,
+            "input_tokens": input_tokens,
+            "max_output_tokens": max_output,
+            "expected_output_tokens": expected_output,
+            "expected_cost": self.estimate_cost(input_tokens, expected_output),
+            "max_cost": self.estimate_cost(input_tokens, max_output),
+        }
@@ -1,14 +1,43 @@
 # 加载excel zip  
 import csv
-from dataclasses import dataclass, fields, asdict, field
-from typing import List, Dict, Any, Type, TypeVar, get_type_hints, Optional, ClassVar, Tuple
+from dataclasses import dataclass, asdict, field, InitVar
+from typing import List, Dict, Any, Type, TypeVar, get_type_hints, Optional, ClassVar, Tuple, Iterator, AsyncIterator, Iterable, Callable
 from pathlib import Path
 import re
+import inspect
 import pprint
 import xml.etree.ElementTree as ET
 import os
-from openai import OpenAI
+import asyncio
+import time
+import statistics
+import hashlib
+import json
+from collections import deque, defaultdict
+from functools import cached_property, lru_cache, partial
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI, AsyncOpenAI
 from datetime import datetime
+from rate_limit import AdaptiveConcurrency
+from client_pool import ClientPool, Endpoint, HTTPConfig, LEAST_LOADED, load_endpoints
+from response_cache import ResponseCache
+from run_manifest import RunManifest, atomic_write_text
+from results_store import ResultsStore
+from compile_check import CheckResult, CompileChecker
+from cascade import TIER_FAILED, TRIAGE_INSTRUCTIONS, CascadeConfig, strip_triage
+from instrumentation import stages
+from gradebook_zip import GradebookZip
+from txt_parser import BAD_NAME, MISSING_KEY, NO_FIELDS, ParseIssue, RecordParseError, RecordParser, parse_paths
+from dedup import normalize_c_tokens, fingerprint, exact_fingerprint, MinHasher, NearDuplicateIndex
+from problem_registry import XMLPrompt, ProblemRegistry
+from token_budget import TokenBudget, estimate_tokens, compact_source
+from resubmission import (ALL_ATTEMPTS, ATTEMPT_STAMP_FORMAT, LATEST_ATTEMPT, attempt_stamp, build_regrade_message,
+                          code_diff, parse_submission_date)
+from resilience import (CircuitOpenError, ERROR_LABELS, RETRYABLE, FATAL, backoff_delay, classify_error,
+                        retry_after_seconds)
+from packing import (PACK_INSTRUCTIONS, PACK_RESPONSE_SCHEMA, PackValidationError,
+                     build_pack_message, pack_ids, parse_pack_response)
 
 API_KEY = "your_api_key_here"
 T1 = TypeVar('T', bound='BaseTxtRecord')
@@ -19,68 +48,31 @@ class Student:
     student_name: str
     student_grade: int|str
 
-@dataclass
+@lru_cache(maxsize=None)
+def _init_parameters(cls: type) -> frozenset:
+    """构造函数的参数名（包括 InitVar），每个类只计算一次。"""
+    return frozenset(inspect.signature(cls).parameters)
+
+@lru_cache(maxsize=None)
+def _record_parser(cls: type) -> RecordParser:
+    """按子类的 Key 映射构造的解析器，每个类只构造一次。"""
+    return RecordParser(keys=cls._get_key_mapping().keys(), files_key=cls._get_files_key())
+
+@dataclass(slots=True)
 class BaseTxtRecord:
     """
     一个可扩展的基类，用于从单个、
     半结构化的 "Key: Value" TXT 文件加载数据。
+
+    解析由 txt_parser.RecordParser 一次扫描完成；格式问题（缺少字段、文件块不完整等）
+    记录在 issues 中，由调用方决定如何报告。
     """
+    issues: List[ParseIssue] = field(init=False, default_factory=list, repr=False, compare=False)
 
     def to_dict(self) -> Dict[str, Any]:
         """将处理后的数据类实例转换为字典。"""
         return asdict(self)
 
-    @classmethod
-    def _parse_txt_to_raw_map(cls, filepath: str, encoding: str = 'utf-8') -> Dict[str, str]:
-        """
-        一个通用的解析器，用于解析 "Key: Value" 文件。
-        - 它将 'Key: Value' 转换为 dict item。
-        - 它能处理多行值（无论是缩进的还是非缩进的）。
-        """
-        raw_data_map = {}
-        current_key = None
-        value_buffer = []
-
-        with open(filepath, mode='r', encoding=encoding) as f:
-            for line in f:
-                stripped_line = line.strip()
-                
-                # 检查是否为新 Key (非缩进且包含':')
-                # 假设 Key 本身不包含 ':'
-                if (not line.startswith(('\t', '    '))) and ':' in line:
-                    # 1. 保存上一个 Key 的数据
-                    if current_key:
-                        raw_data_map[current_key] = "\n".join(value_buffer).strip()
-                    
-                    # 2. 处理这个新 Key
-                    try:
-                        key, value = line.split(':', 1)
-                        current_key = key.strip()
-                        value_buffer = [value.strip()]
-                    except ValueError:
-                        # 异常情况：行中可能只有':'，没有Key
-                        if current_key:
-                            value_buffer.append(stripped_line)
-                
-                # 检查是否为多行值的延续（例如缩进的 'Files:'）
-                elif line.startswith(('\t', '    ')) and current_key:
-                    value_buffer.append(stripped_line)
-                
-                # 检查是否为空行（通常是分隔符）
-                elif not stripped_line:
-                    if current_key:
-                        value_buffer.append("") # 保留空行作为分隔
-                
-                # 其他情况：非缩进、无冒号的行（例如 'Submission Field:' 下的内容）
-                elif current_key and stripped_line:
-                    value_buffer.append(stripped_line)
-
-        # 3. 别忘了保存文件中的最后一个 Key
-        if current_key:
-            raw_data_map[current_key] = "\n".join(value_buffer).strip()
-            
-        return raw_data_map
-
     @classmethod
     def load_from_txt(cls: Type[T1], filepath: str, encoding: str = 'utf-8') -> T1:
         """
@@ -90,9 +82,52 @@ class BaseTxtRecord:
         :param encoding: 文件编码 (默认为 'utf-8')。
         :return: 一个已填充和处理的子类实例。
         """
-        # 步骤 1: 将 TXT 文件解析为一个 {str: str} 的原始字典
-        raw_map = cls._parse_txt_to_raw_map(filepath, encoding)
-        
+        # 步骤 1: 将 TXT 文件解析为一个 {Key: 值} 的原始字典
+        parsed = _record_parser(cls).parse_file(filepath, encoding)
+        if parsed.fatal is not None:
+            raise RecordParseError(parsed.fatal)
+        return cls._from_raw_map(parsed.fields, parsed.issues)
+
+    @classmethod
+    def load_from_text(cls: Type[T1], text: str) -> T1:
+        """
+        从已经读入内存的 TXT 内容解析并实例化一个子类记录（例如来自 ZIP 成员）。
+
+        :param text: TXT 文件的完整内容。
+        :return: 一个已填充和处理的子类实例。
+        """
+        parsed = _record_parser(cls).parse(text)
+        return cls._from_raw_map(parsed.fields, parsed.issues)
+
+    @classmethod
+    def load_directory(cls: Type[T1], directory: Path, pattern: str = "*.txt", max_workers: int = None,
+                       chunksize: int = 64) -> Iterator[Tuple[Path, Optional[T1], List[ParseIssue]]]:
+        """
+        在进程池中批量解析目录下的所有记录，按 glob 顺序逐个产出。
+
+        :param max_workers: 进程数，默认为 CPU 核数
+        :return: (路径, 记录, 问题列表) 的迭代器；文件无法读取或解码时记录为 None
+        """
+        paths = list(Path(directory).glob(pattern))
+        yield from ((path, *result) for path, result in
+                    zip(paths, parse_paths(cls._load_checked, paths, max_workers, chunksize)))
+
+    @classmethod
+    def _load_checked(cls: Type[T1], filepath: Path) -> Tuple[Optional[T1], List[ParseIssue]]:
+        """load_from_txt 的不抛异常版本，供进程池调用。"""
+        parsed = _record_parser(cls).parse_file(filepath)
+        if parsed.fatal is not None:
+            return None, parsed.issues
+        record = cls._from_raw_map(parsed.fields, parsed.issues)
+        return record, record.issues
+
+    @classmethod
+    def _from_raw_map(cls: Type[T1], raw_map: Dict[str, Any], issues: List[ParseIssue] = None) -> T1:
+        """
+        根据原始 {Key: Value} 字典实例化子类记录。
+
+        :param issues: 解析阶段已经发现的问题，会放在记录的 issues 最前面
+        """
         # 步骤 2: 获取子类定义的 "TXT Key" -> "dataclass 字段" 的映射
         try:
             key_mapping = cls._get_key_mapping()
@@ -101,10 +136,11 @@ class BaseTxtRecord:
                 f"{cls.__name__} 必须实现 `_get_key_mapping()` 类方法。"
             )
             
-        # 步骤 3: 准备传递给 dataclass 构造函数的 kwargs
+        # 步骤 3: 准备传递给 dataclass 构造函数的 kwargs（映射的目标可以是字段，也可以是 InitVar）
         kwargs = {}
-        dc_fields = {f.name for f in fields(cls)}
+        dc_fields = _init_parameters(cls)
         
+        missing = []
         for txt_key, dc_field_name in key_mapping.items():
             if dc_field_name not in dc_fields:
                 print(f"警告: 映射中定义的字段 '{dc_field_name}' 不在 {cls.__name__} 中。")
@@ -113,12 +149,19 @@ class BaseTxtRecord:
             if txt_key in raw_map:
                 kwargs[dc_field_name] = raw_map[txt_key]
             else:
-                print(f"警告: 在TXT文件中未找到键 '{txt_key}'。将使用 None。")
+                missing.append(txt_key)
                 kwargs[dc_field_name] = None # 稍后 __post_init__ 会处理 None
         
         # 步骤 4: 实例化子类
         # 这将自动触发子类的 __post_init__ 方法进行数据清理
-        return cls(**kwargs)
+        record = cls(**kwargs)
+        if issues or missing:
+            issues = list(issues or [])
+            # 整个文件都没有字段时只报告一次，不再逐个报告缺少的 Key
+            if not any(issue.code == NO_FIELDS for issue in issues):
+                issues += [ParseIssue(MISSING_KEY, f"未找到键 '{txt_key}'，将使用 None") for txt_key in missing]
+            record.issues[:0] = issues
+        return record
 
     # --- 必须被子类实现的方法 ---
 
@@ -131,14 +174,21 @@ class BaseTxtRecord:
         {"TXT 文件中的 Key 名": "dataclass 上的字段名"}
         """
         raise NotImplementedError
+
+    @classmethod
+    def _get_files_key(cls) -> Optional[str]:
+        """值为文件块的 Key（解析为 [(原始文件名, 文件名), ...]），没有时返回 None。"""
+        return None
     
-@dataclass
+@dataclass(slots=True)
 class FileEntry:
     """一个简单的 dataclass 来保存文件信息"""
     original_filename: str
     filename: str
 
-@dataclass
+_NAME_RE = re.compile(r"^(.*)\((.*)\)\s(.*)\s\((.*)\)$")
+
+@dataclass(slots=True)
 class SubmissionRecord(BaseTxtRecord):
     """
     代表一个具体的学生提交记录。
@@ -146,35 +196,35 @@ class SubmissionRecord(BaseTxtRecord):
     """
     
     # --- 1. 临时原始字段 ---
-    # 这些字段用于接收来自解析器的原始、未处理的字符串。
+    # 这些 InitVar 用于接收来自解析器的原始、未处理的值，只传给 __post_init__，不保存在实例上。
+    # _raw_files 已由解析器拆分为 [(原始文件名, 文件名), ...]。
     # 它们的名字必须与 _get_key_mapping() 中的值匹配。
-    # repr=False 使其在打印实例时保持整洁。
-    _raw_name: Optional[str] = field(repr=False)
-    _raw_assignment: Optional[str] = field(repr=False)
-    _raw_date: Optional[str] = field(repr=False)
-    _raw_grade: Optional[str] = field(repr=False)
-    _raw_submission: Optional[str] = field(repr=False)
-    _raw_comments: Optional[str] = field(repr=False)
-    _raw_files: Optional[str] = field(repr=False)
+    _raw_name: InitVar[Optional[str]]
+    _raw_assignment: InitVar[Optional[str]]
+    _raw_date: InitVar[Optional[str]]
+    _raw_grade: InitVar[Optional[str]]
+    _raw_submission: InitVar[Optional[str]]
+    _raw_comments: InitVar[Optional[str]]
+    _raw_files: InitVar[Optional[List[Tuple[str, str]]]]
 
     # --- 2. 最终的、干净的字段 ---
     # init=False 意味着它们不由构造函数填充，
-    # 而是由 __post_init__ 填充。
-    name: Optional[str] = field(init=False)
-    student_id: Optional[str] = field(init=False)
-    major: Optional[str] = field(init=False)
-    assignment: Optional[str] = field(init=False)
-    date_submitted: Optional[str] = field(init=False)
-    current_grade: Optional[int] = field(init=False)
-    submission_text: Optional[str] = field(init=False)
-    comments: Optional[str] = field(init=False)
+    # 而是由 __post_init__ 填充。slots=True 使每条记录不再带 __dict__。
+    name: Optional[str] = field(init=False, default=None)
+    student_id: Optional[str] = field(init=False, default=None)
+    major: Optional[str] = field(init=False, default=None)
+    assignment: Optional[str] = field(init=False, default=None)
+    date_submitted: Optional[str] = field(init=False, default=None)
+    current_grade: Optional[int] = field(init=False, default=None)
+    submission_text: Optional[str] = field(init=False, default=None)
+    comments: Optional[str] = field(init=False, default=None)
     files: List[FileEntry] = field(init=False, default_factory=list)
 
     @classmethod
     def _get_key_mapping(cls) -> Dict[str, str]:
         """
         实现基类要求：
-        将 TXT 文件中的 Key 映射到此类上的 `_raw_...` 字段。
+        将 TXT 文件中的 Key 映射到此类上的 `_raw_...` InitVar。
         """
         return {
             "Name": "_raw_name",
@@ -185,106 +235,211 @@ class SubmissionRecord(BaseTxtRecord):
             "Comments": "_raw_comments",
             "Files": "_raw_files",
         }
+
+    @classmethod
+    def _get_files_key(cls) -> Optional[str]:
+        return "Files"
     
-    def __post_init__(self):
+    def __post_init__(self, _raw_name, _raw_assignment, _raw_date, _raw_grade,
+                      _raw_submission, _raw_comments, _raw_files):
         """
         数据清理和转换的魔法在这里发生。
-        我们解析 _raw_ 字段并填充最终字段。
+        我们解析 _raw_ 参数并填充最终字段。
         """
         
         # --- 解析 Name 字段 ---
-        if self._raw_name:
+        if _raw_name:
             # 使用正则表达式匹配: "中文名(Pinyin) 专业 (ID)"
-            match = re.search(r"^(.*)\((.*)\)\s(.*)\s\((.*)\)$", self._raw_name)
+            match = _NAME_RE.match(_raw_name)
             if match:
                 self.name = f"{match.group(1).strip()} ({match.group(2).strip()})"
                 self.major = match.group(3).strip()
                 self.student_id = match.group(4).strip()
             else:
-                self.name = self._raw_name # 回退
+                self.name = _raw_name # 回退
                 self.major = None
                 self.student_id = None
+                self.issues.append(ParseIssue(BAD_NAME, f"Name 字段不是 '中文名(Pinyin) 专业 (学号)' 格式: {_raw_name}"))
         
         # --- 解析简单字段 ---
-        self.assignment = self._raw_assignment
-        self.date_submitted = self._raw_date
+        self.assignment = _raw_assignment
+        self.date_submitted = _raw_date
         
         # --- 解析 Grade (类型转换) ---
         try:
-            self.current_grade = int(self._raw_grade)
+            self.current_grade = int(_raw_grade)
         except (ValueError, TypeError):
             self.current_grade = None
             
         # --- 解析文本字段 (检查占位符) ---
-        if self._raw_submission and "There is no student submission text data" in self._raw_submission:
+        if _raw_submission and "There is no student submission text data" in _raw_submission:
             self.submission_text = None
         else:
-            self.submission_text = self._raw_submission
+            self.submission_text = _raw_submission
             
-        if self._raw_comments and "There are no student comments" in self._raw_comments:
+        if _raw_comments and "There are no student comments" in _raw_comments:
             self.comments = None
         else:
-            self.comments = self._raw_comments
+            self.comments = _raw_comments
             
-        # --- 解析 Files 字段 (最复杂) ---
-        self.files = []
-        if self._raw_files:
-            # 原始字符串包含由空行分隔的块
-            file_blocks = self._raw_files.split("\n\n")
-            for block in file_blocks:
-                if not block.strip():
-                    continue
-                
-                lines = block.strip().split('\n')
-                try:
-                    # 假设 'Original filename:' 在第一行
-                    # 假设 'Filename:' 在第二行
-                    orig_name = lines[0].split(":", 1)[1].strip()
-                    new_name = lines[1].split(":", 1)[1].strip()
-                    self.files.append(FileEntry(original_filename=orig_name, filename=new_name))
-                except (IndexError, AttributeError):
-                    print(f"警告: 无法解析文件块: {block}")
-
-@dataclass 
-class AssignmentBase:
-    data: str = ""  # 比如c文件的内容
-    filename: str = ""
-    orig_name: str = ""
-    def __post_init__(self):
-        # read self.data from self.filename with encoding fallback
-        encodings = ['utf-8', 'gbk', 'gb2312', 'latin1']
-        for encoding in encodings:
-            try:
-                with open(self.filename, 'r', encoding=encoding) as f:
-                    self.data = f.read()
-                return
-            except (UnicodeDecodeError, Exception) as e:
-                continue
-        
+        # --- Files 字段 (已由解析器拆分) ---
+        self.files = [FileEntry(original_filename=orig_name, filename=new_name)
+                      for orig_name, new_name in _raw_files or ()]
+
+SOURCE_ENCODINGS = ('utf-8', 'gbk', 'gb2312', 'latin1')
+MAX_SOURCE_BYTES = 256 * 1024  # 单个源文件最多读取的字节数
+
+def decode_source_bytes(raw: bytes, encodings=SOURCE_ENCODINGS) -> Optional[str]:
+    """
+    在内存中依次尝试多种编码解码字节串。
+
+    :return: 解码后的字符串；所有编码都失败时返回 None
+    """
+    for encoding in encodings:
+        try:
+            text = raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        if encoding != encodings[0]:
+            stages.count("encoding_fallback")
+        return text
+    return None
+
+def read_source_file(filename: str, max_bytes: int = MAX_SOURCE_BYTES,
+                     archive: Optional[GradebookZip] = None) -> str:
+    """
+    读取源文件：只打开一次，最多读取 max_bytes 字节，再在内存中尝试各种编码。
+
+    - 超过 max_bytes 的文件会被截断，并在末尾附加说明。
+    - 含有 NUL 字节的文件视为二进制文件，返回空字符串。
+
+    :param archive: 若提供，则 filename 是该 ZIP 中的成员名
+    """
+    try:
+        if archive is not None:
+            raw = archive.read_bytes(filename, max_bytes + 1)
+        else:
+            with open(filename, 'rb') as f:
+                raw = f.read(max_bytes + 1)
+    except (OSError, KeyError) as e:
+        print(f"警告：无法读取文件 {filename}: {e}")
+        return ""
+
+    if b'\x00' in raw[:8192]:
+        print(f"警告：文件 {filename} 疑似二进制文件，已跳过")
+        return ""
+
+    truncated = len(raw) > max_bytes
+    if not truncated:
+        text = decode_source_bytes(raw)
+    else:
+        raw = raw[:max_bytes]
+        # 截断位置可能落在多字节字符中间，最多回退 3 个字节再尝试解码
+        text = None
+        for cut in range(4):
+            text = decode_source_bytes(raw[:len(raw) - cut], encodings=SOURCE_ENCODINGS[:-1])
+            if text is not None:
+                break
+        if text is None:
+            text = raw.decode('latin1')
+        text += f"\n/* [文件超过 {max_bytes} 字节，其余内容已截断] */\n"
+
+    if text is None:
         # 如果所有编码都失败，记录警告并设为空
-        print(f"警告：无法用任何编码读取文件 {self.filename}")
-        self.data = ""    
+        print(f"警告：无法用任何编码读取文件 {filename}")
+        return ""
+    return text
+
+# @dataclass
+class AssignmentBase:
+    """
+    一个源文件。源码在第一次访问 data 时才读取；反馈文件写出后调用 release() 释放，
+    之后再访问会重新从文件（或 ZIP）读取。
+    """
+    __slots__ = ("filename", "orig_name", "archive", "_data")
+
+    def __init__(self, data: str = "", filename: str = "", orig_name: str = "",
+                 archive: Optional[GradebookZip] = None):
+        self.filename = filename
+        self.orig_name = orig_name
+        self.archive = archive  # 非空时 filename 为 ZIP 成员名
+        self._data = data or None  # 比如c文件的内容；None 表示尚未读取
+
+    @property
+    def data(self) -> str:
+        if self._data is None:
+            self.load()
+        return self._data
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    def load(self):
+        """读取源文件（带编码回退）；已读取时什么也不做。"""
+        if self._data is not None:
+            return
+        if not self.filename:
+            self._data = ""
+            return
+        with stages.timer("read_source"):
+            self._data = read_source_file(self.filename, archive=self.archive)
+
+    def release(self):
+        """丢弃已读取的源码（只对有源文件的作业生效）。"""
+        if self.filename:
+            self._data = None
+
+    def __repr__(self) -> str:
+        return f"AssignmentBase(filename={self.filename!r}, orig_name={self.orig_name!r}, loaded={self.loaded})"
 
 # @dataclass
 class Student:
-    student_id: str
-    name: str
-    homeworks: List[AssignmentBase] = field(default_factory=list)
-    
-    def __init__(self, dict_data:Dict, father_path: str = ""):
-        self.student_id = dict_data.get("student_id", "")
-        self.name = dict_data.get("name", "")
-        self.homeworks = []
-        files = dict_data.get("files", [])
-        for file in files:
-            if not file['original_filename'].endswith('.c'):
+    """一条提交记录（一次 attempt）对应的学生及其 .c 作业文件。"""
+    __slots__ = ("student_id", "name", "assignment", "homeworks", "record_name", "submitted_at", "attempt", "attempts")
+
+    def __init__(self, record: "SubmissionRecord", father_path: str = "", archive: Optional[GradebookZip] = None,
+                 record_name: str = ""):
+        self.student_id: Optional[str] = record.student_id
+        self.name: Optional[str] = record.name
+        self.assignment: Optional[str] = record.assignment  # Blackboard 中的作业名，例如 'PA6'
+        self.record_name = record_name  # TXT 记录的文件名（ZIP 中为成员名），见 iter_students 的 members
+        # 提交时间：Date Submitted 无法解析时使用记录名中的时间戳
+        self.submitted_at: Optional[datetime] = parse_submission_date(record.date_submitted)
+        if self.submitted_at is None and attempt_stamp(record_name):
+            self.submitted_at = datetime.strptime(attempt_stamp(record_name), ATTEMPT_STAMP_FORMAT)
+        # 评阅所有提交时为本次提交的标签（提交时间），出现在任务 ID 和反馈文件名中；只评阅最新提交时为空
+        self.attempt = ""
+        self.attempts = 1  # 该学生在导出中的提交次数
+        self.homeworks: List[AssignmentBase] = []
+        for file in record.files:
+            if not file.original_filename.endswith('.c'):
                 continue
-            assignment = AssignmentBase(
-                data="",
-                filename=file['filename'] if father_path == "" else str(Path(father_path) / file['filename']),
-                orig_name=file['original_filename']
-            )
-            self.homeworks.append(assignment)
+            if archive is not None:
+                # father_path 为 TXT 记录在 ZIP 中的成员名
+                filename = archive.resolve(father_path, file.filename)
+            else:
+                filename = file.filename if father_path == "" else str(Path(father_path) / file.filename)
+            self.homeworks.append(AssignmentBase(
+                filename=filename,
+                orig_name=file.original_filename,
+                archive=archive
+            ))
+
+    def load_sources(self):
+        """读取所有作业文件的源码。"""
+        for homework in self.homeworks:
+            homework.load()
+
+    @property
+    def attempt_label(self) -> str:
+        """本次提交的标签：记录名中的时间戳，没有时为提交时间或记录名。"""
+        stamp = attempt_stamp(self.record_name)
+        if stamp:
+            return stamp
+        if self.submitted_at is not None:
+            return self.submitted_at.strftime(ATTEMPT_STAMP_FORMAT)
+        return Path(self.record_name).stem
 
 class PromptXMLParser:
     """
@@ -362,25 +517,131 @@ class PromptXMLParser:
             result = result.replace("{code}", code)
             return result
 
-@dataclass
-class XMLPrompt:
-    problem: str
-    code: str
-    original_filename: str = ""
-
 def match_file_to_prompt(original_filename: str, prompt_list: List[XMLPrompt]) -> Optional[XMLPrompt]:
     """
     根据文件名匹配对应的 XMLPrompt。
+    批量匹配时请使用 ProblemRegistry，它只在注册时编译一次匹配规则。
     
     :param original_filename: 学生文件的原始名称 (例如 'pa6p1.c')
     :param prompt_list: XMLPrompt 列表
     :return: 匹配的 XMLPrompt，或 None（如果未找到）
     """
-    filename_lower = original_filename.lower()
-    for prompt in prompt_list:
-        if prompt.original_filename.lower() == filename_lower:
-            return prompt
-    return None
+    prompt, _ = ProblemRegistry(prompt_list).lookup(original_filename)
+    return prompt
+
+_SCORE_LINE_RE = re.compile(r'建议分数[：:]\s*(\d+)\s*/\s*100')
+# 按优先级排列的分数格式："建议分数：XX/100" > "建议分数：XX" > "分数：XX/100" > "分数：XX"
+_SCORE_PATTERNS = [
+    _SCORE_LINE_RE,
+    re.compile(r'建议分数[：:]\s*(\d+)'),
+    re.compile(r'分数[：:]\s*(\d+)\s*/\s*100'),
+    re.compile(r'分数[：:]\s*(\d+)'),
+]
+
+class FeedbackError(Exception):
+    """
+    调用模型获取反馈失败（网络错误、限流重试耗尽等）。
+
+    :param retryable: 稍后重试是否可能成功；为 False 时（例如请求参数错误）不会在本次运行中重新排队
+    """
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+@dataclass
+class GradingJob:
+    """一个评阅任务：某个学生的某个作业文件，以及与之匹配的题目。"""
+    student: Student
+    assignment: AssignmentBase
+    prompt: XMLPrompt
+    # 由队列工作进程领取的任务带有 work_queue.Lease，写出结果前先在队列中提交
+    lease: Any = None
+    # 同一任务上一次评阅的版本（ResultsStore.last_version），代码已变化时用于增量评阅
+    previous: Optional[Dict[str, Any]] = None
+
+    @property
+    def output_filename(self) -> str:
+        """反馈文件名，形如 '{学号}_{文件名去掉.c}_feedback.md'（评阅所有提交时学号后带有提交时间）。"""
+        safe_student_id = re.sub(r'[\\/:*?"<>|]', '_', str(self.student.student_id or "unknown"))
+        safe_filename = re.sub(r'[\\/:*?"<>|]', '_', str(self.assignment.orig_name or "file"))
+        if self.student.attempt:
+            safe_student_id += "_" + re.sub(r'[\\/:*?"<>|]', '_', self.student.attempt)
+        return f"{safe_student_id}_{safe_filename[:-2]}_feedback.md"
+
+    @property
+    def job_id(self) -> str:
+        return RunManifest.make_job_id(str(self.student.student_id), self.assignment.orig_name, self.student.attempt)
+
+    @property
+    def code_hash(self) -> str:
+        """学生代码的 SHA-256，用于判断续跑时代码是否发生变化。"""
+        return hashlib.sha256(self.assignment.data.encode('utf-8')).hexdigest()
+
+    @cached_property
+    def normalized_tokens(self) -> List[str]:
+        """去除注释/空白并规范化标识符后的 token 序列（用于相似度报告）。"""
+        return normalize_c_tokens(self.assignment.data)
+
+    @cached_property
+    def exact_fingerprint(self) -> str:
+        """只忽略空白的代码指纹（保留注释和标识符）。"""
+        return exact_fingerprint(self.assignment.data)
+
+    @property
+    def dedup_key(self) -> str:
+        """
+        同一题目下代码除空白外完全相同的任务拥有相同的 dedup_key，共用一次评阅结果。
+        注释或变量名不同的提交不合并：评阅意见会引用具体的变量名，AI 使用检查也会看注释。
+        增量评阅的任务还要求上一版相同，因为评阅意见是相对上一版写的。
+        """
+        key = f"{self.prompt.original_filename.lower()}:{self.exact_fingerprint}"
+        if self.previous is not None:
+            key += f":{self.previous['code_hash'][:16]}"
+        return key
+
+@dataclass
+class GradingRun:
+    """一次 aprocess_all_submissions 运行期间各任务共享的状态。"""
+    pool: ClientPool
+    gate: AdaptiveConcurrency
+    # dedup_key -> 组内第一个任务的评阅结果 (反馈, 分数)，失败时结果为 None
+    leaders: Dict[str, asyncio.Future] = field(default_factory=dict)
+    # 题目文件名 -> {指纹: [job_id, ...]}
+    exact_groups: Dict[str, Dict[str, List[str]]] = field(default_factory=lambda: defaultdict(lambda: defaultdict(list)))
+    # 题目文件名 -> 近似重复索引
+    near_indexes: Dict[str, NearDuplicateIndex] = field(default_factory=dict)
+    fanned_out: int = 0
+    fast_path: int = 0  # 因代码为空或无法编译而未调用模型的任务数
+    # 分级评阅统计：直接采用小模型结果的任务数，以及按原因统计的升级任务数
+    cascade_accepted: int = 0
+    escalations: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    # 每个实际发出的请求的指标（ttft、latency、tokens_per_sec 等）
+    request_metrics: List[Dict[str, Any]] = field(default_factory=list)
+    # 打包评阅统计：成功的打包请求数、其中包含的任务数、回退为逐份评阅的包数
+    packs: int = 0
+    packed_jobs: int = 0
+    pack_fallbacks: int = 0
+    # 增量评阅统计：只发送代码差异的重新提交数，以及代码只有空白变化、直接沿用上一次结果的任务数
+    diff_regrades: int = 0
+    unchanged_resubmissions: int = 0
+    # 可重试的失败任务，运行结束前重新排队；retryable_keys 记录其 dedup_key，供同组的重复提交判断
+    failed_jobs: List["GradingJob"] = field(default_factory=list)
+    retryable_keys: set = field(default_factory=set)
+
+def find_latest_gradebook(root: Path = Path(".")) -> Optional[Path]:
+    """
+    返回 root 下日期最新的 gradebook_CS111 开头的目录或 Blackboard 导出的 ZIP（按名字末尾的时间戳排序）。
+
+    :return: 没有找到时返回 None
+    """
+    root = Path(root)
+    file_names = [(f, Path(f).stem[-20:]) for f in os.listdir(root) if f.startswith('gradebook_CS111')
+                  and ((root / f).is_dir() or GradebookZip.is_gradebook_zip(root / f))]
+    if not file_names:
+        return None
+    return root / max(file_names, key=lambda x: x[1])[0]
+
 import httpx
 @dataclass
 class MainLoader:
@@ -390,8 +651,88 @@ class MainLoader:
     parser: PromptXMLParser = field(default=None)
     client: OpenAI = field(default=None)
     prompt_list: List[XMLPrompt] = field(default_factory=list)
+    # 题目目录（包含 problems.json），非空时在初始化时加载为题目注册表
+    problems_path: Optional[Path] = None
+    registry: ProblemRegistry = field(default_factory=ProblemRegistry, repr=False)
+    # --- 模型与接口配置 ---
+    base_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+    api_key: str = API_KEY
+    model: str = "qwen3-max"
+    temperature: float = 0.7
+    max_tokens: int = 20000
+    # token 预算：按输入大小决定每个请求的 max_tokens（不超过 max_tokens），并压缩超大的代码。
+    # 为 None 时所有请求都使用固定的 max_tokens，代码原样发送
+    token_budget: Optional[TokenBudget] = field(default_factory=lambda: TokenBudget(min_output_tokens=4000))
+    # 多个接口（不同的 base_url、API Key 或模型名，各自限流）时在这里列出，请求在它们之间路由；
+    # 为空时只使用上面的 base_url 和 api_key，以及下面的 rpm_limit / tpm_limit
+    endpoints: List[Endpoint] = field(default_factory=list)
+    routing: str = LEAST_LOADED  # least_loaded 或 weighted，见 client_pool
+    http: HTTPConfig = field(default_factory=HTTPConfig)  # 每个接口的连接池大小、keep-alive 和 HTTP/2 设置
+    # 分级评阅：不为 None 时先用 cascade.model 评阅，置信度低、分数低或需要复核的提交再交给 model（不适用于打包和批处理模式）
+    cascade: Optional[CascadeConfig] = None
+    # --- 并发与限流配置 ---
+    # concurrency=1 时按顺序逐个处理；大于 1 时并发调用异步客户端
+    concurrency: int = 1
+    rpm_limit: Optional[int] = None  # 每分钟请求数上限
+    tpm_limit: Optional[int] = None  # 每分钟 token 数上限
+    max_retries: int = 5  # 遇到限流、5xx、超时或连接错误时的最大重试次数
+    # 连续 circuit_failure_threshold 次服务端/网络错误后暂停所有请求 circuit_reset_timeout 秒，再放行一个探测请求
+    circuit_failure_threshold: int = 5
+    circuit_reset_timeout: float = 30.0
+    rate_limit_cooldown: float = 1.0  # 429 且没有 Retry-After 时，该接口暂停接收新请求的秒数
+    requeue_failed: int = 1  # 本次运行结束前，将可重试的失败任务重新排队的轮数
+    # structured_output=True 时要求模型以 JSON 返回评阅意见和分数（不适用于批处理模式）
+    structured_output: bool = False
+    # --- 本地编译检查 ---
+    # compile_check=True 时先用本机 gcc 编译并运行题目登记的测试用例，结果放进提示词（不适用于批处理模式）；
+    # compile_fast_path=True 时代码为空或无法编译的提交不调用模型，直接生成说明
+    compile_check: bool = False
+    compile_fast_path: bool = True
+    compile_timeout: float = 2.0  # 每个测试用例的运行时间上限（秒）
+    checker: Optional[CompileChecker] = field(default=None, repr=False)
+    # stream=True 时以流式方式接收输出，实时写入 output_path/.live/ 下的同名文件
+    stream: bool = False
+    # group_by_problem=True 时同一题目的任务连续发出，使服务端的前缀缓存（系统提示词 + 题目描述）保持命中；
+    # 边加载边评阅时，某个题目攒够 group_flush_size 个任务就整组入队，不必等整个目录加载完
+    group_by_problem: bool = True
+    group_flush_size: int = 32
+    # --- 重复提交检测 ---
+    # dedup=True 时规范化代码相同的提交只评阅一次，结果分发给组内所有学生
+    dedup: bool = True
+    near_duplicate_threshold: float = 0.8  # 相似度报告中近似重复的阈值
+    # --- 打包评阅 ---
+    # pack_size > 1 时把同一题目的多份短提交放进一个请求（JSON 结构化输出），返回结果校验失败时回退为逐份评阅
+    pack_size: int = 1
+    pack_max_code_tokens: int = 1500  # 代码超过该 token 数的提交不参与打包
+    pack_json_schema: bool = False  # True 时使用 json_schema 响应格式（需服务端支持），否则使用 json_object
+    load_workers: int = 8  # 加载 TXT 和源文件的线程数
+    # --- 多次提交 ---
+    # Blackboard 每次提交（attempt）导出一条记录。attempts="latest" 时每名学生只评阅 Date Submitted 最晚的一次；
+    # "all" 时评阅每一次提交，任务 ID 和反馈文件名中带有提交时间
+    attempts: str = LATEST_ATTEMPT
+    # diff_regrade=True 时，同一作业文件评阅过较早的版本、且两版代码的差异不超过代码的 diff_max_ratio 时，
+    # 只发送差异和上一次的评阅意见（不适用于分级、打包、批处理模式和 structured_output）
+    diff_regrade: bool = True
+    diff_max_ratio: float = 0.5
+    # --- 性能观测 ---
+    # 每次运行结束时打印各阶段耗时，并写出 output_path/.metrics/ 下的 metrics.json 和 metrics.prom；
+    # profile_stages 中的同步阶段（如 parse_txt、read_source、build_prompt、score、write）额外用 cProfile 剖析
+    profile_stages: Tuple[str, ...] = ()
+    # --- 响应缓存配置 ---
+    # use_cache=False 完全不读写缓存；refresh_cache=True 忽略已有缓存但写入新结果
+    use_cache: bool = True
+    refresh_cache: bool = False
+    cache_path: Path = Path("./.cache/responses.sqlite3")
+    cache_max_bytes: Optional[int] = 512 * 1024 * 1024
+    cache_max_age_days: Optional[float] = 90
+    cache: Optional[ResponseCache] = field(default=None, repr=False)
+    # --- 续跑配置 ---
+    # resume=True 时跳过清单中已完成且代码未变化的任务，只重试失败或中断的任务
+    resume: bool = True
+    manifest: Optional[RunManifest] = field(default=None, repr=False)
+    # 评阅结果库（学号、分数、token 用量、延迟等），用于导出 Blackboard 成绩
+    results: Optional[ResultsStore] = field(default=None, repr=False)
 
-    custom_http_client = httpx.Client(trust_env=False)
     def __post_init__(self):
         prompt_string = ""
         try:
@@ -402,60 +743,259 @@ class MainLoader:
             prompt_string = "{problem}\n\n{code}"
 
         self.parser = PromptXMLParser(prompt_string)
+        if self.token_budget is not None:
+            self.token_budget.max_output_tokens = min(self.token_budget.max_output_tokens, self.max_tokens)
+        if self.cascade is not None:
+            budget = self.cascade.token_budget
+            budget.max_output_tokens = min(budget.max_output_tokens, self.max_tokens)
+        if self.problems_path is not None:
+            self.registry = ProblemRegistry.load_from_dir(self.problems_path)
+            self.prompt_list = self.registry.prompts
+            print(f"从 {self.problems_path} 加载了 {len(self.prompt_list)} 道题目")
+        elif self.prompt_list:
+            self.registry = ProblemRegistry(self.prompt_list)
+        if self.profile_stages:
+            stages.set_profile_stages(self.profile_stages)
         self.client = OpenAI(
             # 若没有配置环境变量，请用百炼API Key将下行替换为：api_key="sk-xxx",
-            api_key=API_KEY,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-            http_client=self.custom_http_client
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=httpx.Client(**self.http.client_kwargs()),
+            timeout=self.http.timeouts()
         )
+        if self.use_cache and self.cache is None:
+            self.cache = ResponseCache(
+                self.cache_path,
+                max_bytes=self.cache_max_bytes,
+                max_age_days=self.cache_max_age_days
+            )
         # 创建输出目录
         self.output_path.mkdir(parents=True, exist_ok=True)
+        if self.manifest is None:
+            self.manifest = RunManifest(self.output_path / ".manifest.sqlite3")
+        if self.results is None:
+            self.results = ResultsStore(self.output_path / ".results.sqlite3")
 
-        # 更新 files_path 自动找到日期最新的files_path
+        # 更新 files_path 自动找到日期最新的files_path（已解压的目录或 Blackboard 导出的 ZIP）
         if self.files_path == Path("") or not self.files_path.exists():
-            
-            file_names=[(f,f[-20:]) for f in os.listdir('.') if f.startswith('gradebook_CS111') and os.path.isdir(f)]
-            # print(f"找到所有测试目录{file_names!r}")
-            if(len(file_names)==0):
+            latest = find_latest_gradebook(Path("."))
+            if latest is None:
                 # print("警告：当前目录下未找到任何 gradebook_CS111 开头的目录，请手动指定 files_path。")
-                raise FileNotFoundError("未找到任何 gradebook_CS111 开头的目录")
-            sorted_file_names=sorted(file_names,key=lambda x:x[1],reverse=True)
-            self.files_path=Path(sorted_file_names[0][0]) if len(sorted_file_names)>0 else Path("")
+                raise FileNotFoundError("未找到任何 gradebook_CS111 开头的目录或 ZIP")
+            self.files_path = latest
             print(f"自动选择最新的提交目录: {self.files_path}")
 
+    def client_endpoints(self) -> List[Endpoint]:
+        """评阅使用的接口：endpoints 为空时由 base_url、api_key、rpm_limit、tpm_limit 组成一个接口。"""
+        if self.endpoints:
+            return list(self.endpoints)
+        return [Endpoint(base_url=self.base_url, api_key=self.api_key,
+                         rpm_limit=self.rpm_limit, tpm_limit=self.tpm_limit)]
+
     def set_prompt_list(self, prompts: List[XMLPrompt]):
         """设置 XMLPrompt 列表"""
         self.prompt_list = prompts
+        self.registry = ProblemRegistry(prompts)
 
-    def get_all_students(self) -> List[Student]:
+    def get_all_students(self, load_sources: bool = True, attempts: Optional[str] = None) -> List[Student]:
         """
         获取所有学生及其提交记录。
+
+        :param load_sources: 为 False 时只解析 TXT 记录，源码在第一次访问 AssignmentBase.data 时才读取
+        :param attempts: "latest" 或 "all"（见 iter_students），默认使用 self.attempts
         :return: Student 对象列表
         """
-        students = []
-        print(f"正在从目录加载学生记录: {self.files_path}")
-        txt_files = list(self.files_path.glob("*.txt"))
-        for txt_file in txt_files:
-            try:
+        return list(self.iter_students(load_sources=load_sources, attempts=attempts))
+
+    @staticmethod
+    def _report_issues(source, issues: List[ParseIssue]):
+        """打印一条记录的格式问题，并按类型计数。"""
+        for issue in issues:
+            stages.count(f"parse_{issue.code}")
+            print(f"警告: {source}: {issue}")
+
+    @staticmethod
+    def _load_student(txt_file: Path, load_sources: bool = True) -> Optional[Student]:
+        """解析一个 TXT 记录并读取其 .c 文件，失败时返回 None。"""
+        try:
+            with stages.timer("parse_txt"):
                 record = SubmissionRecord.load_from_txt(filepath=txt_file)
-                record_dict = record.to_dict()
-                student = Student(record_dict, father_path=str(txt_file.parent))
-                students.append(student)
-            except Exception as e:
-                print(f"警告: 无法加载学生记录 {txt_file}: {e}")
-        return students
+            MainLoader._report_issues(txt_file, record.issues)
+            student = Student(record, father_path=str(txt_file.parent), record_name=txt_file.name)
+            if load_sources:
+                student.load_sources()
+            return student
+        except Exception as e:
+            print(f"警告: 无法加载学生记录 {txt_file}: {e}")
+            return None
 
-    def get_feedback_from_qwen(self, problem_description: str, student_code: str, 
-                                system_prompt: str = None) -> Tuple[str, str]:
+    @staticmethod
+    def _load_student_from_zip(archive: GradebookZip, member: str, load_sources: bool = True) -> Optional[Student]:
+        """从 ZIP 中解析一个 TXT 记录并读取其 .c 成员，失败时返回 None。"""
+        try:
+            with stages.timer("parse_txt"):
+                record = SubmissionRecord.load_from_text(archive.read_text(member))
+            MainLoader._report_issues(f"{archive.path}:{member}", record.issues)
+            student = Student(record, father_path=member, archive=archive, record_name=member)
+            if load_sources:
+                student.load_sources()
+            return student
+        except Exception as e:
+            print(f"警告: 无法加载学生记录 {archive.path}:{member}: {e}")
+            return None
+
+    def iter_students(self, max_workers: int = None, load_sources: bool = True,
+                      members: Optional[Iterable[str]] = None, attempts: Optional[str] = None) -> Iterator[Student]:
         """
-        调用 Qwen API 获取对学生代码的反馈。
-        
+        以流的方式逐个产出学生。files_path 可以是已解压的目录，也可以是 Blackboard 导出的 ZIP。
+
+        TXT 解析和源文件读取分发到线程池中执行，同时在途的任务数有上限，
+        因此调用方可以在整个目录加载完成之前就开始处理前面的学生。产出顺序与目录遍历顺序一致。
+
+        Blackboard 每次提交导出一条记录。只评阅最新提交时，先解析所有 TXT 记录（不读取源码），
+        按学号分组、按提交时间排序，只产出每名学生最新的一次提交，再读取其源码；
+        评阅所有提交时逐条产出，并为每次提交设置 Student.attempt。
+
+        :param max_workers: 线程数，默认使用 self.load_workers
+        :param load_sources: 是否在加载线程中预先读取源码；为 False 时延迟到第一次访问
+            （ZIP 在迭代结束后关闭，之后访问源码时会重新打开）
+        :param members: 只加载这些 TXT 记录（目录中的文件名或 ZIP 成员名），为 None 时加载全部（监视模式使用）
+        :param attempts: "latest" 或 "all"，默认使用 self.attempts
+        """
+        max_workers = max_workers or self.load_workers
+        attempts = attempts or self.attempts
+        print(f"正在从目录加载学生记录: {self.files_path}")
+        with ExitStack() as stack:
+            archive = None
+            if GradebookZip.is_gradebook_zip(self.files_path):
+                archive = stack.enter_context(GradebookZip(self.files_path))
+            # 线程池后进先出：退出时先等待在途的加载任务结束，再关闭 ZIP
+            pool = stack.enter_context(ThreadPoolExecutor(max_workers=max_workers))
+
+            if archive is not None:
+                names = archive.txt_members() if members is None else members
+                load = partial(self._load_student_from_zip, archive)
+            else:
+                names = (txt_file.name for txt_file in self.files_path.glob("*.txt")) if members is None else members
+                load = lambda name, sources: self._load_student(self.files_path / name, sources)
+
+            if attempts == ALL_ATTEMPTS:
+                for student in self._windowed(pool, (partial(load, name, load_sources) for name in names),
+                                              max_workers * 2):
+                    student.attempt = student.attempt_label
+                    yield student
+                return
+
+            records = list(self._windowed(pool, (partial(load, name, False) for name in names), max_workers * 2))
+            latest = self.latest_attempts(records)
+            if len(latest) < len(records):
+                print(f"{len(records)} 条提交记录来自 {len(latest)} 名学生，只评阅每名学生最新的一次提交")
+            if not load_sources:
+                yield from latest
+                return
+            yield from self._windowed(pool, (partial(self._with_sources, student) for student in latest),
+                                      max_workers * 2)
+
+    @staticmethod
+    def _windowed(pool: ThreadPoolExecutor, calls: Iterable[Callable[[], Optional[Student]]],
+                  window_size: int) -> Iterator[Student]:
+        """在线程池中依次执行 calls，同时在途的不超过 window_size 个，按顺序产出不为 None 的结果。"""
+        window = deque()
+        try:
+            for call in calls:
+                window.append(pool.submit(call))
+                if len(window) >= window_size:
+                    student = window.popleft().result()
+                    if student is not None:
+                        yield student
+            while window:
+                student = window.popleft().result()
+                if student is not None:
+                    yield student
+        finally:
+            for future in window:
+                future.cancel()
+
+    @staticmethod
+    def _with_sources(student: Student) -> Optional[Student]:
+        try:
+            student.load_sources()
+            return student
+        except Exception as e:
+            print(f"警告: 无法读取 {student.record_name} 的源文件: {e}")
+            return None
+
+    @staticmethod
+    def latest_attempts(students: Iterable[Student]) -> List[Student]:
+        """
+        按学号分组，每组只保留提交时间最晚的一次（时间相同或无法解析时按记录名排序），
+        并在其 attempts 中记录该学生的提交次数。没有学号的记录各自成组。
+
+        :return: 各学生最新的提交，按该提交在输入中的顺序排列
+        """
+        groups: Dict[str, List[Tuple[int, Student]]] = defaultdict(list)
+        for index, student in enumerate(students):
+            key = student.student_id if student.student_id else f"record:{student.record_name}"
+            groups[key].append((index, student))
+        latest = []
+        for group in groups.values():
+            index, student = max(group, key=lambda item: (item[1].submitted_at is not None,
+                                                         item[1].submitted_at or datetime.min,
+                                                         item[1].record_name))
+            student.attempts = len(group)
+            latest.append((index, student))
+        latest.sort(key=lambda item: item[0])
+        return [student for _, student in latest]
+
+    async def _aiter_students(self, limit: int = None,
+                              members: Optional[Iterable[str]] = None) -> AsyncIterator[Student]:
+        """iter_students 的异步包装：在工作线程中推进生成器，不阻塞事件循环。"""
+        iterator = self.iter_students(members=members)
+        count = 0
+        try:
+            while limit is None or count < limit:
+                student = await asyncio.to_thread(next, iterator, None)
+                if student is None:
+                    break
+                count += 1
+                yield student
+        finally:
+            await asyncio.to_thread(iterator.close)
+
+    def _build_messages(self, problem_description: str, student_code: str,
+                        system_prompt: str = None, check_report: str = None,
+                        previous_feedback: str = None, diff: str = None) -> List[Dict[str, str]]:
+        """
+        构造发送给模型的 messages 列表。
+
+        同一题目下所有学生共享的内容（系统提示词、题目描述）放在前面且逐字节不变，
+        只有最后一条消息包含学生代码，以便服务端的上下文（前缀）缓存跨学生命中。
+
         :param problem_description: 问题描述
         :param student_code: 学生提交的代码
         :param system_prompt: 系统提示词（可选）
-        :return: (反馈文本, 建议分数) 的元组
+        :param check_report: 本地编译与测试结果摘要（可选），附在学生代码之后
+        :param previous_feedback: 增量评阅时上一版的评阅意见，与 diff 一起代替完整代码
+        :param diff: 增量评阅时本次提交相对上一版的差异
+        :return: OpenAI chat 格式的 messages
         """
+        if diff is not None:
+            code_message = build_regrade_message(previous_feedback, diff)
+        else:
+            code_message = f"""学生代码：
+        ```c
+        {student_code}
+        ```
 
+        请对这份代码提交进行详细评阅。"""
+        if check_report:
+            code_message += f"\n\n{check_report}"
+        return self._prefix_messages(problem_description, system_prompt) + [
+            {"role": "user", "content": code_message},
+        ]
+
+    def _prefix_messages(self, problem_description: str, system_prompt: str = None) -> List[Dict[str, str]]:
+        """返回同一题目下所有请求共享的前缀消息（系统提示词、题目描述）。"""
         if system_prompt is None:
             system_prompt = """你是一名 C 语言编程课程的资深助教，你的职责是评阅学生代码。
             请对提交的代码进行以下方面的深入分析：
@@ -472,45 +1012,403 @@ class MainLoader:
 
             请用中文回答，并以"建议分数：XX/100"的格式明确指出建议分数。"""
         
-        user_message = f"""题目描述：
-        {problem_description}
+        problem_message = f"""题目描述：
+        {problem_description}"""
 
-        学生代码：
-        ```c
-        {student_code}
-        ```
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": problem_message},
+        ]
 
-        请对这份代码提交进行详细评阅。"""
-    
-        try:
-            response = self.client.chat.completions.create(
-                model="qwen3-max",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message},
-                ],
-                temperature=0.7,
-                max_tokens=20000,
-                stream=False  # 显式禁用流式，确保返回完整响应
+    def _completion_kwargs(self, messages: List[Dict[str, str]], max_tokens: int = None,
+                           model: str = None) -> Dict[str, Any]:
+        """返回 chat.completions.create 的公共参数。"""
+        return dict(
+            model=model or self.model,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=max_tokens or self.max_tokens,
+            stream=False  # 显式禁用流式，确保返回完整响应
+        )
+
+    @stages.timed("build_prompt")
+    def _build_request(self, problem_description: str, student_code: str,
+                       system_prompt: str = None, check_report: str = None,
+                       previous_feedback: str = None, diff: str = None) -> Dict[str, Any]:
+        """
+        按 token 预算构造完整的请求参数：超大的代码先被压缩，max_tokens 随代码大小调整。
+        给出 diff 时构造增量评阅请求：只发送差异，但要求输出完整的评阅意见，max_tokens 仍按完整代码的大小计算。
+
+        :return: chat.completions.create 的参数字典
+        """
+        max_tokens = None
+        if diff is not None:
+            if self.token_budget is not None:
+                max_tokens = self.token_budget.max_tokens_for(estimate_tokens(student_code))
+            messages = self._build_messages(problem_description, student_code, system_prompt, check_report,
+                                            previous_feedback, diff)
+            return self._completion_kwargs(messages, max_tokens)
+        if self.token_budget is not None:
+            student_code, compacted = compact_source(student_code, self.token_budget.max_code_tokens)
+            if compacted:
+                print(f"    代码超过 {self.token_budget.max_code_tokens} tokens，已压缩后发送")
+            max_tokens = self.token_budget.max_tokens_for(estimate_tokens(student_code))
+        messages = self._build_messages(problem_description, student_code, system_prompt, check_report)
+        return self._completion_kwargs(messages, max_tokens)
+
+    @stages.timed("build_prompt")
+    def _build_triage_request(self, problem_description: str, student_code: str,
+                              check_report: str = None) -> Dict[str, Any]:
+        """
+        构造分级评阅第一轮（小模型）的请求：消息与 _build_request 相同，代码消息末尾追加置信度要求，
+        max_tokens 按小模型的 token 预算计算。
+        """
+        budget = self.cascade.token_budget
+        student_code, _ = compact_source(student_code, budget.max_code_tokens)
+        messages = self._build_messages(problem_description, student_code, check_report=check_report)
+        messages[-1]["content"] += "\n\n" + TRIAGE_INSTRUCTIONS
+        return self._completion_kwargs(messages, budget.max_tokens_for(estimate_tokens(student_code)),
+                                       model=self.cascade.model)
+
+    @stages.timed("build_prompt")
+    def _build_pack_request(self, problem_description: str, codes: List[str],
+                            system_prompt: str = None,
+                            check_reports: Optional[List[Optional[str]]] = None) -> Dict[str, Any]:
+        """
+        构造一次评阅多份提交的打包请求。前缀消息与逐份评阅完全相同，仍可命中前缀缓存。
+
+        :param codes: 各份提交的代码，依次编号为 S1, S2, ...
+        :param check_reports: 与 codes 对应的本地编译检查摘要（可选）
+        """
+        messages = self._prefix_messages(problem_description, system_prompt) + [
+            {"role": "user",
+             "content": PACK_INSTRUCTIONS.strip() + "\n\n" + build_pack_message(codes, check_reports)},
+        ]
+        if self.token_budget is not None:
+            max_tokens = min(self.max_tokens,
+                             sum(self.token_budget.max_tokens_for(estimate_tokens(code)) for code in codes))
+        else:
+            max_tokens = self.max_tokens
+        request = self._completion_kwargs(messages, max_tokens)
+        if self.pack_json_schema:
+            request["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "pack_feedback", "schema": PACK_RESPONSE_SCHEMA},
+            }
+        else:
+            request["response_format"] = {"type": "json_object"}
+        return request
+
+    def estimate_run(self, jobs: List[GradingJob]) -> Dict[str, float]:
+        """
+        在发出任何请求之前估算一批任务的 token 用量和费用（开启 dedup 时重复任务只计一次）。
+
+        :return: TokenBudget.summarize 的结果
+        """
+        budget = self.token_budget or TokenBudget(max_output_tokens=self.max_tokens)
+        seen = set()
+        requests = []
+        for job in jobs:
+            if self.dedup:
+                if job.dedup_key in seen:
+                    continue
+                seen.add(job.dedup_key)
+            diff = self._regrade_diff(job)
+            if diff == "":
+                continue
+            requests.append(self._build_request(job.prompt.problem, job.assignment.data,
+                                                previous_feedback=job.previous["feedback"] if diff else None,
+                                                diff=diff))
+        return budget.summarize(requests)
+
+    def export_grades(self, points: int = 100, column_ids: Optional[Dict[str, str]] = None):
+        """
+        从结果库导出 Blackboard 成绩上传文件 blackboard_grades.csv 和分数汇总 grade_summary.csv（均位于输出目录）。
+
+        :param points: 成绩列满分
+        :param column_ids: Blackboard 作业名 -> 成绩列 ID（可选，见 ResultsStore.export）
+        """
+        grades_path = self.output_path / "blackboard_grades.csv"
+        summary_path = self.output_path / "grade_summary.csv"
+        result = self.results.export(grades_path, summary_path, points=points, column_ids=column_ids)
+        print(f"已导出 {result['students']} 个学生的成绩到 {grades_path}，汇总见 {summary_path}")
+        if result["blank"]:
+            print(f"注意: {result['blank']} 个成绩格因缺少分数留空，请手动补充。")
+
+    @staticmethod
+    def print_estimate(summary: Dict[str, float]):
+        print(f"预估: {summary['requests']} 个请求，输入约 {summary['input_tokens']:,} tokens，"
+              f"输出上限 {summary['max_output_tokens']:,} tokens（预计约 {summary['expected_output_tokens']:,}）")
+        print(f"预估费用: 约 ¥{summary['expected_cost']:.2f}（最多 ¥{summary['max_cost']:.2f}）")
+
+    def _parse_completion(self, response, cache_key: Optional[str] = None) -> Tuple[str, str]:
+        """
+        从 chat completion 响应中提取 (反馈文本, 建议分数)。
+
+        :param cache_key: 若提供且启用了缓存，则将非空反馈写入缓存
+        """
+        feedback = ""
+        if hasattr(response, 'choices') and response.choices:
+            choice = response.choices[0]
+            if hasattr(choice, 'message') and hasattr(choice.message, 'content'):
+                feedback = choice.message.content or ""
+
+        self._store_cache(cache_key, feedback, getattr(response, 'usage', None))
+
+        # 从反馈中提取分数
+        score = self._extract_score_from_feedback(feedback)
+        return feedback, score
+
+    def _store_cache(self, cache_key: Optional[str], feedback: str, usage=None, model: str = None):
+        """若启用了缓存，则将非空反馈写入缓存。"""
+        if cache_key is not None and self.cache is not None and feedback:
+            self.cache.put(
+                cache_key, feedback, model=model or self.model,
+                usage=usage.model_dump() if hasattr(usage, 'model_dump') else None
             )
-            
-            # 提取反馈内容
-            feedback = ""
-            if hasattr(response, 'choices') and response.choices:
-                choice = response.choices[0]
-                if hasattr(choice, 'message') and hasattr(choice.message, 'content'):
-                    feedback = choice.message.content
-            
-            # 从反馈中提取分数
-            score = self._extract_score_from_feedback(feedback)
-            
-            return feedback, score
+
+    async def _astream_completion(self, async_client: AsyncOpenAI, request: Dict[str, Any],
+                                  live_path: Optional[Path] = None,
+                                  metrics: Optional[Dict[str, Any]] = None) -> Tuple[str, Any]:
+        """
+        以流式方式调用模型，边接收边把内容追加到 live_path（供前端实时查看）。
+
+        一旦输出中出现 "建议分数：XX/100" 就立即记录下来；metrics 中会写入
+        ttft（首 token 延迟，秒）、latency（总耗时）、completion_tokens、tokens_per_sec 以及 score_at。
+
+        :return: (完整反馈文本, usage 对象或 None)
+        """
+        metrics = metrics if metrics is not None else {}
+        stream_request = dict(request, stream=True, stream_options={"include_usage": True})
+        started = time.perf_counter()
+        first_token_at = None
+        parts: List[str] = []
+        window = ""
+        usage = None
+        live_file = None
+        if live_path is not None:
+            live_path.parent.mkdir(parents=True, exist_ok=True)
+            live_file = open(live_path, 'w', encoding='utf-8')
+        try:
+            stream = await async_client.chat.completions.create(**stream_request)
+            async for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                if not delta:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    metrics["ttft"] = first_token_at - started
+                parts.append(delta)
+                if live_file is not None:
+                    live_file.write(delta)
+                    live_file.flush()
+                if "score" not in metrics:
+                    # 只在最近的一小段文本中查找，避免每个 chunk 都扫描全文
+                    window = (window + delta)[-64:]
+                    match = _SCORE_LINE_RE.search(window)
+                    if match:
+                        metrics["score"] = f"{match.group(1)}/100"
+                        metrics["score_at"] = time.perf_counter() - started
+                        print(f"    已检测到建议分数 {metrics['score']}（{metrics['score_at']:.1f}s）")
+        finally:
+            if live_file is not None:
+                live_file.close()
+
+        finished = time.perf_counter()
+        feedback = "".join(parts)
+        completion_tokens = getattr(usage, 'completion_tokens', None) or len(feedback) // 2
+        metrics["latency"] = finished - started
+        metrics.setdefault("ttft", metrics["latency"])
+        metrics["completion_tokens"] = completion_tokens
+        generation_time = finished - (first_token_at or started)
+        metrics["tokens_per_sec"] = completion_tokens / generation_time if generation_time > 0 else 0.0
+        return feedback, usage
+
+    @staticmethod
+    def _record_usage(metrics: Optional[Dict[str, Any]], usage):
+        """将 usage 中的 token 数（含命中服务端前缀缓存的输入 token 数）写入 metrics。"""
+        if metrics is None or usage is None:
+            return
+        metrics["prompt_tokens"] = getattr(usage, 'prompt_tokens', None) or 0
+        metrics["completion_tokens"] = getattr(usage, 'completion_tokens', None) or metrics.get("completion_tokens", 0)
+        details = getattr(usage, 'prompt_tokens_details', None)
+        metrics["cached_tokens"] = getattr(details, 'cached_tokens', None) or 0
+
+    def _lookup_cache(self, request: Dict[str, Any],
+                      structured: bool = False) -> Tuple[Optional[str], Optional[Tuple[str, str]]]:
+        """
+        计算请求的缓存键并查询缓存。
+
+        :param structured: 缓存内容是否为 structured_output 的 JSON
+        :return: (缓存键, 命中时的 (反馈文本, 建议分数))；未启用缓存时缓存键为 None
+        """
+        if self.cache is None:
+            return None, None
+        key = ResponseCache.make_key(request)
+        if self.refresh_cache:
+            return key, None
+        cached = self.cache.get(key)
+        if cached is None:
+            return key, None
+        try:
+            return key, self._feedback_and_score(cached["content"], structured)
+        except PackValidationError:
+            return key, None
+
+    def _feedback_and_score(self, content: str, structured: bool = False) -> Tuple[str, str]:
+        """
+        从模型输出中取出 (反馈文本, 建议分数)。
+
+        :param structured: 为 True 时 content 应为 {"results": [{"id": "S1", "feedback", "score"}]} 格式的 JSON
+        :raises PackValidationError: structured 为 True 且 JSON 不合法
+        """
+        if not structured:
+            return content, self._extract_score_from_feedback(content)
+        with stages.timer("score"):
+            feedback, score = parse_pack_response(content, ["S1"])["S1"]
+        score = f"{score}/100"
+        if not _SCORE_LINE_RE.search(feedback):
+            feedback = f"{feedback}\n\n建议分数：{score}"
+        return feedback, score
+
+    def get_feedback_from_qwen(self, problem_description: str, student_code: str, 
+                                system_prompt: str = None) -> Tuple[str, str]:
+        """
+        调用 Qwen API 获取对学生代码的反馈。
+        
+        :param problem_description: 问题描述
+        :param student_code: 学生提交的代码
+        :param system_prompt: 系统提示词（可选）
+        :return: (反馈文本, 建议分数) 的元组
+        :raises FeedbackError: 调用失败（错误信息不会被当作反馈返回）
+        """
+        request = self._build_request(problem_description, student_code, system_prompt)
+        cache_key, cached = self._lookup_cache(request)
+        if cached is not None:
+            return cached
+        try:
+            response = self.client.chat.completions.create(**request)
+            return self._parse_completion(response, cache_key)
         except Exception as e:
             import traceback
             error_msg = f"调用 Qwen API 时出错: {str(e)}\n{traceback.format_exc()}"
             print(error_msg)
-            return error_msg, "0"
+            raise FeedbackError(error_msg, retryable=classify_error(e) in RETRYABLE) from e
+
+    async def _acomplete(self, pool: ClientPool, request: Dict[str, Any],
+                         live_path: Optional[Path] = None,
+                         metrics: Optional[Dict[str, Any]] = None) -> Tuple[str, Any]:
+        """
+        通过客户端池发出一个请求并返回模型输出的文本（不读写缓存）。
+
+        限流（429）、5xx、超时和连接错误会重试：还有其他可用接口时立即换一个接口重试，
+        否则按指数退避（带随机抖动，优先遵循 Retry-After）等待。失败计入该接口的健康状态
+        （429 时收缩其并发并暂停路由，服务端/网络错误计入其熔断器）。其余错误（如 400、401）不重试。
+
+        :return: (输出文本, usage 对象或 None)
+        :raises FeedbackError: 调用失败、重试次数耗尽或熔断时间过长
+        """
+        # 估算本次请求的 token 数（输入 + 输出上限），用于 TPM 限流
+        estimated_tokens = sum(estimate_tokens(m["content"]) for m in request["messages"]) + request["max_tokens"]
+        failed_on = ()
+        for attempt in range(self.max_retries + 1):
+            endpoint = pool.pick(exclude=failed_on)
+            endpoint_request = endpoint.prepare(request, self.model)
+            try:
+                async with endpoint.slot():
+                    await endpoint.limiter.acquire(estimated_tokens)
+                    stages.count("llm_requests")
+                    started = time.perf_counter()
+                    with stages.timer("llm"):
+                        if self.stream:
+                            content, usage = await self._astream_completion(endpoint.client, endpoint_request,
+                                                                            live_path, metrics)
+                        else:
+                            response = await endpoint.client.chat.completions.create(**endpoint_request)
+                            usage = getattr(response, 'usage', None)
+                            if metrics is not None:
+                                metrics["latency"] = metrics["ttft"] = time.perf_counter() - started
+                            content = ""
+                            if getattr(response, 'choices', None):
+                                content = getattr(response.choices[0].message, 'content', None) or ""
+            except CircuitOpenError as e:
+                raise FeedbackError(f"调用 Qwen API 时出错: {e}") from e
+            except Exception as e:
+                kind = classify_error(e)
+                stages.count(f"llm_error_{kind}")
+                endpoint.record_error(kind, retry_after_seconds(e))
+                if kind == FATAL:
+                    import traceback
+                    error_msg = f"调用 Qwen API 时出错: {str(e)}\n{traceback.format_exc()}"
+                    print(error_msg)
+                    raise FeedbackError(error_msg, retryable=False) from e
+                if attempt >= self.max_retries:
+                    error_msg = f"调用 Qwen API 时出错: 多次{ERROR_LABELS[kind]} ({e})"
+                    print(error_msg)
+                    raise FeedbackError(error_msg) from e
+                stages.count("llm_retries")
+                failed_on = (endpoint,)
+                if pool.has_alternative(endpoint):
+                    print(f"    {endpoint.name} {ERROR_LABELS[kind]}，换一个接口重试 ({attempt + 1}/{self.max_retries})")
+                    continue
+                delay = backoff_delay(attempt, retry_after=retry_after_seconds(e))
+                print(f"    {ERROR_LABELS[kind]}，{delay:.1f} 秒后重试 ({attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+                continue
+
+            endpoint.record_success(time.perf_counter() - started)
+            self._record_usage(metrics, usage)
+            if metrics is not None and len(pool) > 1:
+                metrics["endpoint"] = endpoint.name
+            if usage is not None:
+                stages.count("prompt_tokens", getattr(usage, 'prompt_tokens', None) or 0)
+                stages.count("completion_tokens", getattr(usage, 'completion_tokens', None) or 0)
+            endpoint.limiter.reconcile(estimated_tokens, getattr(usage, 'total_tokens', None))
+            return content, usage
+
+    async def aget_feedback_from_qwen(self, pool: ClientPool, problem_description: str,
+                                      student_code: str, system_prompt: str = None,
+                                      live_path: Optional[Path] = None,
+                                      metrics: Optional[Dict[str, Any]] = None,
+                                      check_report: str = None,
+                                      previous_feedback: str = None, diff: str = None) -> Tuple[str, str]:
+        """
+        get_feedback_from_qwen 的异步版本，供并发评阅使用。
+
+        :param pool: 客户端池（限流、并发控制和熔断都按接口进行）
+        :param live_path: 流式模式下实时追加输出内容的文件（可选）
+        :param metrics: 若提供，写入本次请求的延迟等指标（见 _astream_completion）
+        :param check_report: 本地编译与测试结果摘要（可选）
+        :param previous_feedback: 增量评阅时上一版的评阅意见（structured_output 时忽略）
+        :param diff: 增量评阅时与上一版代码的差异（structured_output 时忽略）
+        :return: (反馈文本, 建议分数) 的元组
+        :raises FeedbackError: 调用失败或返回的 JSON 不合法（错误信息不会被当作反馈返回）
+        """
+        structured = self.structured_output
+        if structured:
+            request = self._build_pack_request(problem_description, [student_code], system_prompt,
+                                               [check_report])
+        else:
+            request = self._build_request(problem_description, student_code, system_prompt, check_report,
+                                          previous_feedback, diff)
+        cache_key, cached = self._lookup_cache(request, structured)
+        if cached is not None:
+            return cached
+        try:
+            content, usage = await self._acomplete(pool, request, live_path, metrics)
+            result = self._feedback_and_score(content, structured)
+        except PackValidationError as e:
+            error = FeedbackError(f"模型返回的 JSON 不合法: {e}")
+            print(f"    {error}")
+            raise error from e
+        self._store_cache(cache_key, content, usage)
+        return result
     
+    @stages.timed("score")
     def _extract_score_from_feedback(self, feedback: str) -> str:
         """
         从反馈文本中提取建议分数。
@@ -518,18 +1416,9 @@ class MainLoader:
         :param feedback: 反馈文本
         :return: 分数字符串（例如"85"或"建议分数：85/100"）
         """
-        import re
-        
         # 尝试匹配 "建议分数：XX/100" 或 "建议分数：XX" 或 "建议分数:XX"
-        patterns = [
-            r'建议分数[：:]\s*(\d+)\s*/\s*100',
-            r'建议分数[：:]\s*(\d+)',
-            r'分数[：:]\s*(\d+)\s*/\s*100',
-            r'分数[：:]\s*(\d+)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, feedback)
+        for pattern in _SCORE_PATTERNS:
+            match = pattern.search(feedback)
             if match:
                 score = match.group(1)
                 return f"{score}/100"
@@ -575,119 +1464,785 @@ class MainLoader:
         """
         return md_content
 
-    def process_all_submissions(self, limit: int = None):
+    def _collect_jobs(self, students: List[Student]) -> List[GradingJob]:
+        """
+        将 学生 × 作业文件 展开为评阅任务列表，跳过没有匹配题目的文件。
+
+        :param students: Student 对象列表
+        :return: GradingJob 列表（保持学生与文件的原始顺序）
+        """
+        jobs = []
+        for student in students:
+            for assignment in student.homeworks:
+                matched_prompt = self.registry.match(assignment.orig_name)
+                if matched_prompt is None:
+                    print(f"  警告: {student.student_id} 的 {assignment.orig_name} 未找到匹配的 prompt，跳过此文件。")
+                    continue
+                jobs.append(GradingJob(student=student, assignment=assignment, prompt=matched_prompt))
+        return jobs
+
+    @stages.timed("write")
+    def _write_feedback(self, job: GradingJob, feedback: str, score: str) -> bool:
+        """
+        生成 Markdown 并原子地写入该任务对应的反馈文件。
+
+        :return: 是否写入成功
+        """
+        md_content = self.generate_feedback_markdown(
+            job.student, job.assignment, job.prompt, feedback, score
+        )
+        output_path = self.output_path / job.output_filename
+        try:
+            atomic_write_text(output_path, md_content)
+            print(f"    已生成反馈文件: {job.output_filename} (分数: {score})")
+            return True
+        except Exception as e:
+            print(f"    错误: 无法写入文件 {output_path}: {e}")
+            return False
+
+    def _finish_job(self, job: GradingJob, feedback: str, score: str,
+                    metrics: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        写入反馈文件，并在清单和结果库中记录任务结果。写入成功后释放源码，
+        使大批量评阅时内存中只保留尚未完成的任务的源码。
+
+        :param metrics: 本次请求的 token 用量和延迟（复用缓存或同组结果时为 None）
+        :return: 是否写入成功；任务的租约已被其他工作进程接管时丢弃结果并返回 False
+        """
+        if job.lease is not None and not job.lease.committed \
+                and not job.lease.commit(score, job.output_filename, feedback):
+            print(f"    {job.job_id} 的租约已失效（已由其他工作进程领取），丢弃本次结果")
+            return False
+        if self._write_feedback(job, feedback, score):
+            self.manifest.mark_done(job.job_id, job.output_filename, score)
+            self.results.record(
+                job.job_id, str(job.student.student_id), job.student.name,
+                getattr(job.student, 'assignment', ""), Path(job.assignment.orig_name).stem,
+                score, job.output_filename, (metrics or {}).get("model", self.model), metrics,
+                submitted_at=job.student.submitted_at.strftime(ATTEMPT_STAMP_FORMAT)
+                if job.student.submitted_at is not None else None
+            )
+            if self.diff_regrade:
+                self.results.save_version(job.job_id, job.code_hash, job.assignment.data, feedback, score)
+            job.assignment.release()
+            return True
+        self.manifest.mark_failed(job.job_id, "写入反馈文件失败")
+        return False
+
+    async def _afinish_job(self, job: GradingJob, feedback: str, score: str,
+                           metrics: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        _finish_job 的异步版本。任务带有租约时先在工作线程中提交：提交是一个 BEGIN IMMEDIATE 事务，
+        其他工作进程持有队列的锁时可能等待较长时间，不能阻塞事件循环上的其他请求。
+        """
+        if job.lease is not None and not job.lease.committed:
+            if not await asyncio.to_thread(job.lease.commit, score, job.output_filename, feedback):
+                print(f"    {job.job_id} 的租约已失效（已由其他工作进程领取），丢弃本次结果")
+                return False
+        return self._finish_job(job, feedback, score, metrics)
+
+    def collect_pending_jobs(self, limit: int = None) -> List[GradingJob]:
+        """
+        同步加载学生并返回所有需要执行的评阅任务（供批处理等非流式模式使用）。
+
+        :param limit: 处理的学生数限制（用于测试）
+        """
+        self.registry.reset_stats()
+        stages.reset()
+        jobs = []
+        for student_idx, student in enumerate(self.iter_students()):
+            if limit and student_idx >= limit:
+                break
+            jobs.extend(self._pending_jobs(self._collect_jobs([student])))
+        print(self.registry.summary())
+        return jobs
+
+    def _pending_jobs(self, jobs: List[GradingJob]) -> List[GradingJob]:
+        """
+        在清单中登记任务，并过滤掉已完成的任务（resume=False 时全部重做）。
+
+        :return: 需要执行的任务列表
+        """
+        pending = []
+        for job in jobs:
+            code_hash = job.code_hash
+            if self.resume and self.manifest.is_done(job.job_id, code_hash, self.output_path / job.output_filename):
+                continue
+            self.manifest.register(job.job_id, str(job.student.student_id), job.assignment.orig_name, code_hash)
+            self._attach_previous(job)
+            pending.append(job)
+        return pending
+
+    def _attach_previous(self, job: GradingJob):
+        """diff_regrade 时，若该任务评阅过代码不同的较早版本，记录到 job.previous。"""
+        if not self.diff_regrade:
+            return
+        previous = self.results.last_version(job.job_id)
+        if previous is not None and previous["code_hash"] != job.code_hash and previous["feedback"]:
+            job.previous = previous
+
+    def _regrade_diff(self, job: GradingJob) -> Optional[str]:
+        """
+        增量评阅时发送的代码差异。
+
+        :return: 差异文本（空字符串表示代码只有空白变化）；没有上一版或差异太大、应当完整评阅时返回 None
+        """
+        if job.previous is None:
+            return None
+        diff = code_diff(job.previous["code"], job.assignment.data)
+        if estimate_tokens(diff) > self.diff_max_ratio * estimate_tokens(job.assignment.data):
+            return None
+        return diff
+
+    @staticmethod
+    def _print_latency_summary(request_metrics: List[Dict[str, Any]]):
+        """打印本次运行所有请求的首 token 延迟、总耗时和生成速度。"""
+        def percentile(values: List[float], q: float) -> float:
+            values = sorted(values)
+            return values[min(len(values) - 1, int(q * len(values)))]
+
+        ttfts = [m["ttft"] for m in request_metrics]
+        latencies = [m["latency"] for m in request_metrics]
+        print(f"\n请求延迟（共 {len(request_metrics)} 个请求）: "
+              f"首 token p50 {percentile(ttfts, 0.5):.2f}s / p95 {percentile(ttfts, 0.95):.2f}s，"
+              f"总耗时 p50 {percentile(latencies, 0.5):.2f}s / p95 {percentile(latencies, 0.95):.2f}s")
+        speeds = [m["tokens_per_sec"] for m in request_metrics if "tokens_per_sec" in m]
+        if speeds:
+            print(f"生成速度: 平均 {statistics.mean(speeds):.1f} tokens/s")
+
+    def _print_usage_summary(self, request_metrics: List[Dict[str, Any]]):
+        """打印输入 token 中命中服务端前缀缓存的比例，以及由此节省的费用和首 token 延迟。"""
+        with_usage = [m for m in request_metrics if "prompt_tokens" in m]
+        if not with_usage:
+            return
+        prompt_tokens = sum(m["prompt_tokens"] for m in with_usage)
+        cached_tokens = sum(m["cached_tokens"] for m in with_usage)
+        completion_tokens = sum(m["completion_tokens"] for m in with_usage)
+        ratio = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+        print(f"token 用量: 输入 {prompt_tokens:,}（其中 {cached_tokens:,} 命中前缀缓存，{ratio:.0%}），"
+              f"输出 {completion_tokens:,}")
+        by_model: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for m in with_usage:
+            by_model[m.get("model", self.model)].append(m)
+        actual = uncached = 0.0
+        for model, model_metrics in by_model.items():
+            budget = self._budget_for(model)
+            tokens = [sum(m[k] for m in model_metrics) for k in ("prompt_tokens", "completion_tokens", "cached_tokens")]
+            cost = budget.estimate_cost(*tokens)
+            actual += cost
+            uncached += budget.estimate_cost(tokens[0], tokens[1])
+            if len(by_model) > 1:
+                latencies = sorted(m["latency"] for m in model_metrics)
+                print(f"  {model}: {len(model_metrics)} 个请求，输入 {tokens[0]:,}，输出 {tokens[1]:,}，"
+                      f"总耗时 p50 {latencies[len(latencies) // 2]:.2f}s，费用约 ¥{cost:.2f}")
+        print(f"费用: 约 ¥{actual:.2f}（前缀缓存节省约 ¥{uncached - actual:.2f}）")
+        hits = [m["ttft"] for m in with_usage if m["cached_tokens"]]
+        misses = [m["ttft"] for m in with_usage if not m["cached_tokens"]]
+        if hits and misses:
+            print(f"首 token 延迟: 命中缓存 {statistics.median(hits):.2f}s，未命中 {statistics.median(misses):.2f}s（中位数）")
+
+    def report_stages(self):
+        """打印本次运行各阶段的耗时分位数，并导出指标（以及剖析结果）到 output_path/.metrics/。"""
+        stages.print_summary()
+        try:
+            directory = stages.export(self.output_path / ".metrics")
+            print(f"性能指标已保存到 {directory}" + ("（含 cProfile 剖析结果）" if stages.profiles else ""))
+        except OSError as e:
+            print(f"警告: 无法写入性能指标: {e}")
+
+    def _budget_for(self, model: str) -> TokenBudget:
+        """返回某个模型的价格配置（分级评阅的小模型使用 cascade.token_budget）。"""
+        if self.cascade is not None and model == self.cascade.model:
+            return self.cascade.token_budget
+        return self.token_budget or TokenBudget()
+
+    def _append_usage_log(self, metrics: Dict[str, Any]):
+        """将单次请求的用量和延迟追加到输出目录下的 .usage.jsonl。"""
+        record = {"model": self.model, **metrics, "time": datetime.now().isoformat(timespec='seconds')}
+        try:
+            self.output_path.mkdir(parents=True, exist_ok=True)
+            with open(self.output_path / ".usage.jsonl", 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"    警告: 无法写入用量记录: {e}")
+
+    def _index_similarity(self, run: GradingRun, jobs: List[GradingJob]):
+        """将任务加入完全重复分组和近似重复索引（用于相似度报告）。"""
+        for job in jobs:
+            problem_key = job.prompt.original_filename.lower()
+            run.exact_groups[problem_key][fingerprint(job.normalized_tokens)].append(job.job_id)
+            index = run.near_indexes.get(problem_key)
+            if index is None:
+                index = run.near_indexes[problem_key] = NearDuplicateIndex(threshold=self.near_duplicate_threshold)
+            index.add(job.job_id, self._minhasher.signature(job.normalized_tokens))
+
+    @cached_property
+    def _minhasher(self) -> MinHasher:
+        return MinHasher()
+
+    def _write_similarity_report(self, run: GradingRun):
+        """将完全重复组和近似重复簇写入输出目录下的 similarity_report.md。"""
+        lines = ["# 提交相似度报告", "",
+                 f"- **生成时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                 f"- **近似重复阈值**: {self.near_duplicate_threshold}", ""]
+        for problem_key in sorted(run.exact_groups):
+            lines.append(f"## {problem_key}")
+            lines.append("")
+            duplicates = [ids for ids in run.exact_groups[problem_key].values() if len(ids) > 1]
+            duplicates.sort(key=len, reverse=True)
+            lines.append(f"### 完全重复（规范化后相同）: {len(duplicates)} 组")
+            for ids in duplicates:
+                lines.append(f"- {len(ids)} 份: " + ", ".join(ids))
+            clusters = run.near_indexes[problem_key].clusters()
+            lines.append("")
+            lines.append(f"### 近似重复: {len(clusters)} 簇")
+            for members, similarity in clusters:
+                lines.append(f"- {len(members)} 份 (相似度 ≥ {similarity:.2f}): " + ", ".join(members))
+            lines.append("")
+        report_path = self.output_path / "similarity_report.md"
+        atomic_write_text(report_path, "\n".join(lines))
+        print(f"相似度报告已保存到 {report_path}")
+
+    def _ensure_checker(self):
+        """开启本地编译检查时创建 CompileChecker（没有 gcc 时跳过）。"""
+        if self.compile_check and self.checker is None:
+            if CompileChecker.available():
+                self.checker = CompileChecker(Path(self.cache_path).parent / "compile", timeout=self.compile_timeout)
+            else:
+                print("警告: 未找到 gcc，跳过本地编译检查。")
+
+    def _client_pool(self, concurrency: int) -> ClientPool:
+        return ClientPool(self.client_endpoints(), http=self.http, routing=self.routing,
+                          max_concurrency=concurrency, failure_threshold=self.circuit_failure_threshold,
+                          reset_timeout=self.circuit_reset_timeout, rate_limit_cooldown=self.rate_limit_cooldown)
+
+    async def _schedule_job(self, run: GradingRun, job_idx: int, job: GradingJob):
+        """
+        执行一个任务。开启 dedup 时，同组的第一个任务负责调用模型，
+        其余任务等待其结果并写入各自的反馈文件。
+        """
+        if not self.dedup:
+            await self._run_job(run, job_idx, job)
+            return
+        leader = run.leaders.get(job.dedup_key)
+        if leader is None:
+            leader = run.leaders[job.dedup_key] = asyncio.get_running_loop().create_future()
+            result = None
+            try:
+                result = await self._run_job(run, job_idx, job)
+            finally:
+                leader.set_result(result)
+            return
+
+        result = await leader
+        if result is None:
+            self.manifest.mark_failed(job.job_id, "同组重复提交的评阅失败")
+            if job.dedup_key in run.retryable_keys:
+                run.failed_jobs.append(job)
+            return
+        run.fanned_out += 1
+        feedback, score = result
+        await self._afinish_job(job, feedback, score)
+
+    async def _run_job(self, run: GradingRun, job_idx: int, job: GradingJob) -> Optional[Tuple[str, str]]:
+        """
+        调用模型评阅一个任务并写入反馈文件。
+
+        :return: (反馈文本, 建议分数)；失败时返回 None
+        """
+        check = await self._check_job(job)
+        fast = self._fast_path(run, job, check)
+        if fast is not None:
+            await self._afinish_job(job, *fast)
+            return fast
+        diff = self._regrade_diff(job) if self.cascade is None and not self.structured_output else None
+        if diff == "":
+            # 代码只有空白变化，沿用上一次的结果
+            print(f"\n重新提交的代码没有实质变化，沿用上一次的评阅结果: {job.job_id}")
+            run.unchanged_resubmissions += 1
+            feedback, score = job.previous["feedback"], job.previous["score_text"]
+            await self._afinish_job(job, feedback, score)
+            return feedback, score
+        async with run.gate:
+            print(f"\n处理任务 [{job_idx}]: {job.student.name} ({job.student.student_id}) - {job.assignment.orig_name}")
+            self.manifest.mark_in_flight(job.job_id)
+            live_path = self.output_path / ".live" / job.output_filename if self.stream else None
+            metrics: Dict[str, Any] = {}
+            check_report = check.report() if check is not None else None
+            try:
+                if self.cascade is not None:
+                    feedback, score = await self._acascade(run, job, metrics, live_path, check_report)
+                else:
+                    if diff is not None:
+                        print(f"    重新提交，只发送与上一版的差异（{diff.count(chr(10)) + 1} 行）和上一次的评阅意见")
+                        run.diff_regrades += 1
+                    feedback, score = await self.aget_feedback_from_qwen(
+                        run.pool,
+                        job.prompt.problem,
+                        job.assignment.data,
+                        live_path=live_path,
+                        metrics=metrics,
+                        check_report=check_report,
+                        previous_feedback=job.previous["feedback"] if diff is not None else None,
+                        diff=diff
+                    )
+            except FeedbackError as e:
+                # 失败的任务不写反馈文件；可重试的任务在本次运行结束前重新排队，仍失败则下次运行时重试
+                self.manifest.mark_failed(job.job_id, str(e))
+                if e.retryable:
+                    run.failed_jobs.append(job)
+                    run.retryable_keys.add(job.dedup_key)
+                return None
+            finally:
+                if live_path is not None:
+                    live_path.unlink(missing_ok=True)
+        self._record_request(run, job, metrics)
+        await self._afinish_job(job, feedback, score, metrics or None)
+        return feedback, score
+
+    def _record_request(self, run: GradingRun, job: GradingJob, metrics: Dict[str, Any]):
+        """记录一个实际发出的请求的指标（命中缓存时 metrics 中没有 latency，不记录）。"""
+        if "latency" not in metrics:
+            return
+        metrics["job_id"] = job.job_id
+        metrics["problem"] = job.prompt.original_filename
+        run.request_metrics.append(metrics)
+        self._append_usage_log(metrics)
+        if "tokens_per_sec" in metrics:
+            print(f"    首 token {metrics['ttft']:.2f}s，总耗时 {metrics['latency']:.2f}s，"
+                  f"{metrics['tokens_per_sec']:.1f} tokens/s")
+
+    async def _acascade(self, run: GradingRun, job: GradingJob, metrics: Dict[str, Any],
+                        live_path: Optional[Path] = None, check_report: str = None) -> Tuple[str, str]:
+        """
+        分级评阅一个任务：先请求 cascade.model，结果可信时直接采用，否则交给 self.model 重新评阅。
+
+        :param metrics: 写入最终采用的那一次请求的指标；升级时小模型请求的指标单独记录
+        :raises FeedbackError: 大模型调用失败
+        """
+        cascade = self.cascade
+        request = self._build_triage_request(job.prompt.problem, job.assignment.data, check_report)
+        cache_key, result = self._lookup_cache(request)
+        triage_metrics: Dict[str, Any] = {"model": cascade.model}
+        reason = TIER_FAILED
+        try:
+            if result is None:
+                content, usage = await self._acomplete(run.pool, request, metrics=triage_metrics)
+                self._store_cache(cache_key, content, usage, model=cascade.model)
+                result = self._feedback_and_score(content)
+            reason = cascade.escalation_reason(*result)
+        except FeedbackError as e:
+            # 限流、服务端错误等可重试的失败交给重新排队；参数错误等（例如小模型不可用）直接升级
+            if e.retryable:
+                raise
+        if reason is None:
+            run.cascade_accepted += 1
+            metrics.update(triage_metrics)
+            return strip_triage(result[0]), result[1]
+
+        run.escalations[reason] += 1
+        self._record_request(run, job, triage_metrics)
+        print(f"    {cascade.model} 的评阅{reason}，交给 {self.model} 重新评阅")
+        metrics["model"] = self.model
+        return await self.aget_feedback_from_qwen(
+            run.pool, job.prompt.problem, job.assignment.data, live_path=live_path,
+            metrics=metrics, check_report=check_report
+        )
+
+    def _enqueue_jobs(self, run: GradingRun, jobs: List[GradingJob], tasks: List[asyncio.Task]):
+        """
+        为同一题目的任务创建 asyncio 任务。pack_size > 1 时把代码较短的提交每 pack_size 份打成一个包，
+        重复提交仍只评阅组内第一份，其余等待其结果。同一题目的任务可能分多次入队，
+        之前入队的同组任务已登记 leader 时，本次的重复提交直接等待其结果。
+        """
+        if self.pack_size <= 1:
+            for job in jobs:
+                tasks.append(asyncio.create_task(self._schedule_job(run, len(tasks) + 1, job)))
+            return
+
+        loop = asyncio.get_running_loop()
+        pack: List[GradingJob] = []
+        seen = set()
+
+        def flush():
+            if pack:
+                tasks.append(asyncio.create_task(self._schedule_pack(run, len(tasks) + 1, list(pack))))
+                pack.clear()
+
+        for job in jobs:
+            if self.dedup and (job.dedup_key in seen or job.dedup_key in run.leaders):
+                tasks.append(asyncio.create_task(self._schedule_job(run, len(tasks) + 1, job)))
+                continue
+            seen.add(job.dedup_key)
+            # 增量评阅的任务单独发送
+            if job.previous is not None or estimate_tokens(job.assignment.data) > self.pack_max_code_tokens:
+                tasks.append(asyncio.create_task(self._schedule_job(run, len(tasks) + 1, job)))
+                continue
+            if self.dedup:
+                # 入包时就登记 leader，使之后入队的重复提交等待这个包的结果
+                run.leaders[job.dedup_key] = loop.create_future()
+            pack.append(job)
+            if len(pack) >= self.pack_size:
+                flush()
+        flush()
+
+    async def _schedule_pack(self, run: GradingRun, job_idx: int, jobs: List[GradingJob]):
+        """执行一个打包任务，并把每份提交的结果交给等待它的重复提交。"""
+        results = None
+        try:
+            if len(jobs) == 1:
+                results = [await self._run_job(run, job_idx, jobs[0])]
+            else:
+                results = await self._run_pack(run, job_idx, jobs)
+        finally:
+            if self.dedup:
+                for i, job in enumerate(jobs):
+                    run.leaders[job.dedup_key].set_result(results[i] if results else None)
+
+    async def _check_job(self, job: GradingJob) -> Optional[CheckResult]:
+        """未开启本地编译检查时返回 None。"""
+        if self.checker is None:
+            return None
+        with stages.timer("compile_check"):
+            return await self.checker.check(job.assignment.data, job.prompt.tests)
+
+    def _fast_path(self, run: GradingRun, job: GradingJob,
+                   check: Optional[CheckResult]) -> Optional[Tuple[str, str]]:
+        """
+        代码为空或无法编译时不调用模型，直接给出说明（分数为空代码 0 分，编译失败交由助教评定），由调用方写出。
+
+        :return: 走了快速路径时返回 (反馈文本, 建议分数)，否则返回 None
+        """
+        if check is None or not self.compile_fast_path:
+            return None
+        if check.empty:
+            feedback, score = "提交的代码为空，未进行模型评阅。\n\n建议分数：0/100", "0/100"
+        elif not check.compiled:
+            feedback = ("代码未能通过编译，未进行模型评阅。请根据以下编译器输出修正错误：\n\n"
+                        f"```\n{check.diagnostics}\n```")
+            score = self._extract_score_from_feedback("")
+        else:
+            return None
+        print(f"\n跳过模型评阅: {job.job_id}（{'代码为空' if check.empty else '编译失败'}）")
+        run.fast_path += 1
+        return feedback, score
+
+    async def _run_pack(self, run: GradingRun, job_idx: int,
+                        jobs: List[GradingJob]) -> List[Optional[Tuple[str, str]]]:
+        """
+        先对包内的提交做本地编译检查，走快速路径的提交单独处理，其余的打包评阅。
+
+        :return: 与 jobs 一一对应的 (反馈文本, 建议分数)，失败的任务为 None
+        """
+        checks = await asyncio.gather(*(self._check_job(job) for job in jobs))
+        results: List[Optional[Tuple[str, str]]] = [None] * len(jobs)
+        remaining = []
+        for i, (job, check) in enumerate(zip(jobs, checks)):
+            fast = self._fast_path(run, job, check)
+            if fast is not None:
+                await self._afinish_job(job, *fast)
+                results[i] = fast
+            else:
+                remaining.append(i)
+        if len(remaining) == 1:
+            results[remaining[0]] = await self._run_job(run, job_idx, jobs[remaining[0]])
+        elif remaining:
+            reports = [checks[i].report() if checks[i] is not None else None for i in remaining]
+            packed = await self._run_pack_request(run, job_idx, [jobs[i] for i in remaining], reports)
+            for i, result in zip(remaining, packed):
+                results[i] = result
+        return results
+
+    async def _run_pack_request(self, run: GradingRun, job_idx: int, jobs: List[GradingJob],
+                                check_reports: List[Optional[str]]) -> List[Optional[Tuple[str, str]]]:
+        """
+        用一个请求评阅多份提交，并把结果拆分写入各自的反馈文件。
+        返回内容校验失败时回退为逐份评阅；请求本身失败时所有任务标记为失败，下次运行时重试。
+
+        :return: 与 jobs 一一对应的 (反馈文本, 建议分数)，失败的任务为 None
+        """
+        ids = pack_ids(len(jobs))
+        request = self._build_pack_request(jobs[0].prompt.problem, [job.assignment.data for job in jobs],
+                                           check_reports=check_reports)
+        cache_key = content = usage = None
+        if self.cache is not None:
+            cache_key = ResponseCache.make_key(request)
+            cached = None if self.refresh_cache else self.cache.get(cache_key)
+            if cached is not None:
+                content = cached["content"]
+
+        metrics: Dict[str, Any] = {}
+        parsed = None
+        async with run.gate:
+            print(f"\n处理打包任务 [{job_idx}]: {jobs[0].prompt.original_filename} 共 {len(jobs)} 份提交 "
+                  f"({', '.join(str(job.student.student_id) for job in jobs)})")
+            for job in jobs:
+                self.manifest.mark_in_flight(job.job_id)
+            try:
+                if content is None:
+                    content, usage = await self._acomplete(run.pool, request, metrics=metrics)
+                with stages.timer("score"):
+                    parsed = parse_pack_response(content, ids)
+            except FeedbackError as e:
+                for job in jobs:
+                    self.manifest.mark_failed(job.job_id, str(e))
+                    if e.retryable:
+                        run.failed_jobs.append(job)
+                        run.retryable_keys.add(job.dedup_key)
+                return [None] * len(jobs)
+            except PackValidationError as e:
+                print(f"    打包结果校验失败（{e}），改为逐份评阅")
+
+        if parsed is None:
+            run.pack_fallbacks += 1
+            return list(await asyncio.gather(
+                *(self._run_job(run, job_idx, job) for job in jobs)
+            ))
+
+        if usage is not None:
+            self._store_cache(cache_key, content, usage)
+        if "latency" in metrics:
+            metrics["job_id"] = ",".join(job.job_id for job in jobs)
+            metrics["problem"] = jobs[0].prompt.original_filename
+            metrics["pack_size"] = len(jobs)
+            run.request_metrics.append(metrics)
+            self._append_usage_log(metrics)
+        run.packs += 1
+        run.packed_jobs += len(jobs)
+
+        # 结果库中每份提交记录平均分摊的 token 用量
+        share = {key: metrics[key] / len(jobs) for key in ("prompt_tokens", "completion_tokens", "cached_tokens")
+                 if key in metrics}
+        if "latency" in metrics:
+            share["latency"] = metrics["latency"]
+        results = []
+        for pack_id, job in zip(ids, jobs):
+            feedback, score = parsed[pack_id]
+            score = f"{score}/100"
+            if not _SCORE_LINE_RE.search(feedback):
+                feedback = f"{feedback}\n\n建议分数：{score}"
+            await self._afinish_job(job, feedback, score, share or None)
+            results.append((feedback, score))
+        return results
+
+    def process_all_submissions(self, limit: int = None, concurrency: int = None,
+                                members: Optional[Iterable[str]] = None) -> List[GradingJob]:
         """
         处理所有学生提交，生成反馈 MD 文件。
         
         :param limit: 处理的学生数限制（用于测试）。如果为 None，处理所有学生。
+        :param concurrency: 并发请求数，默认使用 self.concurrency。为 1 时逐个顺序处理。
+        :param members: 只处理这些 TXT 记录（见 iter_students），为 None 时处理全部。
+        :return: 本次运行结束时仍然失败、但稍后重试可能成功的任务（不可重试的失败不在其中）
         """
-        students = self.get_all_students()
-        print(f"找到 {len(students)} 个学生。")
-        
+        return asyncio.run(self.aprocess_all_submissions(limit=limit, concurrency=concurrency, members=members))
+
+    async def aprocess_all_submissions(self, limit: int = None, concurrency: int = None,
+                                       members: Optional[Iterable[str]] = None) -> List[GradingJob]:
+        """
+        process_all_submissions 的异步实现。
+
+        请求通过 ClientPool 在一个或多个接口之间路由，每个接口各自限流（RPM/TPM）、控制并发和熔断；
+        AdaptiveConcurrency 控制同时在途的任务总数。concurrency=1 时任务严格按顺序执行。
+
+        :param limit: 处理的学生数限制（用于测试）。如果为 None，处理所有学生。
+        :param concurrency: 并发请求数，默认使用 self.concurrency。
+        :param members: 只处理这些 TXT 记录（见 iter_students），为 None 时处理全部。
+        """
+        concurrency = max(1, concurrency or self.concurrency)
         if limit:
-            students = students[:limit]
             print(f"限制处理到前 {limit} 个学生。")
+        print(f"并发数: {concurrency}")
+
+        gate = AdaptiveConcurrency(max_limit=concurrency)
+        self.registry.reset_stats()
+        stages.reset()
+        self._ensure_checker()
+
+        pool = self._client_pool(concurrency)
+        async with pool:
+            run = GradingRun(pool=pool, gate=gate)
+
+            # 学生边加载边入队，不必等整个目录加载完才开始调用模型；
+            # group_by_problem 时先按题目分组，每组攒够 flush_size 个任务就入队，使同一题目的请求连续发出，
+            # 加载结束后再把各组剩余的任务入队
+            tasks = []
+            by_problem: Dict[str, List[GradingJob]] = defaultdict(list)
+            # 打包时按 pack_size 的整数倍入队，避免每组末尾出现凑不满的包
+            flush_size = -(-max(1, self.group_flush_size) // self.pack_size) * self.pack_size
+            student_count = 0
+            skipped = 0
+            async for student in self._aiter_students(limit, members):
+                student_count += 1
+                jobs = self._collect_jobs([student])
+                if self.dedup:
+                    self._index_similarity(run, jobs)
+                pending = self._pending_jobs(jobs)
+                skipped += len(jobs) - len(pending)
+                for job in pending:
+                    # 打包需要同一题目的多份提交，因此总是按题目分组
+                    if self.group_by_problem or self.pack_size > 1:
+                        group = by_problem[job.prompt.original_filename]
+                        group.append(job)
+                        if len(group) >= flush_size:
+                            self._enqueue_jobs(run, group, tasks)
+                            group.clear()
+                    else:
+                        tasks.append(asyncio.create_task(self._schedule_job(run, len(tasks) + 1, job)))
+            for jobs in by_problem.values():
+                self._enqueue_jobs(run, jobs, tasks)
+            print(f"找到 {student_count} 个学生，共 {len(tasks)} 个评阅任务。")
+            print(self.registry.summary())
+            if skipped:
+                print(f"跳过 {skipped} 个已完成的任务（续跑）。")
+            await asyncio.gather(*tasks)
+
+            for round_idx in range(self.requeue_failed):
+                if not run.failed_jobs:
+                    break
+                retry_jobs, run.failed_jobs = run.failed_jobs, []
+                run.leaders.clear()
+                run.retryable_keys.clear()
+                print(f"\n重新排队 {len(retry_jobs)} 个失败的任务（第 {round_idx + 1} 轮）")
+                await asyncio.gather(*(
+                    self._schedule_job(run, job_idx + 1, job) for job_idx, job in enumerate(retry_jobs)
+                ))
+
+        if self.checker is not None:
+            self.checker.close()
+            stats = self.checker.stats
+            print(f"\n本地编译检查: 编译测试 {stats['checked']} 份，缓存命中 {stats['cached']} 份，"
+                  f"{run.fast_path} 份因代码为空或无法编译未调用模型")
+        if self.dedup:
+            print(f"\n重复提交: {run.fanned_out} 个任务复用了同组的评阅结果，未单独调用 API")
+            self._write_similarity_report(run)
+        if self.cascade is not None:
+            escalated = sum(run.escalations.values())
+            reasons = "，".join(f"{reason} {count}" for reason, count in run.escalations.items())
+            print(f"\n分级评阅: {run.cascade_accepted} 份直接采用 {self.cascade.model} 的结果，"
+                  f"{escalated} 份交给 {self.model} 重新评阅" + (f"（{reasons}）" if reasons else ""))
+        if run.diff_regrades or run.unchanged_resubmissions:
+            print(f"\n增量评阅: {run.diff_regrades} 份重新提交只发送了与上一版的差异，"
+                  f"{run.unchanged_resubmissions} 份代码没有实质变化、沿用了上一次的结果")
+        if self.pack_size > 1:
+            print(f"\n打包评阅: {run.packs} 个请求评阅了 {run.packed_jobs} 份提交，"
+                  f"{run.pack_fallbacks} 个包校验失败后改为逐份评阅")
+        if run.request_metrics:
+            self._print_latency_summary(run.request_metrics)
+            self._print_usage_summary(run.request_metrics)
+        if len(pool) > 1:
+            print("\n接口统计:")
+            for entry in pool.summary():
+                errors = "，".join(f"{kind} {count}" for kind, count in entry["errors"].items()) or "无"
+                latency = f"{entry['latency']:.2f}s" if entry["latency"] is not None else "-"
+                print(f"  {entry['name']}: {entry['requests']} 个请求，错误 {errors}，"
+                      f"并发上限 {entry['limit']}，熔断器 {entry['breaker']}，平均延迟 {latency}")
+
+        if self.cache is not None:
+            self.cache.evict()
+            stats = self.cache.stats()
+            print(f"\n缓存统计: 命中 {stats['hits']}，未命中 {stats['misses']}，"
+                  f"写入 {stats['writes']}，共 {stats['entries']} 条 ({stats['bytes'] / 1024:.1f} KB)")
         
-        for student_idx, student in enumerate(students):
-            if(student_idx==2):
-                break
-            print(f"\n处理学生 [{student_idx+1}/{len(students)}]: {student.name} ({student.student_id})")
-            
-            for homework_idx, assignment in enumerate(student.homeworks):
-                print(f"  处理作业 {homework_idx+1}: {assignment.orig_name}")
-                
-                # 匹配 prompt
-                matched_prompt = match_file_to_prompt(assignment.orig_name, self.prompt_list)
-                if matched_prompt is None:
-                    print(f"    警告: 未找到匹配的 prompt，跳过此文件。")
-                    continue
-                
-                # 调用 Qwen API 获取反馈
-                print(f"    正在调用 Qwen API 获取反馈...")
-                feedback, score = self.get_feedback_from_qwen(
-                    matched_prompt.problem,
-                    assignment.data
-                )
-                
-                # 生成 Markdown
-                md_content = self.generate_feedback_markdown(
-                    student, assignment, matched_prompt, feedback, score
-                )
-                
-                # 生成输出文件名
-                safe_student_id = re.sub(r'[\\/:*?"<>|]', '_', str(student.student_id or "unknown"))
-                safe_filename = re.sub(r'[\\/:*?"<>|]', '_', str(assignment.orig_name or "file"))
-                output_filename = f"{safe_student_id}_{safe_filename[:-2]}_feedback.md"
-                output_path = self.output_path / output_filename
-                
-                # 写入文件
-                try:
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        f.write(md_content)
-                    print(f"    已生成反馈文件: {output_filename} (分数: {score})")
-                except Exception as e:
-                    print(f"    错误: 无法写入文件 {output_path}: {e}")
-        
+        self.report_stages()
+
+        counts = self.manifest.counts()
+        print(f"\n任务状态: 已完成 {counts.get('done', 0)}，失败 {counts.get('failed', 0)}，"
+              f"未完成 {counts.get('pending', 0) + counts.get('in-flight', 0)}")
+        if counts.get('failed', 0):
+            print("失败的任务没有写入反馈文件，再次运行时会自动重试。")
         print(f"\n完成！反馈文件已保存到 {self.output_path}")
+        return run.failed_jobs
+
 
 # @dataclass
 # class QwenHelper:
     
 
 if __name__ == "__main__":
-    XMLPromptList: List[XMLPrompt] = []
-    XMLPromptList.append(XMLPrompt(
-        problem="""
-        Part I: Calculating the minimum, maximum, and average of a list of numbers
-        In this part of the assignment, you will write a program that finds the minimum, maximum and
-        average of a list of numbers, which can be quite useful, for example, after an exam when the
-        instructor provides the statistical results of the exam to students. The numbers are integers and
-        stored in an array whose size is fixed and defined by a constant called N, in the same way as in
-        the example on p. 164 of the text. Your program should prompt the user to input N numbers
-        and read them into an array with a for loop. In the second for loop, your program should
-        calculate the minimum, maximum and the average of the N numbers and print out the results
-        after exiting the second for loop. (You could do everything in one for loop, but for
-        simplicity, implement this program with two for loops.) Note that the average of N integers is
-        not necessarily an integer, and so you will have to print out the average with the %f format
-        specifier. Read p. 147 of the text to learn how to use the casting operation in C to generate a
-        float from an integer division. Submit the program as pa6p1.
-        """,
-        code="",
-        original_filename="pa3p1.c"
-        ))
-    XMLPromptList.append(XMLPrompt(
-        problem="""
-        Sorting is an important operation used in numerous computer algorithms. It refers to the
-        process of rearranging a set of numbers into ascending (or descending order). Many algorithms
-        exist to solve the sorting problem but bubble sort is perhaps the easiest to understand, although it
-        is not the most efficient. The pseudocode below defines how bubble sort works.
-        i = N;
-        sorted = false;
-        while ((i > 1) && (!sorted)) {
-        sorted = true;
-        for(j=1; j<i; j++) {
-        if(a[j-1] > a[j]) {
-        temp = a[j-1];
-        a[j-1] = a[j];
-        a[j] = temp;
-        sorted = false;
-        }
-        }
-        i--;
-        }
-        Based on the pseudocode above, write a program that implements bubble sort. As in Part I, your
-        program should prompt the user to input N integer values and store them in an integer array.
-        Then the program should proceed to sort the N numbers into the ascending (increasing) order by
-        following the algorithm in the pseudocode above. Finally, the program should print out the
-        sorted array of numbers. Once your program works, make sure that it is properly documented
-        and name it as pa6p2.c.
-        """,
-        code="",
-        original_filename="pa3p2.c"
-        ))
-    
-    main_loader = MainLoader()
-    main_loader.set_prompt_list(XMLPromptList)
+    import argparse
+    arg_parser = argparse.ArgumentParser(description="批量评阅学生 C 语言作业")
+    arg_parser.add_argument("--problems", type=Path, default=Path("./problems"), help="题目目录（包含 problems.json）")
+    arg_parser.add_argument("--concurrency", type=int, default=1, help="并发请求数（默认 1，顺序处理）")
+    arg_parser.add_argument("--no-cache", action="store_true", help="不读取也不写入响应缓存")
+    arg_parser.add_argument("--refresh", action="store_true", help="忽略已有缓存，重新请求并更新缓存")
+    arg_parser.add_argument("--no-resume", action="store_true", help="不跳过已完成的任务，全部重新评阅")
+    arg_parser.add_argument("--no-dedup", action="store_true", help="不合并重复提交，每份代码单独评阅")
+    arg_parser.add_argument("--stream", action="store_true", help="流式接收模型输出，实时写入输出目录下的 .live/ 并统计首 token 延迟")
+    arg_parser.add_argument("--pack-size", type=int, default=1, help="每个请求打包评阅的提交数（默认 1，不打包）")
+    arg_parser.add_argument("--compile-check", action="store_true",
+                            help="先用本机 gcc 编译并运行题目的测试用例，结果放进提示词（需要 gcc，不是安全沙箱）")
+    arg_parser.add_argument("--cascade-model", default=None,
+                            help="分级评阅：先用该小模型评阅，置信度低、分数低或需要复核的提交再交给 qwen3-max")
+    arg_parser.add_argument("--profile", default="",
+                            help="用 cProfile 剖析的阶段，逗号分隔（parse_txt,read_source,build_prompt,score,write）")
+    arg_parser.add_argument("--export-grades", action="store_true",
+                            help="不评阅，只从结果库导出 Blackboard 成绩上传 CSV 和分数汇总")
+    arg_parser.add_argument("--estimate", action="store_true", help="只估算本次运行的 token 用量和费用，不调用 API")
+    arg_parser.add_argument("--batch", action="store_true", help="使用 Batch API 离线批量评阅（更便宜，但需要等待）")
+    arg_parser.add_argument("--batch-poll-interval", type=float, default=60.0, help="批处理模式下轮询状态的间隔（秒）")
+    arg_parser.add_argument("--watch", action="store_true",
+                            help="持续监视当前目录下的 gradebook 导出，只评阅新增或变化的提交（Ctrl+C 退出）")
+    arg_parser.add_argument("--watch-interval", type=float, default=10.0,
+                            help="监视模式下没有 inotify 时的轮询间隔（秒）")
+    arg_parser.add_argument("--endpoints", type=Path, default=None,
+                            help="接口列表 JSON（多个 base_url / API Key，见 client_pool.load_endpoints），请求在它们之间路由")
+    arg_parser.add_argument("--routing", choices=["least_loaded", "weighted"], default="least_loaded",
+                            help="多个接口时的路由策略")
+    arg_parser.add_argument("--max-connections", type=int, default=100, help="每个接口的 HTTP 连接数上限")
+    arg_parser.add_argument("--http2", action="store_true", help="使用 HTTP/2（需要安装 h2）")
+    arg_parser.add_argument("--all-attempts", action="store_true",
+                            help="评阅每名学生的每一次提交（默认只评阅最新的一次），反馈文件名中带有提交时间")
+    arg_parser.add_argument("--no-diff-regrade", action="store_true",
+                            help="重新提交时总是完整评阅，不只发送与上一版的差异")
+    arg_parser.add_argument("--enqueue", action="store_true",
+                            help="不评阅，只把待评阅任务加入任务队列，由 --worker 进程消费")
+    arg_parser.add_argument("--worker", action="store_true",
+                            help="作为队列工作进程运行：领取任务并评阅，直到队列为空（可在多个进程或机器上同时运行）")
+    arg_parser.add_argument("--queue", type=Path, default=None,
+                            help="任务队列文件（默认为输出目录下的 .queue.sqlite3；查看状态: python work_queue.py status 文件）")
+    arg_parser.add_argument("--queue-shared", action="store_true",
+                            help="队列文件位于多台机器共享的网络文件系统上（不使用 WAL）")
+    arg_parser.add_argument("--lease-ttl", type=float, default=120.0,
+                            help="任务租约的有效期（秒），工作进程失联超过该时间后任务被其他进程回收")
+    args = arg_parser.parse_args()
+
+    main_loader = MainLoader(
+        problems_path=args.problems,
+        concurrency=args.concurrency,
+        use_cache=not args.no_cache,
+        refresh_cache=args.refresh,
+        resume=not args.no_resume,
+        dedup=not args.no_dedup,
+        stream=args.stream,
+        pack_size=args.pack_size,
+        compile_check=args.compile_check,
+        cascade=CascadeConfig(model=args.cascade_model) if args.cascade_model else None,
+        profile_stages=tuple(stage.strip() for stage in args.profile.split(",") if stage.strip()),
+        endpoints=load_endpoints(args.endpoints) if args.endpoints else [],
+        routing=args.routing,
+        http=HTTPConfig(max_connections=args.max_connections, http2=args.http2),
+        attempts=ALL_ATTEMPTS if args.all_attempts else LATEST_ATTEMPT,
+        diff_regrade=not args.no_diff_regrade
+    )
     
     # 处理所有学生提交并生成反馈
-    main_loader.process_all_submissions()
\ No newline at end of file
+    if args.export_grades:
+        main_loader.export_grades()
+    elif args.estimate:
+        main_loader.print_estimate(main_loader.estimate_run(main_loader.collect_pending_jobs()))
+    elif args.batch:
+        from batch_mode import BatchGrader
+        BatchGrader(main_loader, poll_interval=args.batch_poll_interval).run()
+    elif args.watch:
+        from watch_mode import GradebookWatcher
+        GradebookWatcher(main_loader, root=Path("."), interval=args.watch_interval).run()
+    elif args.enqueue or args.worker:
+        from work_queue import QueueWorker, WorkQueue, enqueue_pending
+        queue = WorkQueue(args.queue or main_loader.output_path / ".queue.sqlite3", shared=args.queue_shared)
+        if args.enqueue:
+            enqueue_pending(main_loader, queue)
+        if args.worker:
+            QueueWorker(main_loader, queue, lease_ttl=args.lease_ttl).run()
+    else:
+        main_loader.process_all_submissions()
\ No newline at end of file
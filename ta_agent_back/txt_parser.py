@@ -0,0 +1,226 @@
+"""
+Blackboard 提交记录（"Key: Value" 格式的 TXT）的解析引擎。
+
+整个文件读入后一次扫描完成：用一个匹配 Key 行开头的预编译正则 split 整段文本，
+直接得到交替出现的 Key 和值（模式以换行符开头，正则引擎可以直接跳到各个换行处，
+而不是在每个字符上尝试匹配）。单行的值直接 strip，多行的值逐行 strip 后拼接，
+Files: 块先用一个 findall 取出成对的文件行，只有格式不完整时才逐行配对，
+解析为 (原始文件名, 文件名) 列表。
+
+格式问题不打印，而是以 ParseIssue 的形式返回给调用方；只有出现问题时才计算行号。
+parse_paths 在进程池中批量解析整个目录，供大批量导入和基准测试使用。
+"""
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+# ParseIssue.code
+READ_ERROR = "read_error"
+DECODE_ERROR = "decode_error"
+NO_FIELDS = "no_fields"
+MISSING_KEY = "missing_key"
+DUPLICATE_KEY = "duplicate_key"
+BAD_FILE_BLOCK = "bad_file_block"
+BAD_NAME = "bad_name"
+# 出现这些问题时无法得到任何字段
+FATAL_CODES = {READ_ERROR, DECODE_ERROR}
+
+# Files: 块中成对出现的两行
+ORIGINAL_FILENAME = "Original filename"
+FILENAME = "Filename"
+
+# 格式完整的文件块：两行紧挨着出现；以字面量开头，正则引擎可以快速定位
+_FILE_PAIR_RE = re.compile(r"Original filename[^\S\n]*:([^\n]*)\n[^\S\n]*Filename[^\S\n]*:([^\n]*)")
+
+# 没有给出 Key 列表时沿用旧的规则：不以制表符或 4 个空格开头、且含有冒号的行是 Key 行
+_GENERIC_KEY_RE = re.compile(r"\n(?!\t| {4})([^:\n]+):")
+
+R = TypeVar("R")
+
+
+@dataclass(slots=True)
+class ParseIssue:
+    """
+    解析一条记录时发现的问题。
+
+    :param code: 问题类型，见本模块的常量
+    :param message: 说明
+    :param line: 所在行号（从 1 开始），无法定位时为 None
+    """
+    code: str
+    message: str
+    line: Optional[int] = None
+
+    @property
+    def fatal(self) -> bool:
+        return self.code in FATAL_CODES
+
+    def __str__(self) -> str:
+        return f"第 {self.line} 行: {self.message}" if self.line is not None else self.message
+
+
+@dataclass(slots=True)
+class ParsedRecord:
+    """
+    :param fields: Key -> 值；Files: 的值为 [(原始文件名, 文件名), ...]
+    :param issues: 解析过程中发现的问题
+    """
+    fields: Dict[str, Any] = field(default_factory=dict)
+    issues: List[ParseIssue] = field(default_factory=list)
+
+    @property
+    def fatal(self) -> Optional[ParseIssue]:
+        return next((issue for issue in self.issues if issue.fatal), None)
+
+
+class RecordParseError(ValueError):
+    """记录无法读取或解码（load_from_txt 等单条接口使用）。"""
+
+    def __init__(self, issue: ParseIssue):
+        super().__init__(str(issue))
+        self.issue = issue
+
+
+def _file_line(line: str) -> Optional[Tuple[str, str]]:
+    """Files: 块中的一行，是 "Original filename: ..." 或 "Filename: ..." 时返回 (标签, 值)。"""
+    label, sep, name = line.partition(":")
+    if sep:
+        label = label.strip()
+        if label == ORIGINAL_FILENAME or label == FILENAME:
+            return label, name.strip()
+    return None
+
+
+class RecordParser:
+    """
+    :param keys: 记录中的 Key；给出时只有以这些 Key 开头的行才开始新的字段，
+        提交文本或评论中形如 "Note: ..." 的行不会被误认为 Key。为 None 时任何含冒号的非缩进行都是 Key
+    :param files_key: 值为文件块列表的 Key，为 None 时按普通文本处理
+    """
+
+    def __init__(self, keys: Optional[Iterable[str]] = None, files_key: Optional[str] = "Files"):
+        self.keys = tuple(keys) if keys is not None else None
+        self.files_key = files_key
+        if self.keys:
+            alternatives = "|".join(re.escape(key) for key in sorted(self.keys, key=len, reverse=True))
+            self._key_re = re.compile(rf"\n({alternatives})[^\S\n]*:")
+        else:
+            self._key_re = _GENERIC_KEY_RE
+
+    def parse(self, text: str) -> ParsedRecord:
+        """解析一条记录的完整内容。"""
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        # 补一个换行符使第一行也能匹配；split 的结果为 [第一个 Key 之前的内容, Key, 值, Key, 值, ...]
+        text = "\n" + text
+        parts = self._key_re.split(text)
+        fields: Dict[str, Any] = {}
+        issues: List[ParseIssue] = []
+        if len(parts) == 1:
+            issues.append(ParseIssue(NO_FIELDS, "未找到任何 Key: Value 字段"))
+            return ParsedRecord(fields, issues)
+        strip_keys = self.keys is None
+        for key, value in zip(parts[1::2], parts[2::2]):
+            if strip_keys:
+                key = key.strip()
+            if key in fields:
+                issues.append(ParseIssue(DUPLICATE_KEY, f"字段 '{key}' 重复出现，使用最后一次的值"))
+            if key == self.files_key:
+                fields[key] = self._parse_files(value, issues)
+            else:
+                value = value.strip()
+                if "\n" in value:
+                    value = "\n".join([line.strip() for line in value.split("\n")])
+                fields[key] = value
+        if issues:
+            self._locate(text, issues)
+        return ParsedRecord(fields, issues)
+
+    def parse_file(self, path, encoding: str = 'utf-8') -> ParsedRecord:
+        """读取并解析一个 TXT 文件；读取或解码失败时返回带致命问题的空记录，不抛出异常。"""
+        try:
+            with open(path, mode='r', encoding=encoding) as f:
+                text = f.read()
+        except UnicodeDecodeError as e:
+            return ParsedRecord(issues=[ParseIssue(DECODE_ERROR, f"无法按 {encoding} 解码: {e}")])
+        except OSError as e:
+            return ParsedRecord(issues=[ParseIssue(READ_ERROR, f"无法读取文件: {e}")])
+        return self.parse(text)
+
+    @staticmethod
+    def _pair_files(lines: Iterable[Tuple[str, str, Any]], on_error: Callable[[str, Any], None]) -> List[Tuple[str, str]]:
+        """
+        把 (标签, 值, 位置) 按 Original filename / Filename 两两配对，配不上的行交给 on_error(说明, 位置)。
+        """
+        files = []
+        original = None
+        for label, name, where in lines:
+            if label == ORIGINAL_FILENAME:
+                if original is not None:
+                    on_error(f"文件 '{original[0]}' 缺少 Filename 行", original[1])
+                original = (name, where)
+            elif original is None:
+                on_error(f"文件名 '{name}' 之前缺少 Original filename 行", where)
+            else:
+                files.append((original[0], name))
+                original = None
+        if original is not None:
+            on_error(f"文件 '{original[0]}' 缺少 Filename 行", original[1])
+        return files
+
+    def _parse_files(self, value: str, issues: List[ParseIssue]) -> List[Tuple[str, str]]:
+        """把 Files: 块解析为 [(原始文件名, 文件名), ...]。"""
+        pairs = _FILE_PAIR_RE.findall(value)
+        # 每个文件恰好有一行 Original filename 和一行 Filename 时直接采用，否则逐行配对并报告问题
+        if value.count("ilename") == 2 * len(pairs):
+            return [(original.strip(), name.strip()) for original, name in pairs]
+        lines = []
+        for line in value.split("\n"):
+            entry = _file_line(line)
+            if entry is not None:
+                lines.append((*entry, None))
+        return self._pair_files(lines, lambda message, _: issues.append(ParseIssue(BAD_FILE_BLOCK, message)))
+
+    def _locate(self, text: str, issues: List[ParseIssue]):
+        """按行重新扫描一遍，为重复的 Key 和不完整的文件块补上行号（只在出现问题时调用）。"""
+        seen = set()
+        duplicate_lines = []
+        file_lines = []
+        current = None
+        # text 以补上的换行符开头，split 后下标恰好是从 1 开始的行号
+        for lineno, line in enumerate(text.split("\n")):
+            match = self._key_re.match("\n" + line) if lineno else None
+            if match is not None:
+                current = match.group(1).strip()
+                if current in seen:
+                    duplicate_lines.append(lineno)
+                seen.add(current)
+                if current == self.files_key:
+                    file_lines = []
+                line = line[match.end() - 1:]
+            if current == self.files_key:
+                entry = _file_line(line)
+                if entry is not None:
+                    file_lines.append((*entry, lineno))
+        bad_lines = []
+        self._pair_files(file_lines, lambda _, lineno: bad_lines.append(lineno))
+        duplicates, bad = iter(duplicate_lines), iter(bad_lines)
+        for issue in issues:
+            if issue.code == DUPLICATE_KEY:
+                issue.line = next(duplicates, None)
+            elif issue.code == BAD_FILE_BLOCK:
+                issue.line = next(bad, None)
+
+
+def parse_paths(load: Callable[[Path], R], paths: Iterable[Path], max_workers: Optional[int] = None,
+                chunksize: int = 64) -> Iterator[R]:
+    """
+    在进程池中对每个路径调用 load，按输入顺序产出结果。
+
+    :param load: 可被 pickle 的函数（模块级函数或类方法），结果也必须能被 pickle
+    :param chunksize: 每次发给工作进程的路径数，越大进程间通信开销越小
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        yield from pool.map(load, paths, chunksize=chunksize)
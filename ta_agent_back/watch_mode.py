@@ -0,0 +1,302 @@
+"""
+监视模式：常驻运行，在迟交的提交或新的 gradebook 导出出现时增量评阅。
+
+每一轮扫描最新的导出（目录或 ZIP），为每条 TXT 记录计算一个内容摘要
+（记录本身及其提交文件；ZIP 直接使用中央目录中的 CRC，不需要解压），
+与已经评阅过的摘要比较，只把新增或变化的记录交给 MainLoader.process_all_submissions。
+同一学生的记录在新旧导出中同名，因此换成新的导出后，已经评阅过的提交不会重新评阅。
+反馈文件、清单、结果库和成绩导出文件都在每一轮结束后增量更新。
+
+Linux 上用 inotify（通过 ctypes 调用 libc，不需要额外依赖）等待目录变化，
+其他平台或 inotify 不可用时按固定间隔轮询。目录变化后先等待一段时间，
+直到两次扫描的结果相同（导出已经解压或复制完成）再开始评阅。
+
+已评阅的摘要保存在输出目录的 .watch_state.json 中，重启后不会重新加载未变化的记录；
+代码是否变化的最终判断仍由运行清单（按代码哈希续跑）负责。
+"""
+import bisect
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import time
+import zipfile
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+from gradebook_zip import GradebookZip
+from run_manifest import atomic_write_text
+
+if TYPE_CHECKING:
+    from tools import MainLoader
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+class Inotify:
+    """
+    inotify 的最小封装：只用来在目录变化时唤醒，具体变化由重新扫描得出。
+    不可用时构造函数抛出 OSError。
+    """
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("未找到 libc")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("当前系统不支持 inotify")
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self.watched: Set[Path] = set()
+
+    def watch(self, path: Path):
+        """监视一个目录（不递归），重复调用无副作用。"""
+        path = Path(path).resolve()
+        if path in self.watched:
+            return
+        if self._libc.inotify_add_watch(self.fd, os.fsencode(str(path)), WATCH_MASK) < 0:
+            raise OSError(ctypes.get_errno(), f"无法监视 {path}")
+        self.watched.add(path)
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        """
+        等待事件并丢弃已到达的所有事件。
+
+        :return: 超时前是否有事件
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _members_with_prefix(names: List[str], stem: str) -> List[str]:
+    """在排序后的 names 中找出以 '{stem}_' 开头的名字（Blackboard 的提交文件命名为 '{记录名}_{原始文件名}'）。"""
+    prefix = stem + "_"
+    start = bisect.bisect_left(names, prefix)
+    end = start
+    while end < len(names) and names[end].startswith(prefix):
+        end += 1
+    return names[start:end]
+
+
+def _directory_digests(path: Path, cache: Dict[str, Tuple[tuple, str]]) -> Dict[str, str]:
+    """
+    目录中每条 TXT 记录的内容摘要。
+
+    :param cache: 文件名 -> (文件状态, 摘要)，状态（大小、修改时间）没有变化的记录直接复用上次的摘要
+    """
+    stats = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file():
+                st = entry.stat()
+                stats[entry.name] = (st.st_size, st.st_mtime_ns)
+    names = sorted(stats)
+    digests = {}
+    for name in names:
+        if not name.lower().endswith(".txt"):
+            continue
+        related = [name] + _members_with_prefix(names, name[:-4])
+        state = tuple((member, stats[member]) for member in related)
+        cached = cache.get(name)
+        if cached is not None and cached[0] == state:
+            digests[name] = cached[1]
+            continue
+        digest = hashlib.sha256()
+        try:
+            for member in related:
+                digest.update(member.encode("utf-8") + b"\0" + (path / member).read_bytes() + b"\0")
+        except OSError:
+            # 文件在扫描过程中被删除或替换，下一轮再处理
+            continue
+        digests[name] = digest.hexdigest()
+        cache[name] = (state, digests[name])
+    for name in set(cache) - set(digests):
+        del cache[name]
+    return digests
+
+
+def _zip_digests(path: Path) -> Dict[str, str]:
+    """ZIP 中每条 TXT 记录的摘要，由中央目录中的成员名、大小和 CRC 计算，不需要解压。"""
+    with GradebookZip(path) as archive:
+        names = sorted(archive.members)
+        digests = {}
+        for name in archive.txt_members():
+            digest = hashlib.sha256()
+            for member in [name] + _members_with_prefix(names, name[:-4]):
+                info = archive.members[member]
+                digest.update(f"{member}\0{info.file_size}\0{info.CRC}\0".encode("utf-8"))
+            digests[name] = digest.hexdigest()
+    return digests
+
+
+class GradebookWatcher:
+    """
+    持续监视 gradebook，增量评阅新增或变化的提交。
+
+    :param loader: 已配置好题目和客户端的 MainLoader
+    :param root: 存放 gradebook 导出的目录；给出时总是跟随其中日期最新的导出，
+        为 None 时只监视 loader.files_path
+    :param interval: 轮询间隔（秒）；使用 inotify 时作为等待事件的超时，兼作兜底的轮询
+    :param settle: 发现变化后等待的时间（秒），两次扫描结果相同才开始评阅
+    :param retry_interval: 有可重试的任务失败时，隔多久重新处理这些任务所在的记录（秒）
+    :param use_inotify: 为 False 时总是轮询
+    """
+
+    def __init__(self, loader: "MainLoader", root: Optional[Path] = None, interval: float = 10.0,
+                 settle: float = 2.0, retry_interval: float = 300.0, use_inotify: bool = True):
+        self.loader = loader
+        self.root = Path(root) if root is not None else None
+        self.interval = interval
+        self.settle = settle
+        self.retry_interval = retry_interval
+        self.state_path = Path(loader.output_path) / ".watch_state.json"
+        # TXT 记录名 -> 已评阅的内容摘要
+        self.graded: Dict[str, str] = {}
+        # 已经发现但还没有全部成功评阅的记录
+        self.pending: Dict[str, str] = {}
+        self._stat_cache: Dict[str, Tuple[tuple, str]] = {}
+        self._inotify: Optional[Inotify] = None
+        if use_inotify:
+            try:
+                self._inotify = Inotify()
+            except OSError as e:
+                print(f"inotify 不可用（{e}），改为每 {interval:g} 秒轮询一次")
+        if self.state_path.exists():
+            self.graded = json.loads(self.state_path.read_text(encoding="utf-8")).get("graded", {})
+
+    def current_gradebook(self) -> Optional[Path]:
+        """当前应当评阅的导出；跟随 root 时为其中最新的导出。"""
+        if self.root is None:
+            return Path(self.loader.files_path)
+        from tools import find_latest_gradebook
+        return find_latest_gradebook(self.root)
+
+    def scan(self) -> Tuple[Optional[Path], Dict[str, str]]:
+        """
+        扫描当前导出。
+
+        :return: (导出路径, TXT 记录名 -> 内容摘要)；导出不存在或暂时无法读取（例如 ZIP 尚未复制完）时摘要为空
+        """
+        gradebook = self.current_gradebook()
+        if gradebook is None or not gradebook.exists():
+            return gradebook, {}
+        try:
+            if gradebook.is_dir():
+                return gradebook, _directory_digests(gradebook, self._stat_cache)
+            return gradebook, _zip_digests(gradebook)
+        except (OSError, ValueError, zipfile.BadZipFile) as e:
+            print(f"警告: 暂时无法扫描 {gradebook}: {e}")
+            return gradebook, {}
+
+    def changes(self, digests: Dict[str, str]) -> Dict[str, str]:
+        """尚未评阅或内容变化的记录。"""
+        return {name: digest for name, digest in digests.items() if self.graded.get(name) != digest}
+
+    def _watch_paths(self, gradebook: Optional[Path]):
+        if self._inotify is None:
+            return
+        paths = [self.root] if self.root is not None else []
+        if gradebook is not None and gradebook.is_dir():
+            paths.append(gradebook)
+        elif gradebook is not None:
+            paths.append(gradebook.parent)
+        for path in paths:
+            try:
+                self._inotify.watch(path)
+            except OSError as e:
+                print(f"警告: {e}")
+
+    def _wait(self, timeout: float):
+        if self._inotify is not None:
+            self._inotify.wait(timeout)
+        else:
+            time.sleep(timeout)
+
+    def _stable_scan(self) -> Tuple[Optional[Path], Dict[str, str]]:
+        """扫描直到连续两次结果相同，避免评阅正在解压或复制的导出。"""
+        gradebook, digests = self.scan()
+        while self.changes(digests):
+            time.sleep(self.settle)
+            again = self.scan()
+            if again == (gradebook, digests):
+                break
+            gradebook, digests = again
+        return gradebook, digests
+
+    def _save_state(self):
+        atomic_write_text(self.state_path, json.dumps({"graded": self.graded}, ensure_ascii=False))
+
+    def run_once(self) -> int:
+        """
+        扫描一次并评阅新增或变化的记录。
+
+        :return: 本轮交给评阅流程的记录数
+        """
+        gradebook, digests = self._stable_scan()
+        self._watch_paths(gradebook)
+        self.pending.update(self.changes(digests))
+        # 从当前导出中消失的记录不再处理
+        self.pending = {name: digest for name, digest in self.pending.items() if digests.get(name) == digest}
+        if not self.pending:
+            return 0
+        loader = self.loader
+        if gradebook != Path(loader.files_path):
+            print(f"\n切换到最新的导出: {gradebook}")
+            loader.files_path = gradebook
+        batch = sorted(self.pending)
+        print(f"\n[{time.strftime('%H:%M:%S')}] 发现 {len(batch)} 条新增或变化的提交记录，开始评阅")
+        failed = loader.process_all_submissions(members=batch)
+        loader.export_grades()
+        # 只有本轮可重试的失败（限流、服务端错误等）才重试；不可重试的失败要等记录再次变化
+        retry = {job.student.record_name for job in failed}
+        self.graded.update({name: digest for name, digest in self.pending.items() if name not in retry})
+        self.pending = {name: digest for name, digest in self.pending.items() if name in retry}
+        self._save_state()
+        if self.pending:
+            print(f"{len(self.pending)} 条记录中有可重试的失败任务，{self.retry_interval:g} 秒后重试这些记录")
+        return len(batch)
+
+    def run(self, max_rounds: Optional[int] = None):
+        """
+        持续监视，直到 Ctrl+C（或执行 max_rounds 轮之后）。
+
+        :param max_rounds: 最多扫描的轮数，None 表示不限
+        """
+        mode = "inotify" if self._inotify is not None else f"每 {self.interval:g} 秒轮询"
+        target = self.root if self.root is not None else self.loader.files_path
+        print(f"监视模式（{mode}）: {target}，结果写入 {self.loader.output_path}")
+        rounds = 0
+        try:
+            while max_rounds is None or rounds < max_rounds:
+                self.run_once()
+                rounds += 1
+                if max_rounds is not None and rounds >= max_rounds:
+                    break
+                self._wait(self.retry_interval if self.pending else self.interval)
+        except KeyboardInterrupt:
+            print("\n已停止监视。")
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
@@ -0,0 +1,565 @@
+"""
+持久化的评阅任务队列，供多个工作进程（同一台机器或共享队列文件的多台机器）共同消费。
+
+enqueue_pending 把 学生 × 作业文件 × 匹配的题目 展开为任务，写入 SQLite 队列；
+QueueWorker 循环领取任务（租约），用 MainLoader 的评阅流程评阅后提交结果：
+
+- 租约：领取时为任务生成新的 lease_token，并设置 lease_expires = 现在 + lease_ttl。
+  工作进程定期心跳延长自己持有的所有租约；进程崩溃或失联后租约过期，
+  下一次任何工作进程领取任务时自动回收（重新排队，超过 max_attempts 次则标记失败）；
+- 恰好一次：提交是 UPDATE ... WHERE lease_token = 领取时的令牌，只有一个工作进程能成功。
+  提交在写出反馈文件之前进行（见 MainLoader._afinish_job），租约已被接管的工作进程丢弃自己的结果，
+  反馈文本同时保存在队列中，提交后写文件失败也不会丢失结果；
+- 可重试的失败（限流、服务端错误等）按次数退避后重新排队，不可重试的直接标记失败。
+
+同一台机器上可以使用 WAL；多台机器共享网络文件系统上的队列文件时必须关闭 WAL（shared=True），
+并且该文件系统要正确支持文件锁。
+
+    python work_queue.py status feedback_output/.queue.sqlite3
+
+查看队列深度和各工作进程的吞吐量。
+"""
+import asyncio
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+from gradebook_zip import GradebookZip
+from rate_limit import AdaptiveConcurrency
+
+if TYPE_CHECKING:
+    from tools import GradingJob, GradingRun, MainLoader, Student
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass
+class QueuedJob:
+    """入队时的任务描述：工作进程据此从 gradebook 中重新加载学生和源文件。"""
+    job_id: str
+    gradebook: str  # gradebook 目录或 ZIP 的绝对路径，所有工作进程上必须相同
+    record_name: str  # TXT 记录的文件名（ZIP 中为成员名）
+    orig_name: str
+    student_id: str
+    problem: str
+    code_hash: str
+
+
+@dataclass(eq=False)
+class Lease:
+    """工作进程领取到的一个任务。"""
+    queue: "WorkQueue"
+    job_id: str
+    token: str
+    gradebook: str
+    record_name: str
+    orig_name: str
+    attempts: int
+    committed: bool = False
+
+    def commit(self, score: str, output_file: str, feedback: str) -> bool:
+        """在队列中提交结果，见 WorkQueue.complete。"""
+        self.committed = self.queue.complete(self, score, output_file, feedback)
+        return self.committed
+
+
+class WorkQueue:
+    """
+    基于 SQLite 的任务队列。所有状态转换都在一个 BEGIN IMMEDIATE 事务中完成，多个进程可以同时使用。
+
+    :param path: 队列文件路径
+    :param max_attempts: 每个任务最多被领取的次数（包括租约过期），超过后标记为失败
+    :param retry_delay: 可重试的失败后，第 n 次重新排队前等待 retry_delay * n 秒
+    :param shared: 队列文件位于多台机器共享的网络文件系统上时为 True，使用回滚日志而不是 WAL
+    """
+
+    def __init__(self, path: Path, max_attempts: int = 3, retry_delay: float = 30.0, shared: bool = False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        # isolation_level=None：由下面的 _transaction 显式开始和结束事务
+        self._conn = sqlite3.connect(str(self.path), timeout=60.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute(f"PRAGMA journal_mode={'DELETE' if shared else 'WAL'}")
+        with self._transaction():
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    gradebook TEXT NOT NULL,
+                    record_name TEXT NOT NULL,
+                    orig_name TEXT NOT NULL,
+                    student_id TEXT,
+                    problem TEXT,
+                    code_hash TEXT,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    reclaims INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_token TEXT,
+                    lease_expires REAL,
+                    not_before REAL NOT NULL DEFAULT 0,
+                    enqueued_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    score TEXT,
+                    output_file TEXT,
+                    feedback TEXT,
+                    error TEXT
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, not_before)")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS workers (
+                    worker_id TEXT PRIMARY KEY,
+                    host TEXT,
+                    pid INTEGER,
+                    started_at REAL NOT NULL,
+                    heartbeat_at REAL NOT NULL,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+    # --- 入队 ---
+
+    def enqueue(self, jobs: Iterable[QueuedJob], redo: bool = False) -> int:
+        """
+        加入任务。代码未变化且在排队、租用中或已完成的任务保持不变，失败或代码变化的任务重新排队
+        （清除旧的租约令牌，正在评阅旧代码的工作进程将无法提交）。
+
+        :param redo: 为 True 时已完成的任务也重新排队
+        :return: 新加入或重新排队的任务数
+        """
+        now = time.time()
+        keep = (QUEUED, LEASED, LEASED if redo else DONE)
+        changed = 0
+        with self._lock, self._transaction():
+            for job in jobs:
+                cursor = self._conn.execute(
+                    """INSERT INTO jobs (job_id, gradebook, record_name, orig_name, student_id, problem,
+                                         code_hash, state, enqueued_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(job_id) DO UPDATE SET
+                           gradebook = excluded.gradebook,
+                           record_name = excluded.record_name,
+                           problem = excluded.problem,
+                           code_hash = excluded.code_hash,
+                           state = excluded.state,
+                           attempts = 0,
+                           lease_owner = NULL,
+                           lease_token = NULL,
+                           lease_expires = NULL,
+                           not_before = 0,
+                           enqueued_at = excluded.enqueued_at,
+                           error = NULL
+                       WHERE jobs.state NOT IN (?, ?, ?) OR jobs.code_hash IS NOT excluded.code_hash""",
+                    (job.job_id, job.gradebook, job.record_name, job.orig_name, job.student_id, job.problem,
+                     job.code_hash, QUEUED, now, *keep)
+                )
+                changed += cursor.rowcount
+        return changed
+
+    # --- 领取与提交 ---
+
+    def _reclaim_expired(self, now: float) -> int:
+        """把过期的租约重新排队（次数用完时标记失败），在调用方的事务中执行。保留令牌，原持有者在重新领取前仍可提交。"""
+        cursor = self._conn.execute(
+            """UPDATE jobs SET
+                   state = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                   error = CASE WHEN attempts >= ? THEN '租约多次过期' ELSE error END,
+                   reclaims = reclaims + 1,
+                   lease_expires = NULL
+               WHERE state = ? AND lease_expires < ?""",
+            (self.max_attempts, FAILED, QUEUED, self.max_attempts, LEASED, now)
+        )
+        return cursor.rowcount
+
+    def lease(self, worker_id: str, limit: int, ttl: float) -> List[Lease]:
+        """
+        领取最多 limit 个可执行的任务（按入队顺序），先回收已过期的租约。
+
+        :param ttl: 租约有效期（秒），期间需要调用 heartbeat 延长
+        """
+        if limit <= 0:
+            return []
+        now = time.time()
+        leases = []
+        with self._lock, self._transaction():
+            self._reclaim_expired(now)
+            rows = self._conn.execute(
+                """SELECT job_id, gradebook, record_name, orig_name, attempts FROM jobs
+                   WHERE state = ? AND not_before <= ? ORDER BY rowid LIMIT ?""",
+                (QUEUED, now, limit)
+            ).fetchall()
+            for job_id, gradebook, record_name, orig_name, attempts in rows:
+                token = uuid.uuid4().hex
+                self._conn.execute(
+                    """UPDATE jobs SET state = ?, lease_owner = ?, lease_token = ?, lease_expires = ?,
+                           attempts = attempts + 1, started_at = ? WHERE job_id = ?""",
+                    (LEASED, worker_id, token, now + ttl, now, job_id)
+                )
+                leases.append(Lease(self, job_id, token, gradebook, record_name, orig_name, attempts + 1))
+        return leases
+
+    def heartbeat(self, worker_id: str, ttl: float) -> int:
+        """
+        登记工作进程仍然存活，并把它持有的所有租约延长到 现在 + ttl。
+
+        :return: 延长的租约数
+        """
+        now = time.time()
+        host, _, pid = worker_id.rpartition(":")
+        with self._lock, self._transaction():
+            self._conn.execute(
+                """INSERT INTO workers (worker_id, host, pid, started_at, heartbeat_at) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at""",
+                (worker_id, host, int(pid) if pid.isdigit() else None, now, now)
+            )
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE state = ? AND lease_owner = ?",
+                (now + ttl, LEASED, worker_id)
+            )
+        return cursor.rowcount
+
+    def complete(self, lease: Lease, score: str, output_file: str, feedback: str) -> bool:
+        """
+        提交任务结果。只有令牌仍然有效（任务没有被其他工作进程重新领取，也没有因代码变化重新入队）
+        且尚未完成时才会成功。
+
+        :return: 是否提交成功
+        """
+        now = time.time()
+        with self._lock, self._transaction():
+            cursor = self._conn.execute(
+                """UPDATE jobs SET state = ?, finished_at = ?, score = ?, output_file = ?, feedback = ?,
+                       error = NULL, lease_expires = NULL
+                   WHERE job_id = ? AND lease_token = ? AND state != ?""",
+                (DONE, now, score, output_file, feedback, lease.job_id, lease.token, DONE)
+            )
+            committed = cursor.rowcount == 1
+            if committed:
+                self._count(lease, "done")
+        return committed
+
+    def fail(self, lease: Lease, error: str, retryable: bool = True) -> bool:
+        """
+        记录一次失败：可重试且次数未用完时退避后重新排队，否则标记失败。令牌已失效时什么也不做。
+
+        :return: 是否重新排队
+        """
+        now = time.time()
+        requeue = retryable and lease.attempts < self.max_attempts
+        with self._lock, self._transaction():
+            cursor = self._conn.execute(
+                """UPDATE jobs SET state = ?, error = ?, not_before = ?, finished_at = ?, lease_expires = NULL
+                   WHERE job_id = ? AND lease_token = ? AND state = ?""",
+                (QUEUED if requeue else FAILED, error, now + self.retry_delay * lease.attempts if requeue else 0,
+                 None if requeue else now, lease.job_id, lease.token, LEASED)
+            )
+            if cursor.rowcount:
+                self._count(lease, "failed")
+        return requeue and cursor.rowcount == 1
+
+    def _count(self, lease: Lease, column: str):
+        owner = self._conn.execute("SELECT lease_owner FROM jobs WHERE job_id = ?", (lease.job_id,)).fetchone()
+        if owner and owner[0]:
+            self._conn.execute(f"UPDATE workers SET {column} = {column} + 1 WHERE worker_id = ?", (owner[0],))
+
+    # --- 状态 ---
+
+    def remaining(self) -> int:
+        """尚未结束（排队或租用中）的任务数。"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state IN (?, ?)", (QUEUED, LEASED)
+            ).fetchone()[0]
+
+    def status(self, window: float = 300.0) -> Dict[str, Any]:
+        """
+        队列深度和吞吐量。
+
+        :param window: 统计最近吞吐量的时间窗口（秒）
+        :return: {"counts": 按状态的任务数, "expired": 已过期未回收的租约数, "waiting": 退避中的任务数,
+            "oldest_queued": 最早入队的排队任务已等待的秒数, "reclaims": 累计回收的租约数,
+            "throughput": 最近 window 秒内每分钟完成的任务数, "workers": [各工作进程的统计]}
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._conn
+            counts = dict(conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            expired = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ? AND lease_expires < ?",
+                                   (LEASED, now)).fetchone()[0]
+            waiting = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ? AND not_before > ?",
+                                   (QUEUED, now)).fetchone()[0]
+            oldest = conn.execute("SELECT MIN(enqueued_at) FROM jobs WHERE state = ?", (QUEUED,)).fetchone()[0]
+            reclaims = conn.execute("SELECT COALESCE(SUM(reclaims), 0) FROM jobs").fetchone()[0]
+            recent = dict(conn.execute(
+                "SELECT lease_owner, COUNT(*) FROM jobs WHERE state = ? AND finished_at >= ? GROUP BY lease_owner",
+                (DONE, now - window)
+            ).fetchall())
+            leased = dict(conn.execute(
+                "SELECT lease_owner, COUNT(*) FROM jobs WHERE state = ? GROUP BY lease_owner", (LEASED,)
+            ).fetchall())
+            workers = conn.execute(
+                "SELECT worker_id, started_at, heartbeat_at, done, failed FROM workers ORDER BY started_at"
+            ).fetchall()
+        return {
+            "counts": counts,
+            "expired": expired,
+            "waiting": waiting,
+            "oldest_queued": now - oldest if oldest is not None else None,
+            "reclaims": reclaims,
+            "throughput": sum(recent.values()) * 60.0 / window,
+            "workers": [{
+                "worker_id": worker_id,
+                "uptime": now - started_at,
+                "idle": now - heartbeat_at,
+                "leased": leased.get(worker_id, 0),
+                "done": done,
+                "failed": failed,
+                "throughput": recent.get(worker_id, 0) * 60.0 / window,
+            } for worker_id, started_at, heartbeat_at, done, failed in workers],
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT：开始时就取得写锁，其他进程在 busy timeout 内等待。"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def __enter__(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb):
+        self._conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+def format_status(status: Dict[str, Any], stale_after: float = 120.0) -> str:
+    """
+    把 WorkQueue.status 的结果格式化为文本。
+
+    :param stale_after: 心跳超过该秒数的工作进程显示为失联
+    """
+    counts = status["counts"]
+    lines = [f"队列: 排队 {counts.get(QUEUED, 0)}（其中退避等待 {status['waiting']}），"
+             f"租用中 {counts.get(LEASED, 0)}（已过期 {status['expired']}），"
+             f"完成 {counts.get(DONE, 0)}，失败 {counts.get(FAILED, 0)}"]
+    if status["oldest_queued"] is not None:
+        lines.append(f"最早的排队任务已等待 {status['oldest_queued']:.0f} 秒")
+    lines.append(f"累计回收过期租约 {status['reclaims']} 次，最近吞吐量 {status['throughput']:.1f} 个/分钟")
+    if status["workers"]:
+        lines.append("工作进程:")
+    for worker in status["workers"]:
+        state = "失联" if worker["idle"] > stale_after else "运行中"
+        lines.append(f"  {worker['worker_id']}: {state}（{worker['idle']:.0f} 秒前心跳），租用 {worker['leased']}，"
+                     f"完成 {worker['done']}，失败 {worker['failed']}，最近 {worker['throughput']:.1f} 个/分钟")
+    return "\n".join(lines)
+
+
+def enqueue_pending(loader: "MainLoader", queue: WorkQueue) -> int:
+    """
+    加载 loader.files_path 中的所有学生，把需要评阅的任务（按清单续跑的规则过滤）加入队列；
+    已在队列中完成且代码未变化的任务不会重新排队（loader.resume=False 时除外）。group_by_problem 时同一题目的任务连续入队，使各工作进程领取到的请求尽量命中前缀缓存。
+
+    :return: 新加入或重新排队的任务数
+    """
+    gradebook = str(Path(loader.files_path).resolve())
+    loader.registry.reset_stats()
+    jobs: List[QueuedJob] = []
+    for student in loader.iter_students():
+        for job in loader._pending_jobs(loader._collect_jobs([student])):
+            jobs.append(QueuedJob(job.job_id, gradebook, student.record_name, job.assignment.orig_name,
+                                  str(student.student_id), job.prompt.original_filename, job.code_hash))
+        for assignment in student.homeworks:
+            assignment.release()
+    print(loader.registry.summary())
+    if loader.group_by_problem:
+        jobs.sort(key=lambda job: job.problem)
+    added = queue.enqueue(jobs, redo=not loader.resume)
+    print(f"共 {len(jobs)} 个待评阅任务，{added} 个新加入或重新排队: {queue.path}")
+    return added
+
+
+class QueueWorker:
+    """
+    从队列领取任务并评阅，直到队列中没有排队或租用中的任务。
+
+    :param loader: 已配置好题目和客户端的 MainLoader，并发数、缓存、编译检查等设置都沿用它的
+    :param queue: 任务队列
+    :param worker_id: 工作进程标识，默认为 主机名:进程号
+    :param lease_ttl: 租约有效期（秒）；心跳每 lease_ttl / 3 秒延长一次，进程失联超过该时间后任务被回收
+    :param poll_interval: 没有可领取的任务（都在其他进程手中或在退避）时的轮询间隔（秒）
+    """
+
+    def __init__(self, loader: "MainLoader", queue: WorkQueue, worker_id: Optional[str] = None,
+                 lease_ttl: float = 120.0, poll_interval: float = 2.0):
+        self.loader = loader
+        self.queue = queue
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.completed = 0
+        self.failed = 0
+        self.discarded = 0
+        self._started = 0
+        self._archives: Dict[str, GradebookZip] = {}
+        # 已解析的 TXT 记录及其在途租约数；同一记录的多个文件同时在途时只解析一次，全部结束后释放
+        self._students: Dict[Tuple[str, str], Optional["Student"]] = {}
+        self._student_refs: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    def run(self):
+        asyncio.run(self.arun())
+
+    async def arun(self):
+        loader = self.loader
+        concurrency = max(1, loader.concurrency)
+        print(f"工作进程 {self.worker_id}: 并发数 {concurrency}，队列 {self.queue.path}")
+        loader._ensure_checker()
+        await asyncio.to_thread(self.queue.heartbeat, self.worker_id, self.lease_ttl)
+        pool = loader._client_pool(concurrency)
+        active = set()
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            async with pool:
+                from tools import GradingRun
+                run = GradingRun(pool=pool, gate=AdaptiveConcurrency(max_limit=concurrency))
+                while True:
+                    leases = await asyncio.to_thread(
+                        self.queue.lease, self.worker_id, concurrency - len(active), self.lease_ttl
+                    )
+                    for lease in leases:
+                        active.add(asyncio.create_task(self._grade(run, lease)))
+                    if not active:
+                        if not await asyncio.to_thread(self.queue.remaining):
+                            break
+                        await asyncio.sleep(self.poll_interval)
+                        continue
+                    done, active = await asyncio.wait(active, timeout=self.poll_interval,
+                                                      return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            heartbeat.cancel()
+            for task in active:
+                task.cancel()
+            for archive in self._archives.values():
+                archive.close()
+            if loader.checker is not None:
+                loader.checker.close()
+        print(f"\n工作进程 {self.worker_id} 结束: 完成 {self.completed}，失败 {self.failed}，"
+              f"丢弃 {self.discarded} 个已被其他进程接管的结果")
+        loader.report_stages()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await asyncio.to_thread(self.queue.heartbeat, self.worker_id, self.lease_ttl)
+            except sqlite3.Error as e:
+                print(f"警告: 心跳失败: {e}")
+
+    def _load_student(self, gradebook: str, record_name: str) -> Optional["Student"]:
+        """加载一条 TXT 记录（同一记录同时在途的多个文件只解析一次；源码在评阅时才读取）。"""
+        key = (gradebook, record_name)
+        if key not in self._students:
+            from tools import MainLoader
+            if GradebookZip.is_gradebook_zip(Path(gradebook)):
+                if gradebook not in self._archives:
+                    self._archives[gradebook] = GradebookZip(Path(gradebook))
+                student = MainLoader._load_student_from_zip(self._archives[gradebook], record_name, load_sources=False)
+            else:
+                student = MainLoader._load_student(Path(gradebook) / record_name, load_sources=False)
+            self._students[key] = student
+        return self._students[key]
+
+    def _materialize(self, lease: Lease) -> Optional["GradingJob"]:
+        """由租约重建 GradingJob；记录、文件或题目不存在时返回 None。"""
+        from tools import GradingJob
+        student = self._load_student(lease.gradebook, lease.record_name)
+        if student is None:
+            return None
+        assignment = next((hw for hw in student.homeworks if hw.orig_name == lease.orig_name), None)
+        prompt = self.loader.registry.match(lease.orig_name) if assignment is not None else None
+        if prompt is None:
+            return None
+        job = GradingJob(student=student, assignment=assignment, prompt=prompt, lease=lease)
+        if job.job_id != lease.job_id:
+            # 入队时评阅的是所有提交，任务 ID 中带有提交标签
+            student.attempt = student.attempt_label
+        # 任务可能由其他机器入队，在本机的清单中登记后再评阅
+        self.loader.manifest.register(job.job_id, str(student.student_id), lease.orig_name, job.code_hash)
+        self.loader._attach_previous(job)
+        return job
+
+    async def _grade(self, run: "GradingRun", lease: Lease):
+        """评阅一个租约。队列的事务可能等待其他进程释放锁，都在工作线程中执行。"""
+        loader = self.loader
+        key = (lease.gradebook, lease.record_name)
+        self._student_refs[key] += 1
+        try:
+            job = await asyncio.to_thread(self._materialize, lease)
+            if job is None:
+                self.failed += 1
+                await asyncio.to_thread(
+                    self.queue.fail, lease, f"无法从 {lease.record_name} 加载 {lease.orig_name} 或找不到匹配的题目",
+                    retryable=False
+                )
+                return
+            self._started += 1
+            result = await loader._run_job(run, self._started, job)
+        except Exception as e:
+            self.failed += 1
+            print(f"    错误: 评阅 {lease.job_id} 时出错: {e}")
+            await asyncio.to_thread(self.queue.fail, lease, str(e))
+            return
+        finally:
+            self._student_refs[key] -= 1
+            if not self._student_refs[key]:
+                del self._student_refs[key]
+                self._students.pop(key, None)
+        if lease.committed:
+            self.completed += 1
+        elif result is None:
+            # _run_job 把可重试的失败放进 run.failed_jobs，由队列负责重新排队
+            retryable = any(failed is job for failed in run.failed_jobs)
+            run.failed_jobs = [failed for failed in run.failed_jobs if failed is not job]
+            entry = loader.manifest.get(job.job_id) or {}
+            self.failed += 1
+            await asyncio.to_thread(self.queue.fail, lease, entry.get("error") or "评阅失败", retryable=retryable)
+        else:
+            self.discarded += 1
+
+
+if __name__ == "__main__":
+    import argparse
+    arg_parser = argparse.ArgumentParser(description="评阅任务队列")
+    arg_parser.add_argument("command", choices=["status"])
+    arg_parser.add_argument("queue", type=Path, nargs="?", default=Path("./feedback_output/.queue.sqlite3"),
+                            help="队列文件（默认 ./feedback_output/.queue.sqlite3）")
+    arg_parser.add_argument("--shared", action="store_true", help="队列文件位于多台机器共享的网络文件系统上")
+    arg_parser.add_argument("--window", type=float, default=300.0, help="统计吞吐量的时间窗口（秒）")
+    args = arg_parser.parse_args()
+    if not args.queue.exists():
+        raise SystemExit(f"队列文件不存在: {args.queue}")
+    print(format_status(WorkQueue(args.queue, shared=args.shared).status(window=args.window)))